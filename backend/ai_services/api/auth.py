@@ -1,18 +1,45 @@
 # backend/ai_services/api/auth.py
 from fastapi import HTTPException, Header, APIRouter, Depends
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Optional
+import asyncio
+import hashlib
 import logging
-from ..core.supabase_client import client
+import os
+import time
+import jwt
+from ..core.cache import TTLCache
+from ..core.supabase_client import get_client, get_async_client, SUPABASE_URL
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Verified tokens are cached until their exp claim, but never longer than
+# TOKEN_CACHE_MAX_TTL so that revoked sessions stop working quickly.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "60"))
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_MAX_TTL)
+_jwks_client = None
+
+# auth_user_id -> users.id practically never changes, so it is memoized for a
+# long time. Auth users without a usable profile are remembered briefly.
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "10000"))
+USER_ID_CACHE_TTL = float(os.getenv("USER_ID_CACHE_TTL", "3600"))
+USER_ID_NEGATIVE_TTL = float(os.getenv("USER_ID_NEGATIVE_TTL", "30"))
+
+user_id_cache = TTLCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+_NO_PROFILE = object()
+_user_id_inflight: Dict[str, asyncio.Future] = {}
+_user_db_stats = {"selects": 0, "inserts": 0}
+
 
 def register_user(name: str, email: str, password: str):
     """Registers a user via Supabase Auth and stores profile in users table."""
     try:
         # ✅ Pass a dictionary, not keyword args
-        res = client.auth.sign_up({
+        res = get_client().auth.sign_up({
             "email": email,
             "password": password
         })
@@ -34,7 +61,7 @@ def register_user(name: str, email: str, password: str):
         "name": name,
         "email": email
     }
-    result = client.table("users").insert(profile).execute()
+    result = get_client().table("users").insert(profile).execute()
 
     # Simple error checking without accessing specific attributes
     if str(result).lower().find('error') != -1 and hasattr(result, '__str__'):
@@ -45,7 +72,7 @@ def register_user(name: str, email: str, password: str):
 
 def login_user(email: str, password: str):
     try:
-        res = client.auth.sign_in_with_password({
+        res = get_client().auth.sign_in_with_password({
             "email": email,
             "password": password
         })
@@ -57,87 +84,176 @@ def login_user(email: str, password: str):
         raise HTTPException(status_code=400, detail=f"Login failed: {e}")
 
 
-def get_user_from_token(authorization: Optional[str] = Header(None)):
+def _get_jwks_client():
+    """Returns the (lazily created) JWKS client for the project's signing keys."""
+    global _jwks_client
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_keys=True, lifespan=600)
+    return _jwks_client
+
+
+def _token_ttl(token: str) -> float:
+    """Seconds left until the token's exp claim (signature is not checked here)."""
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return 0
+    exp = claims.get("exp")
+    if not exp:
+        return TOKEN_CACHE_MAX_TTL
+    return exp - time.time()
+
+
+def _verify_token_locally(token: str) -> Optional[dict]:
+    """Verifies a Supabase access token without a network round trip.
+
+    Returns None when the token cannot be checked locally (no secret configured,
+    unknown algorithm or JWKS unavailable) so the caller can fall back to Supabase.
+    Raises jwt.InvalidTokenError for tokens that are definitely invalid.
+    """
+    alg = jwt.get_unverified_header(token).get("alg")
+    try:
+        if alg == "HS256":
+            if not SUPABASE_JWT_SECRET:
+                return None
+            key = SUPABASE_JWT_SECRET
+        elif alg in ("RS256", "ES256"):
+            key = _get_jwks_client().get_signing_key_from_jwt(token).key
+        else:
+            return None
+    except jwt.PyJWKClientError as e:
+        logger.warning("JWKS lookup failed, falling back to Supabase: %s", e)
+        return None
+
+    claims = jwt.decode(token, key, algorithms=[alg], audience="authenticated", options={"require": ["exp", "sub"]})
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email"),
+        "role": claims.get("role"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+
+async def get_user_from_token(authorization: Optional[str] = Header(None)):
     """Verifies user token and returns user info."""
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 
     token = authorization.split(" ")[1]
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+
+    user = token_cache.get(cache_key)
+    if user is not None:
+        return user
 
     try:
-        # Use the Supabase client to verify the token
-        user_response = client.auth.get_user(token)
-        user = getattr(user_response, 'user', user_response.get('user') if isinstance(user_response, dict) else None) if user_response else None
+        # Local verification may fetch the JWKS over blocking HTTP on a cold cache
+        user = await run_in_threadpool(_verify_token_locally, token)
+        if user is None:
+            # Use the Supabase client to verify the token
+            user_response = await get_async_client().auth.get_user(token)
+            user = getattr(user_response, 'user', user_response.get('user') if isinstance(user_response, dict) else None) if user_response else None
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return user
     except Exception as e:
         logger.error("Token verification failed: %s", e)
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
+    token_cache.set(cache_key, user, ttl=_token_ttl(token))
+    return user
+
+
+async def _lookup_user_id(auth_user_id: str) -> Optional[str]:
+    """Returns the internal users.id for an auth user, or None if no profile exists."""
+    _user_db_stats["selects"] += 1
+    res = await get_async_client().table("users").select("id").eq("auth_user_id", auth_user_id).execute()
+    # Handle response data safely
+    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    user_data = data[0] if isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
+    return user_data.get("id") if isinstance(user_data, dict) else None
+
 
-def get_user_id_from_token(user = Depends(get_user_from_token)):
+async def _create_user_profile(auth_user_id: str, email: str) -> Optional[str]:
+    """Creates a profile for OAuth users (just-in-time creation) and returns its ID."""
+    profile = {
+        "auth_user_id": auth_user_id,
+        "email": email,
+        "name": email.split('@')[0]  # Use email prefix as name by default
+    }
+
+    try:
+        _user_db_stats["inserts"] += 1
+        insert_res = await get_async_client().table("users").insert(profile).execute()
+        insert_data = getattr(insert_res, 'data', insert_res.get('data') if isinstance(insert_res, dict) else None) if insert_res else None
+
+        if not insert_data:
+            logger.error("Failed to create user profile: No data returned from insert")
+            raise HTTPException(status_code=500, detail="Failed to create user profile")
+
+        # Use the newly created user's ID
+        user_data = insert_data[0] if isinstance(insert_data, list) and len(insert_data) > 0 else insert_data
+        user_id = user_data.get("id") if isinstance(user_data, dict) else None
+        logger.info(f"Created new user profile for OAuth user: {auth_user_id}, assigned ID: {user_id}")
+        return user_id
+    except Exception as insert_error:
+        logger.error(f"Error creating user profile: {str(insert_error)}")
+        # The profile may have been created by another worker or the auth trigger
+        user_id = await _lookup_user_id(auth_user_id)
+        if user_id:
+            logger.info(f"Found existing user profile on retry: {auth_user_id}, ID: {user_id}")
+            return user_id
+        raise HTTPException(status_code=500, detail=f"Failed to create user profile: {str(insert_error)}")
+
+
+def user_id_cache_stats() -> dict:
+    """Cache counters plus how often the users table was actually queried."""
+    return {**user_id_cache.stats(), "db_selects": _user_db_stats["selects"], "db_inserts": _user_db_stats["inserts"]}
+
+
+async def _resolve_user_id_uncached(user, auth_user_id: str):
+    user_id = await _lookup_user_id(auth_user_id)
+    if not user_id:
+        email = getattr(user, 'email', user.get('email') if isinstance(user, dict) else None) if user else None
+        if not email:
+            user_id_cache.set(auth_user_id, _NO_PROFILE, ttl=USER_ID_NEGATIVE_TTL)
+            return _NO_PROFILE
+        user_id = await _create_user_profile(auth_user_id, email)
+    if not user_id:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_id_cache.set(auth_user_id, user_id)
+    logger.info(f"User authenticated successfully. Auth ID: {auth_user_id}, Internal ID: {user_id}")
+    return user_id
+
+
+async def resolve_user_id(user) -> str:
+    """Maps an auth user to the internal users.id, memoized per auth_user_id.
+
+    Concurrent first requests for the same auth user share one in-flight
+    lookup, so a new OAuth user triggers exactly one just-in-time profile insert.
+    """
     auth_user_id = getattr(user, 'id', user.get('id') if isinstance(user, dict) else None) if user else None
     if not auth_user_id:
         raise HTTPException(status_code=400, detail="Invalid user data")
-    
+
+    user_id = user_id_cache.get(auth_user_id)
+    if user_id is None:
+        pending = _user_id_inflight.get(auth_user_id)
+        if pending is None:
+            pending = asyncio.ensure_future(_resolve_user_id_uncached(user, auth_user_id))
+            _user_id_inflight[auth_user_id] = pending
+            pending.add_done_callback(lambda _: _user_id_inflight.pop(auth_user_id, None))
+        # Shield so a cancelled request does not cancel the lookup for the others
+        user_id = await asyncio.shield(pending)
+
+    if user_id is _NO_PROFILE:
+        raise HTTPException(status_code=400, detail="User email not found")
+    return user_id
+
+
+async def get_user_id_from_token(user = Depends(get_user_from_token)):
     try:
-        # Query the users table to get the internal user ID
-        res = client.table("users").select("id").eq("auth_user_id", auth_user_id).execute()
-        
-        # Handle response data safely
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        
-        # If user not found, create profile for OAuth users (just-in-time creation)
-        if not data or (isinstance(data, list) and len(data) == 0):
-            # Get user email from the auth user object
-            email = getattr(user, 'email', user.get('email') if isinstance(user, dict) else None) if user else None
-            if not email:
-                raise HTTPException(status_code=400, detail="User email not found")
-            
-            # Create user profile for OAuth users
-            profile = {
-                "auth_user_id": auth_user_id,
-                "email": email,
-                "name": email.split('@')[0]  # Use email prefix as name by default
-            }
-            
-            try:
-                insert_res = client.table("users").insert(profile).execute()
-                insert_data = getattr(insert_res, 'data', insert_res.get('data') if isinstance(insert_res, dict) else None) if insert_res else None
-                
-                if not insert_data:
-                    logger.error("Failed to create user profile: No data returned from insert")
-                    raise HTTPException(status_code=500, detail="Failed to create user profile")
-                
-                # Use the newly created user's ID
-                user_data = insert_data[0] if isinstance(insert_data, list) and len(insert_data) > 0 else insert_data
-                user_id = user_data.get("id") if isinstance(user_data, dict) else None
-                logger.info(f"Created new user profile for OAuth user: {auth_user_id}, assigned ID: {user_id}")
-            except Exception as insert_error:
-                logger.error(f"Error creating user profile: {str(insert_error)}")
-                # Check if user was created by another request simultaneously
-                retry_res = client.table("users").select("id").eq("auth_user_id", auth_user_id).execute()
-                retry_data = getattr(retry_res, 'data', retry_res.get('data') if isinstance(retry_res, dict) else None) if retry_res else None
-                if retry_data and len(retry_data) > 0:
-                    user_data = retry_data[0]
-                    user_id = user_data.get("id") if isinstance(user_data, dict) else None
-                    logger.info(f"Found existing user profile on retry: {auth_user_id}, ID: {user_id}")
-                else:
-                    raise HTTPException(status_code=500, detail=f"Failed to create user profile: {str(insert_error)}")
-        else:
-            # Get first user's id
-            user_data = data[0] if isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
-            if not user_data:
-                raise HTTPException(status_code=404, detail="User not found")
-                
-            user_id = user_data.get("id") if isinstance(user_data, dict) else None
-        
-        if not user_id:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-        logger.info(f"User authenticated successfully. Auth ID: {auth_user_id}, Internal ID: {user_id}")
-        return user_id
+        return await resolve_user_id(user)
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -1,13 +1,12 @@
 # backend/ai_services/api/main.py
 
+import asyncio
 import logging
 import os
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from contextlib import asynccontextmanager
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
@@ -18,12 +17,52 @@ load_dotenv()
 # Local imports
 from .models import AuthSignUp, AuthSignIn, NoteSaveRequest
 from . import auth as auth_helpers
-from ..core.supabase_client import client
-from ..core.note_saver import save_note, save_note_with_notification
+from ..core.supabase_client import close_clients, pool_stats
+from ..core.note_cache import note_response_cache
+from ..core.push_notifications import push_stats
+from ..core.fcm_token_cache import fcm_token_cache
+from ..core.notification_outbox import outbox_dispatcher
+from ..core.embeddings import check_embedding_dim, embedding_queue, embedding_stats, vector_store
+from ..core.note_changes import note_changes
+from ..core.note_saver import save_note, save_note_with_notification, summary_queue, summary_cache, llm_stats
+from ..core.reminder_engine import reminder_engine
+from ..core.reminder_dispatch import dispatch_due_reminders
 from .routes import note
 from .routes import notifications  # Added import
 from . import auth
 
+# -----------------------------------
+# LIFESPAN
+# -----------------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Rebuild the reminder schedule from notification_settings
+    reminder_engine.start(dispatch_due_reminders)
+    summary_queue.start()
+    check_embedding_dim()
+    embedding_queue.start()
+    fcm_token_cache.start()
+    outbox_dispatcher.start()
+    note_changes.start()
+    note_response_cache.start()
+    yield
+    # The stop() calls join threads; keep the event loop free meanwhile so
+    # in-flight requests can finish
+    await asyncio.to_thread(reminder_engine.stop)
+    await asyncio.to_thread(outbox_dispatcher.stop)
+    await asyncio.to_thread(fcm_token_cache.stop)
+    await asyncio.to_thread(note_changes.stop)
+    await asyncio.to_thread(note_response_cache.stop)
+    drain_timeout = float(os.getenv("SUMMARY_DRAIN_TIMEOUT", "30"))
+    await asyncio.gather(
+        # Let queued summaries finish before the worker exits
+        asyncio.to_thread(summary_queue.stop, drain=True, timeout=drain_timeout),
+        # Notes left unembedded are picked up by their next edit
+        asyncio.to_thread(embedding_queue.stop, drain=True, timeout=drain_timeout),
+    )
+    await asyncio.to_thread(vector_store.save)
+    await close_clients()
+
 # -----------------------------------
 # FASTAPI APP
 # -----------------------------------
@@ -31,6 +70,7 @@ app = FastAPI(
     title="Sa Do API",
     description="A note-taking backend with AI + Gemini integration",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 @app.get("/openapi.json", include_in_schema=False)
@@ -50,6 +90,24 @@ app.include_router(notifications.router, prefix="/notifications", tags=["notific
 def root():
     return {"message": "Sa Do API is running."}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return {
+        "token_cache": auth_helpers.token_cache.stats(),
+        "user_id_cache": auth_helpers.user_id_cache_stats(),
+        "reminders": reminder_engine.stats(),
+        "summary_queue": summary_queue.stats(),
+        "summary_cache": summary_cache.stats(),
+        "llm": llm_stats,
+        "supabase_pool": pool_stats(),
+        "note_cache": note_response_cache.stats(),
+        "push": push_stats(),
+        "fcm_token_cache": fcm_token_cache.stats(),
+        "outbox": outbox_dispatcher.stats(),
+        "embeddings": embedding_stats(),
+        "note_changes": note_changes.stats(),
+    }
+
 # -----------------------------------
 # CORS
 # -----------------------------------
@@ -72,24 +130,11 @@ app.add_middleware(
 )
 
 # -----------------------------------
-# LOGGER + SCHEDULER
+# LOGGER
 # -----------------------------------
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-scheduler = BackgroundScheduler()
-scheduler.start()
-
-# -----------------------------------
-# NOTIFICATION JOB
-# -----------------------------------
-def send_notification_job(user_id: str, note_id: int):
-    res = client.table("notes").select("title, content").eq("id", note_id).execute()
-    # Safely access data attribute in case res is a string or other type
-    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-    note = data[0] if data and isinstance(data, list) and len(data) > 0 else None
-    logger.info(f"[NOTIFY] Notify user {user_id} about note: {note.get('title') if note else note_id}")
-
 # -----------------------------------
 # AUTH ROUTES
 @app.post("/auth/register", status_code=status.HTTP_201_CREATED)
@@ -105,5 +150,5 @@ def login(data: AuthSignIn):
 # -----------------------------
 # CURRENT USER DEPENDENCY
 # -----------------------------
-def current_user(user=Depends(auth_helpers.get_user_from_token)):
+async def current_user(user=Depends(auth_helpers.get_user_from_token)):
     return user
\ No newline at end of file
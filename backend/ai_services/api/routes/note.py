@@ -1,19 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from pydantic import BaseModel, validator
-from typing import Optional
-from ai_services.core.note_saver import save_note, save_note_with_notification, update_note, update_note_with_notification, delete_note
+from fastapi import APIRouter, HTTPException, Depends, Request, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, model_validator, validator
+from typing import List, Literal, Optional, Tuple
+from datetime import datetime
+import asyncio
+import base64
+import csv
+import io
+import json
+from ai_services.core.note_saver import asave_note, asave_notes_bulk, asave_note_with_notification, aupdate_note_with_notification, adelete_note, aapply_note_mutations, astream_note_summary, summary_is_current, summary_queue
 from ai_services.api.auth import get_user_id_from_token
-from ai_services.core.supabase_client import client
+from ai_services.core.supabase_client import get_async_client
+from ai_services.core.reminder_engine import reminder_engine
+from ai_services.core.note_cache import note_response_cache
+from ai_services.core.embeddings import embed_query, queue_embeddings, vector_store
+from ai_services.core.note_changes import note_changes
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
-scheduler = BackgroundScheduler()
-scheduler.start()
 
 class NoteModel(BaseModel):
     title: str
@@ -36,69 +42,34 @@ class NotifyModel(BaseModel):
             raise ValueError('end_date is required when notify is True')
         return v
 
-def send_notification_job(user_id: str, note_id: int):
-    logger.info(f"[NOTIFY] Starting notification job for user {user_id}, note {note_id}")
-    
-    # Check if notification has expired
-    try:
-        res = client.table("notification_settings").select("end_date").eq("note_id", note_id).execute()
-        # Safely access data attribute in case res is a string or other type
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        
-        if data and len(data) > 0 and data[0].get("end_date"):
-            end_date_str = data[0]["end_date"]
-            # Parse the ISO format date string
-            end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00'))
-            if datetime.now().astimezone() > end_date:
-                # Remove the job as it has expired
-                job_id = f"notify_{user_id}_{note_id}"
-                if scheduler.get_job(job_id):
-                    scheduler.remove_job(job_id)
-                    logger.info(f"Removed expired notification for note {note_id}")
-                return
-    except Exception as e:
-        logger.error(f"Error checking notification end date: {e}")
-    
-    res = client.table("notes").select("title, content, summary").eq("id", note_id).execute()
-    # Safely access data attribute in case res is a string or other type
-    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-    note = data[0] if data and isinstance(data, list) and len(data) > 0 else None
-    
-    logger.info(f"[NOTIFY] Retrieved note data: {note}")
-    
-    # Send push notification
-    if note:
-        title = "Note Reminder"
-        # Include the LLM summary in the notification body if available
-        summary = note.get('summary', '')
-        if summary:
-            # Truncate summary to 200 characters to keep notification concise
-            truncated_summary = summary[:200] + "..." if len(summary) > 200 else summary
-            body = f"{note.get('title', 'Untitled Note')}: {truncated_summary}"
-        else:
-            body = f"Reminder for note: {note.get('title') if note else note_id}"
-        
-        logger.info(f"[NOTIFY] Preparing to send notification - Title: {title}, Body: {body}")
-        
-        # Import here to avoid circular imports
-        from ai_services.core.push_notifications import send_push_notification
-        success = send_push_notification(user_id, title, body, f"/editor?id={note_id}")
-        if success:
-            logger.info(f"[NOTIFY] Sent push notification to user {user_id} about note: {note.get('title') if note else note_id}")
-        else:
-            logger.warning(f"[NOTIFY] Failed to send push notification to user {user_id} about note: {note.get('title') if note else note_id}")
-    else:
-        logger.info(f"[NOTIFY] No note found for note_id {note_id}")
+class SyncMutation(BaseModel):
+    op: Literal["upsert", "delete"] = "upsert"
+    id: Optional[int] = None  # None creates a note
+    client_id: Optional[str] = None  # makes creates safe to retry
+    base_version: Optional[int] = None
+    updated_at: Optional[datetime] = None  # when the client made the edit
+    title: Optional[str] = None
+    content: Optional[str] = None
+    metadata: dict = {}
+
+    @model_validator(mode='after')
+    def content_required_for_upsert(self):
+        if self.op == 'upsert' and self.content is None:
+            raise ValueError('content is required for upsert mutations')
+        return self
+
+class SyncBatch(BaseModel):
+    mutations: List[SyncMutation]
 
 # -----------------------------
 
 @router.post("", response_model=dict)
 @router.post("/", response_model=dict)
-def create_note(note: NoteModel, user_id: str = Depends(get_user_id_from_token)):
+async def create_note(note: NoteModel, user_id: str = Depends(get_user_id_from_token)):
     logger.info(f"Received POST request to create note for user {user_id}")
     logger.info(f"Note data: {note.dict()}")
     try:
-        result = save_note(user_id, note.title, note.content, note.metadata)
+        result = await asave_note(user_id, note.title, note.content, note.metadata)
         logger.info(f"Note saved successfully: {result}")
         return {"message": "Note saved successfully", "data": result}
     except Exception as e:
@@ -106,7 +77,7 @@ def create_note(note: NoteModel, user_id: str = Depends(get_user_id_from_token))
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/notify", response_model=dict)
-def create_note_with_notification(note: NotifyModel, user_id: str = Depends(get_user_id_from_token)):
+async def create_note_with_notification(note: NotifyModel, user_id: str = Depends(get_user_id_from_token)):
     logger.info(f"Received POST request to create note with notification for user {user_id}")
     logger.info(f"Note data: {note.dict()}")
     
@@ -115,7 +86,7 @@ def create_note_with_notification(note: NotifyModel, user_id: str = Depends(get_
         raise HTTPException(status_code=400, detail="end_date is required when notify is True")
     
     try:
-        result = save_note_with_notification(
+        result = await asave_note_with_notification(
             user_id,
             note.title,
             note.content,
@@ -127,128 +98,649 @@ def create_note_with_notification(note: NotifyModel, user_id: str = Depends(get_
         )
         
         if note.notify:
-            job_id = f"notify_{user_id}_{result['note']['id']}"
-
-            if scheduler.get_job(job_id):
-                scheduler.remove_job(job_id)
-
-            if note.notify_type == "hourly":
-                trigger = CronTrigger(minute="0")
-            else:
-                # daily notification at specific time
-                if note.notify_time:
-                    hh, mm = map(int, note.notify_time.split(":"))
-                    trigger = CronTrigger(hour=hh, minute=mm)
-                else:
-                    trigger = CronTrigger(hour=9, minute=0)
-            scheduler.add_job(send_notification_job, trigger, args=[user_id, result['note']['id']], id=job_id)
-            logger.info(f"Scheduled {note.notify_type} notification for note {result['note']['id']}")
+            reminder_engine.schedule(user_id, result['note']['id'], note.notify_type, note.notify_time, note.end_date)
         logger.info(f"Note with notification saved successfully: {result}")
         return {"message": "Note saved with notification", "data": result}
     except Exception as e:
         logger.error(f"Error saving note with notification: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# -----------------------------
+# Note listing
+# -----------------------------
+# Columns a client may ask for through `fields=`; id and updated_at are
+# always returned because the cursor is built from them.
+NOTE_FIELDS = ("id", "user_id", "title", "content", "summary", "metadata", "version", "created_at", "updated_at")
+REMINDER_FIELDS = ("notify", "notify_type", "notify_time", "end_date")
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(note: dict) -> str:
+    raw = json.dumps([note["updated_at"], note["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        updated_at, note_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(str(updated_at).replace('Z', '+00:00')).isoformat(), int(note_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_fields(fields: Optional[str]) -> Tuple[List[str], List[str]]:
+    """Splits `fields=` into note columns and reminder fields to return."""
+    if not fields:
+        return list(NOTE_FIELDS), list(REMINDER_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in NOTE_FIELDS and f not in REMINDER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    note_fields = ["id", "updated_at"] + [f for f in requested if f in NOTE_FIELDS and f not in ("id", "updated_at")]
+    return note_fields, [f for f in requested if f in REMINDER_FIELDS]
+
+
+def _note_columns(note_fields: List[str], reminder_fields: List[str], inner: bool = False) -> str:
+    """Select string embedding the note's notification_settings row.
+
+    PostgREST resolves the embed through the note_id foreign key, so a note
+    and its reminder come back in one query. An inner embed drops notes
+    without a matching setting.
+    """
+    columns = ", ".join(note_fields)
+    if reminder_fields or inner:
+        embed = "notification_settings!inner" if inner else "notification_settings"
+        columns += f", {embed}({', '.join(reminder_fields or ['notify'])})"
+    return columns
+
+
+def _merge_reminder(note: dict, reminder_fields: List[str]) -> dict:
+    """Flattens the embedded notification_settings row into the note."""
+    setting = note.pop("notification_settings", None)
+    if isinstance(setting, list):
+        setting = setting[0] if setting else None
+    setting = setting or {}
+    for field in reminder_fields:
+        note[field] = setting.get(field, False if field == 'notify' else None)
+    return note
+
+
+async def _fetch_notes_page(
+    user_id: str,
+    columns: str,
+    after: Optional[Tuple[str, int]] = None,
+    limit: Optional[int] = None,
+    has_reminder: bool = False,
+    updated_since: Optional[datetime] = None,
+) -> List[dict]:
+    """One keyset page of the user's notes ordered by (updated_at, id) descending."""
+    query = get_async_client().table("notes").select(columns).eq("user_id", user_id)
+    if has_reminder:
+        query = query.eq("notification_settings.notify", True)
+    if updated_since:
+        query = query.gte("updated_at", updated_since.isoformat())
+    if after:
+        # Keyset condition for (updated_at, id) < cursor in descending order
+        ts, last_id = after
+        query = query.or_(f'updated_at.lt."{ts}",and(updated_at.eq."{ts}",id.lt.{last_id})')
+    query = query.order("updated_at", desc=True).order("id", desc=True)
+    if limit:
+        query = query.limit(limit)
+    res = await query.execute()
+    # Safely access data attribute in case res is a string or other type
+    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    return data if isinstance(data, list) else []
+
+
+def _conditional_response(request: Request, etag: str, body: bytes) -> Response:
+    """Serves a cached body, or 304 when the client already holds this ETag."""
+    # Responses are per user: browsers may keep them but must revalidate
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("", response_model=dict)
 @router.get("/", response_model=dict)
-def get_notes(user_id: str = Depends(get_user_id_from_token)):
+async def get_notes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    has_reminder: bool = False,
+    updated_since: Optional[datetime] = None,
+    user_id: str = Depends(get_user_id_from_token),
+):
+    """Lists the user's notes, most recently updated first.
+
+    Pass `limit` (and the returned `next_cursor`) to page through the notes;
+    without it every matching note is returned. `fields` is a comma separated
+    projection, e.g. `fields=title,summary,notify` for list views.
+    """
+    note_fields, reminder_fields = _parse_fields(fields)
+    after = _decode_cursor(cursor) if cursor else None
+    paged = limit is not None or after is not None
+    page_size = limit or 50
+    cache_key = f"list?{request.url.query}"
+    entry_key = note_response_cache.key(user_id, cache_key)
+    cached = note_response_cache.get(entry_key)
+    if cached:
+        return _conditional_response(request, *cached)
+    try:
+        data = await _fetch_notes_page(
+            user_id,
+            _note_columns(note_fields, reminder_fields, inner=has_reminder),
+            after=after,
+            limit=page_size + 1 if paged else None,
+            has_reminder=has_reminder,
+            updated_since=updated_since,
+        )
+
+        next_cursor = None
+        if paged and len(data) > page_size:
+            data = data[:page_size]
+            next_cursor = _encode_cursor(data[-1])
+
+        data = [_merge_reminder(note, reminder_fields) for note in data]
+
+        payload = {"data": data, "next_cursor": next_cursor} if paged else {"data": data}
+        return _conditional_response(request, *note_response_cache.set(entry_key, payload))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# -----------------------------
+# Search
+# -----------------------------
+SEARCH_NOTES_RPC = "search_notes"
+MAX_SEARCH_LIMIT = 100
+# Deep offsets re-rank every earlier match, so paging is bounded
+MAX_SEARCH_OFFSET = 1000
+
+
+@router.get("/search", response_model=dict)
+async def search_notes(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    user_id: str = Depends(get_user_id_from_token),
+):
+    """Searches the user's notes, best matches first.
+
+    `q` accepts web search syntax ("quoted phrases", or, -exclusions); titles
+    also match approximately, so typos still find them. Each result carries a
+    snippet of the content as HTML: the matched terms are wrapped in <mark>
+    tags and everything else is escaped.
+    """
+    cache_key = f"search?{request.url.query}"
+    entry_key = note_response_cache.key(user_id, cache_key)
+    cached = note_response_cache.get(entry_key)
+    if cached:
+        return _conditional_response(request, *cached)
     try:
-        # Fetch notes with their notification settings
-        res = client.table("notes").select("*").eq("user_id", user_id).execute()
+        res = await get_async_client().rpc(SEARCH_NOTES_RPC, {
+            "p_user_id": user_id,
+            "p_query": q,
+            "p_limit": limit + 1,
+            "p_offset": offset,
+        }).execute()
         # Safely access data attribute in case res is a string or other type
         data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        
-        # If we have notes, fetch their notification settings
-        if data and isinstance(data, list) and len(data) > 0:
-            note_ids = [note['id'] for note in data]
-            if note_ids:
-                # Fetch notification settings for all notes
-                notify_res = client.table("notification_settings").select("*").in_("note_id", note_ids).execute()
-                notify_data = getattr(notify_res, 'data', notify_res.get('data') if isinstance(notify_res, dict) else None) if notify_res else None
-                
-                # Create a mapping of note_id to notification settings
-                notify_map = {}
-                if notify_data and isinstance(notify_data, list):
-                    for notify_setting in notify_data:
-                        notify_map[notify_setting['note_id']] = notify_setting
-                
-                # Add notification information to each note
-                for note in data:
-                    if note['id'] in notify_map:
-                        note['notify'] = notify_map[note['id']].get('notify', False)
-                        note['notify_type'] = notify_map[note['id']].get('notify_type')
-                        note['notify_time'] = notify_map[note['id']].get('notify_time')
-                        note['end_date'] = notify_map[note['id']].get('end_date')
-                    else:
-                        note['notify'] = False
-                        note['notify_type'] = None
-                        note['notify_time'] = None
-                        note['end_date'] = None
-        
-        return {"data": data}
+        data = data if isinstance(data, list) else []
+
+        next_offset = None
+        if len(data) > limit:
+            data = data[:limit]
+            next_offset = offset + limit if offset + limit <= MAX_SEARCH_OFFSET else None
+
+        payload = {"data": data, "next_offset": next_offset}
+        return _conditional_response(request, *note_response_cache.set(entry_key, payload))
+    except Exception as e:
+        logger.error(f"Error searching notes for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# -----------------------------
+# Semantic search
+# -----------------------------
+MAX_SIMILAR_LIMIT = 50
+SIMILAR_NOTE_FIELDS = "id, title, summary, updated_at"
+
+
+async def _notes_by_id(user_id: str, note_ids: List[int]) -> dict:
+    """The user's notes among note_ids, keyed by id."""
+    if not note_ids:
+        return {}
+    res = await get_async_client().table("notes").select(SIMILAR_NOTE_FIELDS).eq("user_id", user_id).in_("id", note_ids).execute()
+    # Safely access data attribute in case res is a string or other type
+    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    return {note["id"]: note for note in data or []}
+
+
+def _with_similarity(neighbours: List[Tuple[int, float]], notes: dict) -> List[dict]:
+    # Neighbours whose note is gone (deleted since it was embedded) are skipped
+    return [dict(notes[note_id], similarity=score) for note_id, score in neighbours if note_id in notes]
+
+
+@router.get("/semantic", response_model=dict)
+async def semantic_search_notes(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(10, ge=1, le=MAX_SIMILAR_LIMIT),
+    user_id: str = Depends(get_user_id_from_token),
+):
+    """Notes closest in meaning to `q`, by embedding similarity."""
+    try:
+        vector = await asyncio.to_thread(embed_query, q)
+        neighbours = await asyncio.to_thread(vector_store.search, user_id, vector, limit)
+        notes = await _notes_by_id(user_id, [note_id for note_id, _ in neighbours])
+        return {"data": _with_similarity(neighbours, notes)}
+    except Exception as e:
+        logger.error(f"Error in semantic search for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/similar/{note_id}", response_model=dict)
+async def get_similar_notes(
+    note_id: int,
+    limit: int = Query(10, ge=1, le=MAX_SIMILAR_LIMIT),
+    user_id: str = Depends(get_user_id_from_token),
+):
+    """Notes most similar to the given note.
+
+    A note that has not been embedded yet is queued for embedding and
+    answered with an empty list and `pending: true`.
+    """
+    try:
+        neighbours = await asyncio.to_thread(vector_store.similar, user_id, note_id, limit)
+        notes = await _notes_by_id(user_id, [note_id] + [n for n, _ in neighbours or []])
+        if note_id not in notes:
+            raise HTTPException(status_code=404, detail="Note not found")
+        if neighbours is None:
+            queue_embeddings(user_id, [note_id])
+            return {"data": [], "pending": True}
+        return {"data": _with_similarity(neighbours, notes), "pending": False}
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.error(f"Error finding notes similar to {note_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# -----------------------------
+# Summary streaming
+# -----------------------------
+SUMMARY_STREAM_POLL_INTERVAL = 0.5
+# How long a stream waits for a summary worker that is already generating it
+SUMMARY_STREAM_WAIT = 30.0
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _fetch_summary_state(user_id: str, note_id: int) -> Optional[dict]:
+    res = await get_async_client().table("notes").select("id, content, summary, content_hash").eq("id", note_id).eq("user_id", user_id).limit(1).execute()
+    # Safely access data attribute in case res is a string or other type
+    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    return data[0] if data else None
+
+
+@router.get("/{note_id}/summary/stream")
+async def stream_note_summary(note_id: int, user_id: str = Depends(get_user_id_from_token)):
+    """Server-Sent Events stream of the note's summary.
+
+    Emits `token` events ({"text"}) while the summary is being generated and
+    one final `summary` event ({"note_id", "summary"}) once it is stored. A
+    summary that is already up to date is sent as the `summary` event right
+    away. Replaces polling GET /notes/{id} after a save.
+    """
+    note = await _fetch_summary_state(user_id, note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    async def events():
+        current = note
+        if summary_queue.is_running(note_id):
+            # A summary worker already has it; wait for its result instead of
+            # paying for a second generation
+            yield _sse("status", {"status": "generating"})
+            deadline = asyncio.get_running_loop().time() + SUMMARY_STREAM_WAIT
+            while summary_queue.is_running(note_id) and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(SUMMARY_STREAM_POLL_INTERVAL)
+            current = await _fetch_summary_state(user_id, note_id) or current
+        if summary_is_current(current):
+            yield _sse("summary", {"note_id": note_id, "summary": current.get("summary")})
+            return
+
+        # Take the job over from the queue and generate it here, streamed
+        summary_queue.cancel(note_id)
+        try:
+            async for kind, text in astream_note_summary(user_id, note_id, current.get("content") or ""):
+                if kind == "token":
+                    yield _sse("token", {"text": text})
+                else:
+                    yield _sse("summary", {"note_id": note_id, "summary": text})
+        except Exception as e:
+            logger.error(f"Error streaming summary for note {note_id}: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+
+    # X-Accel-Buffering stops nginx style proxies from holding tokens back
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------------
+# Change feed
+# -----------------------------
+# Idle streams get a comment line this often so proxies keep them open
+CHANGE_FEED_KEEPALIVE = 15.0
+
+
+@router.get("/changes")
+async def note_change_feed(request: Request, user_id: str = Depends(get_user_id_from_token)):
+    """Server-Sent Events feed of changes to the user's notes.
+
+    Sends `ready` ({"server_time"}) first, then one `change` event per write:
+    {"op": "insert"|"update", "id", "title", "updated_at"}, {"op": "delete",
+    "id"}, {"op": "summary", "id", "summary"} when a summary is ready or
+    {"op": "reminder", "id"} when its reminder settings change (Postgres
+    backend only).
+    Events without title/summary mean the note has to be fetched by id. A
+    `resync` event means changes may have been missed: refetch with
+    GET /notes?updated_since=<server_time of the last ready event>, which is
+    also how a client catches up after reconnecting.
+    """
+    subscription = note_changes.subscribe(user_id)
+
+    async def events():
+        try:
+            yield _sse("ready", {"server_time": datetime.now().astimezone().isoformat()})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=CHANGE_FEED_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("resync" if event["op"] == "resync" else "change", event)
+        finally:
+            note_changes.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------------
+# Delta sync
+# -----------------------------
+SYNC_NOTES_RPC = "sync_notes"
+SYNC_PAGE_SIZE = 200
+MAX_SYNC_PAGE_SIZE = 1000
+MAX_SYNC_MUTATIONS = 500
+
+
+def _encode_sync_cursor(since: Optional[str], floor: Optional[str] = None, after: Optional[List] = None) -> str:
+    raw = json.dumps({"s": since, "x": floor, "k": after}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_sync_cursor(cursor: str) -> Tuple[Optional[str], Optional[str], Optional[List]]:
+    """Returns (since, floor, after): where the run started, the next run's
+    start once this one is complete, and the last (xid, id) served."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        since, floor, after = state["s"], state["x"], state["k"]
+        for xid in (since, floor, after[0] if after else None):
+            if xid is not None and not str(xid).isdigit():
+                raise ValueError(xid)
+        if after is not None:
+            after = [str(after[0]), int(after[1])]
+        return since, floor, after
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/sync", response_model=dict)
+async def pull_note_changes(
+    cursor: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=MAX_SYNC_PAGE_SIZE),
+    user_id: str = Depends(get_user_id_from_token),
+):
+    """Returns the notes changed since `cursor`, oldest change first.
+
+    Without a cursor every note is returned. `changes` holds full notes (with
+    `version` and reminder fields) and `deleted` the ids of removed notes.
+    Keep calling with the returned `cursor` while `has_more` is true, then
+    store it for the next sync. `reset` means the cursor was too old to serve
+    incrementally: the client should drop its local copy and keep this pull.
+    """
+    since, floor, after = _decode_sync_cursor(cursor) if cursor else (None, None, None)
+    try:
+        res = await get_async_client().rpc(SYNC_NOTES_RPC, {
+            "p_user_id": user_id,
+            "p_since": since,
+            "p_after_xid": after[0] if after else None,
+            "p_after_id": after[1] if after else None,
+            "p_limit": limit + 1,
+        }).execute()
+        # Safely access data attribute in case res is a string or other type
+        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+        data = data if isinstance(data, dict) else {}
+    except Exception as e:
+        logger.error(f"Error syncing notes for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if data.get("reset"):
+        since = None
+    # A run's next start is fixed by its first page: anything not visible
+    # then has a transaction id at or above that snapshot's xmin
+    if after is None:
+        floor = data.get("xmin")
+    rows = data.get("rows") or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_cursor = _encode_sync_cursor(since, floor, [rows[-1]["xid"], rows[-1]["id"]])
+    else:
+        next_cursor = _encode_sync_cursor(floor)
+
+    return {
+        "changes": [row["note"] for row in rows if not row.get("deleted")],
+        "deleted": [row["id"] for row in rows if row.get("deleted")],
+        "cursor": next_cursor,
+        "has_more": has_more,
+        "reset": bool(data.get("reset")),
+    }
+
+
+@router.post("/sync", response_model=dict)
+async def push_note_changes(batch: SyncBatch, user_id: str = Depends(get_user_id_from_token)):
+    """Applies a batch of offline edits in order, in one transaction.
+
+    Send the `version` a note was edited from as `base_version`, and/or the
+    edit time as `updated_at`: a stale base_version still wins when its edit
+    is newer than the stored one. Each mutation gets a result with status
+    applied, conflict (carrying the server's note), deleted or not_found;
+    conflicts do not fail the batch.
+    """
+    if len(batch.mutations) > MAX_SYNC_MUTATIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_SYNC_MUTATIONS} mutations per request")
+    mutations = [m.dict() for m in batch.mutations]
+    try:
+        results = await aapply_note_mutations(user_id, mutations)
+    except Exception as e:
+        logger.error(f"Error applying note changes for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for m, result in zip(mutations, results):
+        if m["op"] == "delete" and result.get("status") == "applied" and result.get("id"):
+            reminder_engine.unschedule(result["id"])
+    return {
+        "results": results,
+        "applied": sum(1 for r in results if r.get("status") == "applied"),
+        "conflicts": sum(1 for r in results if r.get("status") == "conflict"),
+    }
+
+# -----------------------------
+# Bulk import / export
+# -----------------------------
+BULK_CHUNK_SIZE = 500
+BULK_MAX_ERRORS = 100
+BULK_MAX_LINE_BYTES = 1024 * 1024
+EXPORT_PAGE_SIZE = 500
+EXPORT_FIELDS = ("id", "title", "content", "summary", "metadata", "created_at", "updated_at") + REMINDER_FIELDS
+
+
+async def _ndjson_lines(request: Request):
+    """Yields the lines of a streamed request body without buffering it whole.
+
+    A line longer than BULK_MAX_LINE_BYTES is yielded as None and the rest of
+    it is dropped as it arrives, so the buffer never grows past the limit.
+    """
+    buffer = bytearray()
+    skipping = False
+    async for chunk in request.stream():
+        start = 0
+        while (end := chunk.find(b"\n", start)) >= 0:
+            if not skipping:
+                buffer += chunk[start:end]
+                yield bytes(buffer) if len(buffer) <= BULK_MAX_LINE_BYTES else None
+            buffer.clear()
+            skipping = False
+            start = end + 1
+        if not skipping:
+            buffer += chunk[start:]
+            if len(buffer) > BULK_MAX_LINE_BYTES:
+                yield None
+                buffer.clear()
+                skipping = True
+    if buffer:
+        yield bytes(buffer)
+
+
+@router.post("/bulk", response_model=dict)
+async def bulk_create_notes(request: Request, user_id: str = Depends(get_user_id_from_token)):
+    """Imports notes from an NDJSON body, one {"title", "content", "metadata"} object per line.
+
+    Lines are inserted in chunks of BULK_CHUNK_SIZE as they arrive; invalid
+    lines are skipped and reported back with their line number.
+    """
+    inserted = 0
+    errors = []
+    chunk = []
+    try:
+        line_no = 0
+        async for line in _ndjson_lines(request):
+            line_no += 1
+            if line is None:
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": f"Line exceeds {BULK_MAX_LINE_BYTES} bytes"})
+                continue
+            if not line.strip():
+                continue
+            try:
+                chunk.append(NoteModel(**json.loads(line)).dict())
+            except (ValueError, TypeError) as e:
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                inserted += len(await asave_notes_bulk(user_id, chunk))
+                chunk = []
+        if chunk:
+            inserted += len(await asave_notes_bulk(user_id, chunk))
+    except Exception as e:
+        logger.error(f"Error importing notes for user {user_id} after {inserted} notes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{str(e)} ({inserted} notes imported before the error)")
+
+    logger.info(f"Imported {inserted} notes for user {user_id} ({len(errors)} invalid lines)")
+    return {"message": "Notes imported", "inserted": inserted, "errors": errors}
+
+
+@router.get("/export")
+async def export_notes(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), user_id: str = Depends(get_user_id_from_token)):
+    """Streams every note of the user as NDJSON or CSV, one keyset page at a time."""
+    columns = _note_columns([f for f in EXPORT_FIELDS if f in NOTE_FIELDS], list(REMINDER_FIELDS))
+
+    async def rows():
+        after = None
+        while True:
+            page = await _fetch_notes_page(user_id, columns, after=after, limit=EXPORT_PAGE_SIZE)
+            for note in page:
+                yield _merge_reminder(note, list(REMINDER_FIELDS))
+            if len(page) < EXPORT_PAGE_SIZE:
+                return
+            after = (page[-1]["updated_at"], page[-1]["id"])
+
+    async def ndjson():
+        async for note in rows():
+            yield json.dumps(note, default=str) + "\n"
+
+    async def csv_rows():
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(EXPORT_FIELDS), extrasaction="ignore")
+        writer.writeheader()
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+        async for note in rows():
+            note["metadata"] = json.dumps(note.get("metadata") or {})
+            writer.writerow(note)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    if format == "csv":
+        return StreamingResponse(csv_rows(), media_type="text/csv", headers={"Content-Disposition": 'attachment; filename="notes.csv"'})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"Content-Disposition": 'attachment; filename="notes.ndjson"'})
+
+
 @router.get("/{note_id}")
-def get_note_by_id(note_id: int, user_id: str = Depends(get_user_id_from_token)):
+async def get_note_by_id(request: Request, note_id: int, user_id: str = Depends(get_user_id_from_token)):
+    cache_key = f"note/{note_id}"
+    entry_key = note_response_cache.key(user_id, cache_key)
+    cached = note_response_cache.get(entry_key)
+    if cached:
+        return _conditional_response(request, *cached)
     try:
-        res = client.table("notes").select("*").eq("id", note_id).eq("user_id", user_id).execute()
+        res = await (
+            get_async_client().table("notes")
+            .select(_note_columns(["*"], list(REMINDER_FIELDS)))
+            .eq("id", note_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
         # Safely access data attribute in case res is a string or other type
         data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
         if data and isinstance(data, list) and len(data) > 0:
-            note = data[0]
-            # Fetch notification settings for this note
-            try:
-                notify_res = client.table("notification_settings").select("*").eq("note_id", note_id).execute()
-                notify_data = getattr(notify_res, 'data', notify_res.get('data') if isinstance(notify_res, dict) else None) if notify_res else None
-                if notify_data and isinstance(notify_data, list) and len(notify_data) > 0:
-                    notify_setting = notify_data[0]
-                    note['notify'] = notify_setting.get('notify', False)
-                    note['notify_type'] = notify_setting.get('notify_type')
-                    note['notify_time'] = notify_setting.get('notify_time')
-                    note['end_date'] = notify_setting.get('end_date')
-                else:
-                    note['notify'] = False
-                    note['notify_type'] = None
-                    note['notify_time'] = None
-                    note['end_date'] = None
-            except Exception as e:
-                logger.warning(f"Could not fetch notification settings for note {note_id}: {e}")
-                note['notify'] = False
-                note['notify_type'] = None
-                note['notify_time'] = None
-                note['end_date'] = None
-            
-            return {"data": note}
+            payload = {"data": _merge_reminder(data[0], list(REMINDER_FIELDS))}
+            return _conditional_response(request, *note_response_cache.set(entry_key, payload))
         else:
             raise HTTPException(status_code=404, detail="Note not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{note_id}")
-def update_note_endpoint(note_id: int, note: NoteModel, user_id: str = Depends(get_user_id_from_token)):
+async def update_note_endpoint(note_id: int, note: NoteModel, user_id: str = Depends(get_user_id_from_token)):
     try:
-        data = update_note(user_id, note_id, note.title, note.content, note.metadata)
-        
-        # Also remove any existing notification settings for this note
-        # Directly delete notification settings from the notification table
-        try:
-            client.table("notification_settings").delete().eq("note_id", note_id).eq("user_id", user_id).execute()
-        except Exception as e:
-            logger.warning(f"Warning: Could not remove notification settings for note {note_id}: {e}")
-        
+        # A plain update also drops any reminder; both happen in one transaction
+        result = await aupdate_note_with_notification(user_id, note_id, note.title, note.content, False, metadata=note.metadata)
+        data = result["note"]
+        if not data:
+            raise HTTPException(status_code=404, detail="Note not found")
+        reminder_engine.unschedule(note_id)
+
         return {"message": "Note updated successfully", "data": data}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{note_id}/notify")
-def update_note_notify_endpoint(note_id: int, note: NotifyModel, user_id: str = Depends(get_user_id_from_token)):
+async def update_note_notify_endpoint(note_id: int, note: NotifyModel, user_id: str = Depends(get_user_id_from_token)):
     # Additional validation to ensure end_date is provided when notify is True
     if note.notify and not note.end_date:
         raise HTTPException(status_code=400, detail="end_date is required when notify is True")
         
     try:
-        result = update_note_with_notification(
+        result = await aupdate_note_with_notification(
             user_id,
             note_id,
             note.title,
@@ -259,41 +751,30 @@ def update_note_notify_endpoint(note_id: int, note: NotifyModel, user_id: str =
             note.metadata,
             note.end_date  # Pass end date to the function
         )
+        if not result["note"]:
+            raise HTTPException(status_code=404, detail="Note not found")
         if note.notify:
-            job_id = f"notify_{user_id}_{note_id}"
-
-            if scheduler.get_job(job_id):
-                scheduler.remove_job(job_id)
-
-            if note.notify_type == "hourly":
-                trigger = CronTrigger(minute="0")
-            else:
-                # daily notification at specific time
-                if note.notify_time:
-                    hh, mm = map(int, note.notify_time.split(":"))
-                    trigger = CronTrigger(hour=hh, minute=mm)
-                else:
-                    trigger = CronTrigger(hour=9, minute=0)
-            scheduler.add_job(send_notification_job, trigger, args=[user_id, note_id], id=job_id)
-            logger.info(f"Scheduled {note.notify_type} notification for note {note_id}")
+            reminder_engine.schedule(user_id, note_id, note.notify_type, note.notify_time, note.end_date)
         else:
-            # Remove existing job if notifications are disabled
-            job_id = f"notify_{user_id}_{note_id}"
-            if scheduler.get_job(job_id):
-                scheduler.remove_job(job_id)
-                logger.info(f"Removed notification for note {note_id}")
+            # Remove existing reminder if notifications are disabled
+            reminder_engine.unschedule(note_id)
         return {"message": "Note updated with notification", "data": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{note_id}")
-def delete_note_endpoint(note_id: int, user_id: str = Depends(get_user_id_from_token)):
+async def delete_note_endpoint(note_id: int, user_id: str = Depends(get_user_id_from_token)):
     try:
-        success = delete_note(user_id, note_id)
+        success = await adelete_note(user_id, note_id)
         if success:
+            reminder_engine.unschedule(note_id)
             return {"message": "Note deleted successfully"}
         else:
-            raise HTTPException(status_code=500, detail="Failed to delete note")
+            raise HTTPException(status_code=404, detail="Note not found")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting note: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
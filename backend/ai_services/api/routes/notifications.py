@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
+from typing import List
+from datetime import datetime, timezone
 from ai_services.api.auth import get_user_id_from_token
-from ai_services.core.supabase_client import client
+from ai_services.core.supabase_client import get_async_client
+from ai_services.core.fcm_token_cache import fcm_token_cache
 import logging
 
 router = APIRouter()
@@ -10,51 +13,50 @@ logger = logging.getLogger(__name__)
 class SubscriptionModel(BaseModel):
     fcm_token: str
 
+class BatchSubscriptionModel(BaseModel):
+    fcm_tokens: List[str]
+
 class UnsubscribeModel(BaseModel):
     fcm_token: str
 
+MAX_BATCH_TOKENS = 100
+
+def _validate_token(fcm_token: str):
+    if not fcm_token:
+        logger.error("No FCM token provided")
+        raise HTTPException(status_code=400, detail="FCM token is required")
+    if len(fcm_token) < 10:
+        logger.error(f"FCM token too short: {len(fcm_token)} characters")
+        raise HTTPException(status_code=400, detail="Invalid FCM token")
+
+
+async def _upsert_subscriptions(user_id: str, tokens: List[str]):
+    """Registers tokens for the user in one upsert keyed on fcm_token.
+
+    A token already registered (possibly by another account on the same
+    device) is simply reassigned, so concurrent re-subscriptions cannot hit
+    a duplicate-key error.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [{"user_id": user_id, "fcm_token": token, "updated_at": now} for token in tokens]
+    await get_async_client().table("push_subscriptions").upsert(rows, on_conflict="fcm_token").execute()
+    fcm_token_cache.invalidate_tokens(tokens)
+    fcm_token_cache.invalidate(user_id)
+
+
 @router.post("/subscribe")
-def subscribe_to_notifications(subscription: SubscriptionModel, user_id: str = Depends(get_user_id_from_token)):
+async def subscribe_to_notifications(subscription: SubscriptionModel, user_id: str = Depends(get_user_id_from_token)):
     """Store a user's FCM token for push notifications"""
     try:
         logger.info(f"Attempting to subscribe FCM token for user {user_id}")
         logger.info(f"FCM token (first 20 chars): {subscription.fcm_token[:20] if subscription.fcm_token else 'None'}")
         logger.info(f"FCM token length: {len(subscription.fcm_token) if subscription.fcm_token else 0}")
-        
+
         # Validate input
-        if not subscription.fcm_token:
-            logger.error("No FCM token provided")
-            raise HTTPException(status_code=400, detail="FCM token is required")
-        
-        if len(subscription.fcm_token) < 10:
-            logger.error(f"FCM token too short: {len(subscription.fcm_token)} characters")
-            raise HTTPException(status_code=400, detail="Invalid FCM token")
-        
-        # Check if subscription already exists
-        logger.info("Checking if subscription already exists...")
-        res = client.table("push_subscriptions").select("*").eq("fcm_token", subscription.fcm_token).execute()
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        
-        logger.info(f"Existing subscription check result: {len(data) if data else 0} records found")
-        
-        if data and len(data) > 0:
-            # Update existing subscription
-            logger.info("Updating existing subscription...")
-            res = client.table("push_subscriptions").update({
-                "user_id": user_id,
-                "updated_at": "now()"
-            }).eq("fcm_token", subscription.fcm_token).execute()
-            logger.info(f"Updated FCM subscription for user {user_id}")
-        else:
-            # Create new subscription
-            logger.info("Creating new subscription...")
-            res = client.table("push_subscriptions").insert({
-                "user_id": user_id,
-                "fcm_token": subscription.fcm_token
-            }).execute()
-            logger.info(f"Created new FCM subscription for user {user_id}")
-        
-        logger.info("Subscription saved successfully")
+        _validate_token(subscription.fcm_token)
+
+        await _upsert_subscriptions(user_id, [subscription.fcm_token])
+        logger.info(f"Saved FCM subscription for user {user_id}")
         return {"message": "Subscription saved successfully"}
     except HTTPException as he:
         logger.error(f"HTTP error in subscription: {he.detail}")
@@ -63,8 +65,30 @@ def subscribe_to_notifications(subscription: SubscriptionModel, user_id: str = D
         logger.error(f"Error saving subscription: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/subscribe/batch")
+async def subscribe_batch(subscriptions: BatchSubscriptionModel, user_id: str = Depends(get_user_id_from_token)):
+    """Store several FCM tokens for the user in one round trip"""
+    try:
+        tokens = list(dict.fromkeys(subscriptions.fcm_tokens))
+        if not tokens:
+            raise HTTPException(status_code=400, detail="At least one FCM token is required")
+        if len(tokens) > MAX_BATCH_TOKENS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TOKENS} FCM tokens per request")
+        for token in tokens:
+            _validate_token(token)
+
+        await _upsert_subscriptions(user_id, tokens)
+        logger.info(f"Saved {len(tokens)} FCM subscriptions for user {user_id}")
+        return {"message": "Subscriptions saved successfully", "count": len(tokens)}
+    except HTTPException as he:
+        logger.error(f"HTTP error in batch subscription: {he.detail}")
+        raise he
+    except Exception as e:
+        logger.error(f"Error saving subscriptions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/unsubscribe")
-def unsubscribe_from_notifications(unsubscribe_data: UnsubscribeModel, user_id: str = Depends(get_user_id_from_token)):
+async def unsubscribe_from_notifications(unsubscribe_data: UnsubscribeModel, user_id: str = Depends(get_user_id_from_token)):
     """Remove a user's FCM subscription"""
     try:
         logger.info(f"Attempting to unsubscribe FCM token for user {user_id}")
@@ -74,7 +98,9 @@ def unsubscribe_from_notifications(unsubscribe_data: UnsubscribeModel, user_id:
             logger.error("No FCM token provided for unsubscription")
             raise HTTPException(status_code=400, detail="FCM token is required")
         
-        res = client.table("push_subscriptions").delete().eq("fcm_token", unsubscribe_data.fcm_token).execute()
+        res = await get_async_client().table("push_subscriptions").delete().eq("fcm_token", unsubscribe_data.fcm_token).execute()
+        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+        fcm_token_cache.invalidate_many([user_id] + [row.get('user_id') for row in data or []])
         logger.info(f"Removed FCM subscription for user {user_id}")
         return {"message": "Subscription removed successfully"}
     except Exception as e:
@@ -0,0 +1,357 @@
+# backend/ai_services/core/embeddings.py
+import hashlib
+import importlib.util
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import TTLCache
+from .summary_cache import content_hash
+from .summary_queue import SummaryQueue
+from .supabase_client import get_client
+
+logger = logging.getLogger(__name__)
+
+NOTES_TABLE = "notes"
+EMBEDDINGS_TABLE = "note_embeddings"
+# Postgres functions from db/embeddings.sql
+MATCH_EMBEDDINGS_RPC = "match_note_embeddings"
+SIMILAR_EMBEDDINGS_RPC = "similar_note_embeddings"
+EMBEDDING_DIM_RPC = "note_embedding_dim"
+IN_QUERY_CHUNK_SIZE = 200
+
+# "gemini", or "hashing" for deterministic local embeddings without API calls
+# (tests and offline development; similarity is lexical, not semantic)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/gemini-embedding-001")
+# Must match the vector(...) size in db/embeddings.sql; checked at startup
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+# "pgvector" (note_embeddings table) or "local" (on-disk HNSW index of this
+# process; needs hnswlib and suits single-process deployments only)
+EMBEDDING_STORE = os.getenv("EMBEDDING_STORE", "pgvector").lower()
+EMBEDDING_INDEX_PATH = os.getenv("EMBEDDING_INDEX_PATH", "note_embeddings.hnsw")
+# Part of every stored hash: changing the provider, model or size re-embeds notes
+EMBEDDING_VERSION = f"{EMBEDDING_PROVIDER}:{EMBEDDING_MODEL}:{EMBEDDING_DIM}"
+
+
+def embedding_text(note: Dict[str, Any]) -> str:
+    return f"{note.get('title') or ''}\n\n{note.get('content') or ''}".strip()
+
+
+# -----------------------------
+# Embedders
+# -----------------------------
+class HashingEmbedder:
+    """Deterministic embeddings from hashed words and word pairs."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        words = re.findall(r"\w+", (text or "").lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "big") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class GeminiEmbedder:
+    """Gemini embeddings, created on first use like the summary model."""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        self.model = model
+        self.dim = dim
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                    self._client = GoogleGenerativeAIEmbeddings(model=self.model, google_api_key=os.getenv("GOOGLE_API_KEY"))
+        return self._client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._get_client().embed_documents(texts, task_type="RETRIEVAL_DOCUMENT", output_dimensionality=self.dim)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_client().embed_query(text, task_type="RETRIEVAL_QUERY", output_dimensionality=self.dim)
+
+
+# -----------------------------
+# Vector stores
+# -----------------------------
+def _response_data(res):
+    # Safely access data attribute in case res is a string or other type
+    return getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+
+
+class PgVectorStore:
+    """Embeddings in the note_embeddings table, searched through its HNSW index."""
+
+    def hashes(self, note_ids: List[int]) -> Dict[int, str]:
+        found = {}
+        for i in range(0, len(note_ids), IN_QUERY_CHUNK_SIZE):
+            res = (
+                get_client().table(EMBEDDINGS_TABLE)
+                .select("note_id, content_hash")
+                .in_("note_id", note_ids[i:i + IN_QUERY_CHUNK_SIZE])
+                .execute()
+            )
+            found.update({row["note_id"]: row["content_hash"] for row in _response_data(res) or []})
+        return found
+
+    def upsert(self, rows: List[Tuple[int, str, str, List[float]]]):
+        """Stores (note_id, user_id, content_hash, vector) rows."""
+        get_client().table(EMBEDDINGS_TABLE).upsert([
+            {"note_id": note_id, "user_id": user_id, "content_hash": key, "embedding": vector, "updated_at": _now_iso()}
+            for note_id, user_id, key, vector in rows
+        ], on_conflict="note_id").execute()
+
+    def delete(self, note_ids: List[int]):
+        pass  # rows go with their note (on delete cascade)
+
+    def search(self, user_id: str, vector: List[float], limit: int) -> List[Tuple[int, float]]:
+        res = get_client().rpc(MATCH_EMBEDDINGS_RPC, {"p_user_id": user_id, "p_embedding": vector, "p_limit": limit}).execute()
+        return [(row["note_id"], row["similarity"]) for row in _response_data(res) or []]
+
+    def similar(self, user_id: str, note_id: int, limit: int) -> Optional[List[Tuple[int, float]]]:
+        """Nearest neighbours of a stored note, or None when it has no embedding yet."""
+        if not self.hashes([note_id]):
+            return None
+        res = get_client().rpc(SIMILAR_EMBEDDINGS_RPC, {"p_user_id": user_id, "p_note_id": note_id, "p_limit": limit}).execute()
+        return [(row["note_id"], row["similarity"]) for row in _response_data(res) or []]
+
+    def save(self):
+        pass
+
+    def vector_dim(self) -> Optional[int]:
+        """Size of the note_embeddings vector column."""
+        return _response_data(get_client().rpc(EMBEDDING_DIM_RPC, {}).execute())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"store": "pgvector"}
+
+
+class LocalVectorStore:
+    """On-disk HNSW index (hnswlib) with note ids as labels.
+
+    Owners and content hashes live in a JSON file next to the index. Searches
+    are filtered to the requesting user's labels. The index is written back
+    at most every save_interval seconds and on shutdown.
+    """
+
+    def __init__(self, path: str = EMBEDDING_INDEX_PATH, dim: int = EMBEDDING_DIM, save_interval: float = 60.0):
+        import hnswlib
+
+        self.path = path
+        self.dim = dim
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._meta: Dict[int, Tuple[str, str]] = {}
+        self._by_user: Dict[str, Set[int]] = {}
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if os.path.exists(path) and os.path.exists(path + ".json"):
+            self._index.load_index(path, allow_replace_deleted=True)
+            with open(path + ".json") as f:
+                self._meta = {int(k): tuple(v) for k, v in json.load(f).items()}
+            for note_id, (user_id, _) in self._meta.items():
+                self._by_user.setdefault(user_id, set()).add(note_id)
+        else:
+            self._index.init_index(max_elements=10000, ef_construction=200, M=16, allow_replace_deleted=True)
+        self._index.set_ef(64)
+
+    def hashes(self, note_ids: List[int]) -> Dict[int, str]:
+        with self._lock:
+            return {note_id: self._meta[note_id][1] for note_id in note_ids if note_id in self._meta}
+
+    def upsert(self, rows: List[Tuple[int, str, str, List[float]]]):
+        with self._lock:
+            needed = len(self._meta) + len(rows)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            for note_id, user_id, key, vector in rows:
+                if note_id in self._meta:
+                    self._index.add_items([vector], [note_id])
+                else:
+                    self._index.add_items([vector], [note_id], replace_deleted=True)
+                self._meta[note_id] = (user_id, key)
+                self._by_user.setdefault(user_id, set()).add(note_id)
+            self._dirty = True
+        if time.monotonic() - self._saved_at > self.save_interval:
+            self.save()
+
+    def delete(self, note_ids: List[int]):
+        with self._lock:
+            for note_id in note_ids:
+                entry = self._meta.pop(note_id, None)
+                if entry is not None:
+                    self._by_user.get(entry[0], set()).discard(note_id)
+                    self._index.mark_deleted(note_id)
+                    self._dirty = True
+
+    def _knn(self, user_id: str, vector, limit: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Caller holds the lock."""
+        allowed = self._by_user.get(user_id, set()) - {exclude}
+        if not allowed:
+            return []
+        found, distances = self._index.knn_query([vector], k=min(limit, len(allowed)), filter=lambda label: label in allowed)
+        return [(int(label), round(1.0 - float(distance), 6)) for label, distance in zip(found[0], distances[0])]
+
+    def search(self, user_id: str, vector: List[float], limit: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            return self._knn(user_id, vector, limit)
+
+    def similar(self, user_id: str, note_id: int, limit: int) -> Optional[List[Tuple[int, float]]]:
+        with self._lock:
+            if self._meta.get(note_id, (None,))[0] != user_id:
+                return None
+            vector = self._index.get_items([note_id])[0]
+            return self._knn(user_id, vector, limit, exclude=note_id)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._index.save_index(self.path)
+            with open(self.path + ".json", "w") as f:
+                json.dump({str(k): v for k, v in self._meta.items()}, f)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def vector_dim(self) -> Optional[int]:
+        """Size of the vectors in the index, which a loaded file decides."""
+        return self._index.dim
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"store": "local", "vectors": len(self._meta), "capacity": self._index.get_max_elements()}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _make_store():
+    if EMBEDDING_STORE == "local":
+        if importlib.util.find_spec("hnswlib") is None:
+            logger.warning("[EMBED] hnswlib is not installed, storing embeddings in pgvector")
+        else:
+            return LocalVectorStore()
+    return PgVectorStore()
+
+
+embedder = HashingEmbedder() if EMBEDDING_PROVIDER == "hashing" else GeminiEmbedder()
+vector_store = _make_store()
+# Query embeddings are reused for repeated searches
+query_cache = TTLCache(maxsize=1000, ttl=600)
+
+
+# -----------------------------
+# Background pipeline
+# -----------------------------
+def _select_notes(note_ids: List[int]) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for i in range(0, len(note_ids), IN_QUERY_CHUNK_SIZE):
+        res = (
+            get_client().table(NOTES_TABLE)
+            .select("id, user_id, title, content")
+            .in_("id", note_ids[i:i + IN_QUERY_CHUNK_SIZE])
+            .execute()
+        )
+        rows.extend(_response_data(res) or [])
+    return rows
+
+
+def embed_notes(note_ids: List[int]) -> int:
+    """Embeds the current text of the given notes, skipping those whose
+    embedding is up to date. Returns the number of notes embedded."""
+    notes = _select_notes(list(dict.fromkeys(note_ids)))
+    stored = vector_store.hashes([note["id"] for note in notes])
+    changed = []
+    for note in notes:
+        text = embedding_text(note)
+        key = content_hash(text, EMBEDDING_VERSION)
+        if text and stored.get(note["id"]) != key:
+            changed.append((note, text, key))
+    if not changed:
+        return 0
+    vectors = embedder.embed_documents([text for _, text, _ in changed])
+    vector_store.upsert([(note["id"], note["user_id"], key, vector) for (note, _, key), vector in zip(changed, vectors)])
+    logger.info(f"[EMBED] Embedded {len(changed)} of {len(notes)} notes")
+    return len(changed)
+
+
+def _embed_batch(jobs: List[Tuple[int, str]]):
+    embed_notes([note_id for note_id, _ in jobs])
+
+
+# Embedding jobs share the summary worker machinery: per-user fairness, a
+# bounded backlog, coalescing of repeated edits and batching. Job content is
+# unused, the handler reads the notes as they are when the batch runs.
+embedding_queue = SummaryQueue(
+    handler=lambda note_id, _: embed_notes([note_id]),
+    batch_handler=_embed_batch,
+    workers=int(os.getenv("EMBEDDING_WORKERS", "2")),
+    max_size=int(os.getenv("EMBEDDING_QUEUE_SIZE", "5000")),
+    max_per_user=int(os.getenv("EMBEDDING_QUEUE_PER_USER", "1000")),
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "100")),
+    batch_window=float(os.getenv("EMBEDDING_BATCH_WINDOW", "1.0")),
+    name="embedding",
+    log_tag="EMBED",
+)
+
+
+def queue_embeddings(user_id: str, note_ids: Iterable[int]):
+    """Schedules (re-)embedding of notes after a write; never blocks."""
+    for note_id in note_ids:
+        if note_id and not embedding_queue.submit(user_id, note_id, ""):
+            logger.warning(f"[EMBED] Embedding backlog full, note {note_id} keeps its previous embedding")
+
+
+def embed_query(text: str) -> List[float]:
+    key = " ".join(text.lower().split())
+    vector = query_cache.get(key)
+    if vector is None:
+        vector = embedder.embed_query(text)
+        query_cache.set(key, vector)
+    return vector
+
+
+def check_embedding_dim() -> bool:
+    """Logs an error when the store holds vectors of another size than
+    EMBEDDING_DIM; every embedding write would fail until they match."""
+    try:
+        dim = vector_store.vector_dim()
+    except Exception as e:
+        logger.warning(f"[EMBED] Could not check the embedding size: {e}")
+        return True
+    if dim and dim != EMBEDDING_DIM:
+        logger.error(
+            f"[EMBED] EMBEDDING_DIM is {EMBEDDING_DIM} but the vector store holds {dim}-dimensional "
+            f"vectors; set EMBEDDING_DIM to match or re-create the store (vector(...) in db/embeddings.sql)"
+        )
+        return False
+    return True
+
+
+def embedding_stats() -> Dict[str, Any]:
+    return {**vector_store.stats(), "provider": EMBEDDING_PROVIDER, "queue": embedding_queue.stats()}
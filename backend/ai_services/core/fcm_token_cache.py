@@ -0,0 +1,116 @@
+# backend/ai_services/core/fcm_token_cache.py
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from .cache import TTLCache
+from .pg_listen import InvalidationBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# FCM tokens only change through /notifications/subscribe, /unsubscribe and
+# dead-token pruning, so reminders can reuse them for a while. The TTL bounds
+# staleness when no invalidation backend is configured.
+FCM_TOKEN_CACHE_SIZE = int(os.getenv("FCM_TOKEN_CACHE_SIZE", "50000"))
+FCM_TOKEN_CACHE_TTL = float(os.getenv("FCM_TOKEN_CACHE_TTL", "300"))
+# "local" (this process only) or "postgres" (LISTEN on the channel fed by the
+# push_subscriptions trigger in db/notifications.sql; needs psycopg and a
+# direct, non-pooled database URL)
+FCM_TOKEN_CACHE_BACKEND = os.getenv("FCM_TOKEN_CACHE_BACKEND", "local").lower()
+FCM_TOKEN_CHANNEL = "fcm_token_changes"
+
+
+class FcmTokenCache:
+    """Per-user cache of FCM tokens with explicit invalidation."""
+
+    def __init__(self, maxsize: int = FCM_TOKEN_CACHE_SIZE, ttl: float = FCM_TOKEN_CACHE_TTL, backend: Optional[InvalidationBackend] = None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._backend = backend or InvalidationBackend()
+        self._lock = threading.Lock()
+        # token -> user whose cached list holds it, so a token moving to
+        # another account can drop the previous owner's entry
+        self._owners: Dict[str, str] = {}
+        self._max_owners = 4 * maxsize
+        # Counts invalidations. A user's entry in _invalidated_at is the count
+        # at their last one; set_many drops lists read before that. Lists
+        # read before _floor are dropped for every user.
+        self._generation = 0
+        self._invalidated_at: Dict[str, int] = {}
+        self._floor = 0
+        self.invalidations = 0
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Cached token lists for the given users; users not cached are absent."""
+        found = {}
+        for user_id in user_ids:
+            tokens = self._cache.get(user_id)
+            if tokens is not None:
+                found[user_id] = tokens
+        return found
+
+    def generation(self) -> int:
+        """Take before reading tokens from the database and pass to set_many."""
+        with self._lock:
+            return self._generation
+
+    def set_many(self, tokens_by_user: Dict[str, List[str]], since: Optional[int] = None):
+        """Caches token lists; with `since` (a generation()), lists of users
+        invalidated after it are skipped, as the read may predate the change."""
+        with self._lock:
+            if since is not None and since < self._floor:
+                return
+            if len(self._owners) > self._max_owners:
+                # Entries that expired without invalidation leave owners
+                # behind; start over rather than let the index grow
+                self._owners.clear()
+                self._cache.clear()
+            for user_id, tokens in tokens_by_user.items():
+                if since is not None and self._invalidated_at.get(user_id, -1) > since:
+                    continue
+                self._cache.set(user_id, list(tokens))
+                for token in tokens:
+                    self._owners[token] = user_id
+
+    def invalidate(self, user_id: Optional[str]):
+        """Drops one user's tokens, or every user's when user_id is None."""
+        with self._lock:
+            self.invalidations += 1
+            self._generation += 1
+            if user_id is None or len(self._invalidated_at) >= self._max_owners:
+                # Forgetting who was invalidated when means no earlier read is safe
+                self._floor = self._generation
+                self._invalidated_at.clear()
+            if user_id is None:
+                self._cache.clear()
+                self._owners.clear()
+                return
+            self._invalidated_at[user_id] = self._generation
+            for token in self._cache.pop(user_id) or []:
+                if self._owners.get(token) == user_id:
+                    del self._owners[token]
+
+    def invalidate_tokens(self, tokens: Iterable[str]):
+        """Drops the cached entries of whichever users currently hold these tokens."""
+        with self._lock:
+            owners = [self._owners.get(token) for token in tokens]
+        self.invalidate_many(owners)
+
+    def invalidate_many(self, user_ids: Iterable[Optional[str]]):
+        for user_id in set(user_ids):
+            if user_id:
+                self.invalidate(user_id)
+
+    def start(self):
+        self._backend.start(self.invalidate)
+
+    def stop(self):
+        self._backend.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "invalidations": self.invalidations, "backend": type(self._backend).__name__}
+
+
+fcm_token_cache = FcmTokenCache(
+    backend=make_backend(FCM_TOKEN_CACHE_BACKEND, FCM_TOKEN_CHANNEL, "TOKEN_CACHE", "token cache invalidation")
+)
@@ -0,0 +1,108 @@
+# backend/ai_services/core/note_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .cache import TTLCache
+from .pg_listen import InvalidationBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# Serialized GET /notes responses are cached per user and dropped on every
+# write. With the local backend writes from other workers are not seen, so
+# NOTE_CACHE_TTL bounds how stale a cached response can get in a
+# multi-process deployment.
+NOTE_CACHE_SIZE = int(os.getenv("NOTE_CACHE_SIZE", "5000"))
+NOTE_CACHE_TTL = float(os.getenv("NOTE_CACHE_TTL", "30"))
+# "local" (this process's writes only) or "postgres" (also LISTEN on the
+# note_changes channel fed by the triggers in db/changes.sql, so writes made
+# by every worker invalidate; needs psycopg and a direct, non-pooled database
+# URL). Shares the listener with NOTE_CHANGES_BACKEND=postgres.
+NOTE_CACHE_BACKEND = os.getenv("NOTE_CACHE_BACKEND", "local").lower()
+NOTE_CHANGES_CHANNEL = "note_changes"
+
+
+class NoteResponseCache:
+    """Per-user cache of serialized note read responses and their ETags.
+
+    Entries are keyed by the user's version counter, so invalidating a user
+    is a single increment; superseded entries age out of the LRU. Take the
+    key before reading the database and store the response under that key:
+    a write that lands during the read bumps the version, and the response
+    is cached where nobody looks it up. ETags are a hash of the serialized
+    body, which keeps them valid across restarts and across workers.
+    """
+
+    def __init__(self, maxsize: int = NOTE_CACHE_SIZE, ttl: float = NOTE_CACHE_TTL, backend: Optional[InvalidationBackend] = None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._backend = backend or InvalidationBackend()
+        self._versions: Dict[str, int] = {}
+        # Bumped when every user is invalidated at once
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def key(self, user_id: str, request_key: str) -> tuple:
+        """Cache key of a response as of the user's current version."""
+        with self._lock:
+            return (user_id, self._epoch, self._versions.get(user_id, 0), request_key)
+
+    def get(self, key: tuple) -> Optional[Tuple[str, bytes]]:
+        """Returns (etag, body) for a cached response, or None."""
+        return self._cache.get(key)
+
+    def set(self, key: tuple, payload: Any) -> Tuple[str, bytes]:
+        """Serializes payload, caches it and returns (etag, body)."""
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+        entry = (f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body)
+        self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self, user_id: Optional[str]):
+        """Drops every cached response for the user."""
+        if not user_id:
+            return
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._epoch += 1
+            self._versions.clear()
+            self.invalidations += 1
+        self._cache.clear()
+
+    def _on_notify(self, payload: Optional[str]):
+        if payload is None:
+            # (Re)connected: changes made while not listening are unknown
+            self.invalidate_all()
+            return
+        try:
+            user_id = json.loads(payload).get("user_id")
+        except (ValueError, AttributeError):
+            logger.error(f"[NOTE_CACHE] Invalid note change payload: {payload[:200]}")
+            return
+        self.invalidate(str(user_id) if user_id else None)
+
+    def start(self):
+        self._backend.start(self._on_notify)
+
+    def stop(self):
+        self._backend.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "invalidations": self.invalidations,
+            "users": len(self._versions),
+            "backend": type(self._backend).__name__,
+        }
+
+
+note_response_cache = NoteResponseCache(
+    backend=make_backend(NOTE_CACHE_BACKEND, NOTE_CHANGES_CHANNEL, "NOTE_CACHE", "note cache invalidation")
+)
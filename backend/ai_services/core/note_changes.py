@@ -0,0 +1,139 @@
+# backend/ai_services/core/note_changes.py
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from .pg_listen import InvalidationBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# "local" (events from this process's writes only) or "postgres" (LISTEN on
+# the channel fed by the notes trigger in db/changes.sql; sees writes made by
+# every worker and needs psycopg and a direct, non-pooled database URL)
+NOTE_CHANGES_BACKEND = os.getenv("NOTE_CHANGES_BACKEND", "local").lower()
+NOTE_CHANGES_CHANNEL = "note_changes"
+# Events buffered per subscriber before it is told to resync instead
+NOTE_CHANGES_QUEUE_SIZE = int(os.getenv("NOTE_CHANGES_QUEUE_SIZE", "1000"))
+
+RESYNC = {"op": "resync"}
+
+
+class Subscription:
+    """One client's feed: an asyncio queue filled from any thread."""
+
+    def __init__(self, user_id: str, loop: asyncio.AbstractEventLoop, maxsize: int = NOTE_CHANGES_QUEUE_SIZE):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize)
+        self.overflows = 0
+
+    def _put(self, event: Dict[str, Any]):
+        """Runs on the subscriber's loop."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client fell behind: drop the backlog, it has to refetch anyway
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflows += 1
+
+    def push(self, event: Dict[str, Any]):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop closed, the request is gone
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class NoteChangeFeed:
+    """Fans note change events out to the subscribed clients of each user.
+
+    Events come either from this process's writes (publish_local) or, with
+    the Postgres backend, from the notes trigger, which also covers writes
+    made by other workers and the summary writers. After the listener
+    reconnects every subscriber gets a resync event, since notifications
+    sent in the meantime are lost.
+    """
+
+    def __init__(self, backend: Optional[InvalidationBackend] = None):
+        self._backend = backend or InvalidationBackend()
+        self.local = type(self._backend) is InvalidationBackend
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, event: Dict[str, Any]):
+        """Delivers an event ({"user_id", "op", "id", ...}) to the user's subscribers."""
+        user_id = str(event.get("user_id"))
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self.published += 1
+        if subscribers:
+            delta = {k: v for k, v in event.items() if k != "user_id"}
+            for subscription in subscribers:
+                subscription.push(delta)
+
+    def publish_local(self, user_id: Optional[str], op: str, note: Optional[Dict[str, Any]] = None, note_id: Optional[int] = None):
+        """Publishes a write made by this process; the trigger does it with the Postgres backend."""
+        if not self.local or not user_id:
+            return
+        note = note or {}
+        event = {"user_id": user_id, "op": op, "id": note.get("id", note_id)}
+        if op == "summary":
+            event["summary"] = note.get("summary")
+        elif op != "delete":
+            event["title"] = note.get("title")
+            event["updated_at"] = note.get("updated_at")
+        self.publish(event)
+
+    def _on_notify(self, payload: Optional[str]):
+        if payload is None:
+            with self._lock:
+                subscribers = [s for subs in self._subscribers.values() for s in subs]
+            for subscription in subscribers:
+                subscription.push(RESYNC)
+            return
+        try:
+            self.publish(json.loads(payload))
+        except ValueError:
+            logger.error(f"[CHANGES] Invalid note change payload: {payload[:200]}")
+
+    def start(self):
+        self._backend.start(self._on_notify)
+
+    def stop(self):
+        self._backend.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": type(self._backend).__name__,
+                "users": len(self._subscribers),
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+                "published": self.published,
+            }
+
+
+note_changes = NoteChangeFeed(
+    backend=make_backend(NOTE_CHANGES_BACKEND, NOTE_CHANGES_CHANNEL, "CHANGES", "the note change feed")
+)
@@ -1,19 +1,24 @@
 # backend/ai_services/note_saver.py
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
 from datetime import datetime
+import asyncio
+import json
+import time
 import logging
-from threading import Thread
-from .supabase_client import client
+import threading
+from .supabase_client import get_client, get_async_client
+from .summary_queue import SummaryQueue
+from .summary_cache import SummaryCache, content_hash
+from .note_cache import note_response_cache
+from .embeddings import queue_embeddings, vector_store
+from .note_changes import note_changes
 from dotenv import load_dotenv
 import os
 
 # Load environment variables
 load_dotenv()
 
-# ✅ LangChain Gemini imports
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
-# Using newer LangChain approach instead of LLMChain
+# LangChain/Gemini are imported lazily in get_llm: they dominate import time
 
 logger = logging.getLogger(__name__)
 
@@ -21,17 +26,38 @@ logger = logging.getLogger(__name__)
 NOTES_TABLE = "notes"
 NOTIFICATION_TABLE = "notification_settings"
 
-# ✅ Initialize Gemini model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",  # Using a more stable model
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.5
-)
-
-# Prompt for summarizing notes
-summary_prompt = PromptTemplate(
-    input_variables=["content"],
-    template="""You are an AI assistant that creates notification reminders from user notes. Given a note, write a clear and actionable notification message to be sent to the user. Follow these guidelines:
+# Postgres functions from db/note_functions.sql
+UPSERT_NOTE_RPC = "upsert_note_with_reminder"
+DELETE_NOTE_RPC = "delete_note_with_reminder"
+WRITE_SUMMARIES_RPC = "write_note_summaries"
+# From db/sync.sql
+APPLY_MUTATIONS_RPC = "apply_note_mutations"
+
+# Placeholder summaries shown until the background summary is written
+SUMMARY_PENDING = "Summary will be generated shortly..."
+SUMMARY_UPDATING = "Summary will be updated shortly..."
+
+# ✅ Gemini model, created on first use so importing this module stays cheap
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Returns the shared Gemini chat model, creating it on first use."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                _llm = ChatGoogleGenerativeAI(
+                    model="gemini-2.5-flash",  # Using a more stable model
+                    google_api_key=os.getenv("GOOGLE_API_KEY"),
+                    temperature=0.5
+                )
+    return _llm
+
+# Shared guidelines and few-shot examples for the summary prompts
+SUMMARY_INSTRUCTIONS = """You are an AI assistant that creates notification reminders from user notes. Given a note, write a clear and actionable notification message to be sent to the user. Follow these guidelines:
 
 - Start with a prefix appropriate for the task: Reminder, Check, Follow up, Send, Update, Share, Review, Ask, Ping, etc.
 - Include key details from the note (time, date, person, deadline) for clarity.
@@ -73,10 +99,19 @@ Notification: Feature idea: auto-text on profile view — review later
 Note: Ask tech team about API rate limit
 Notification: Ask tech team about API rate limit
 
-Now, given this note, generate the notification in the same style:
+"""
+
+# Prompt for summarizing notes (str.format template with {content})
+summary_prompt = SUMMARY_INSTRUCTIONS + """Now, given this note, generate the notification in the same style:
 
 {content}"""
-)
+
+# Prompt for summarizing several notes in one request; the examples are sent
+# once per batch instead of once per note (str.format template with {notes})
+batch_summary_prompt = SUMMARY_INSTRUCTIONS + """Now, generate one notification in the same style for each of the numbered notes below. Each note is given as a JSON string.
+Reply with only a JSON array, one object per note, of the form {{"id": <note number>, "notification": "<notification text>"}}.
+
+{notes}"""
 
 
 def _now_iso():
@@ -84,86 +119,409 @@ def _now_iso():
     return datetime.utcnow().isoformat()
 
 
+def _fallback_summary(content: str) -> str:
+    return content[:200] + "..." if len(content) > 200 else content
+
+
+def _summary_params(summaries: List[Tuple[int, str, str, bool]]) -> Dict:
+    # content_hash marks which content a summary belongs to so unchanged edits
+    # can skip the LLM; previews (ok False) belong to no content
+    return {"p_summaries": [
+        {"id": note_id, "content": content or "", "summary": summary, "content_hash": content_hash(content, PROMPT_VERSION) if ok else None}
+        for note_id, content, summary, ok in summaries
+    ]}
+
+
+def _summaries_written(res) -> List[Dict]:
+    """Drops cached reads of the updated notes' owners and announces the new summaries."""
+    rows = _rpc_data(res) or []
+    for row in rows:
+        note_response_cache.invalidate(row.get("user_id"))
+        note_changes.publish_local(row.get("user_id"), "summary", row)
+    return rows
+
+
+def write_summaries(summaries: List[Tuple[int, str, str, bool]]) -> List[Dict]:
+    """Stores (note_id, content, summary, ok) results in one call.
+
+    A note is only written while it still holds the content its summary was
+    generated from; a job that finishes after a newer edit changes nothing.
+    Returns the notes that were updated.
+    """
+    return _summaries_written(get_client().rpc(WRITE_SUMMARIES_RPC, _summary_params(summaries)).execute())
+
+
+async def awrite_summaries(summaries: List[Tuple[int, str, str, bool]]) -> List[Dict]:
+    """Async variant of write_summaries."""
+    return _summaries_written(await get_async_client().rpc(WRITE_SUMMARIES_RPC, _summary_params(summaries)).execute())
+
+
 def update_note_summary_async(note_id: int, content: str):
     """Asynchronously update note summary using AI."""
     try:
-        summary = summarize_note_content(content)
-        # Update the note with the generated summary
-        payload = {"summary": summary}
-        client.table(NOTES_TABLE).update(payload).eq("id", note_id).execute()
-        logger.info(f"Successfully updated summary for note {note_id}")
+        # The save that queued the job already counted its cache lookup
+        summary, ok = _summarize(content, count=False)
+        if write_summaries([(note_id, content, summary, ok)]):
+            logger.info(f"Successfully updated summary for note {note_id}")
+        else:
+            logger.info(f"Note {note_id} changed or was deleted while summarizing, summary dropped")
     except Exception as e:
         logger.error(f"Failed to update summary for note {note_id}: {e}")
         # Update with a fallback summary
         try:
-            fallback_summary = content[:200] + "..." if len(content) > 200 else content
-            payload = {"summary": fallback_summary}
-            client.table(NOTES_TABLE).update(payload).eq("id", note_id).execute()
+            write_summaries([(note_id, content, _fallback_summary(content), False)])
         except Exception as fallback_error:
             logger.error(f"Failed to update fallback summary for note {note_id}: {fallback_error}")
 
 
-def summarize_note_content(content: str) -> str:
-    """Use Gemini via LangChain to summarize a note."""
+# Summaries keyed by normalized content + prompt version; bump PROMPT_VERSION
+# whenever summary_prompt changes so stale summaries are not reused.
+PROMPT_VERSION = "v1"
+summary_cache = SummaryCache(
+    maxsize=int(os.getenv("SUMMARY_CACHE_SIZE", "10000")),
+    db_path=os.getenv("SUMMARY_CACHE_DB"),
+    prompt_tokens=len(summary_prompt) // 4,
+)
+
+
+llm_stats = {"requests": 0, "batch_requests": 0, "batched_notes": 0, "prompt_chars": 0}
+
+
+def _count_llm_request(prompt: str, batch: bool, notes: int = 1):
+    llm_stats["batch_requests" if batch else "requests"] += 1
+    llm_stats["batched_notes"] += notes if batch else 0
+    llm_stats["prompt_chars"] += len(prompt)
+
+
+def _response_text(response) -> str:
+    """Extracts the text from an LLM response."""
+    # Handle different response types
+    if hasattr(response, 'content'):
+        content_value = response.content
+        if isinstance(content_value, list):
+            # If content is a list, join it into a string
+            return ' '.join(str(item) for item in content_value).strip()
+        elif isinstance(content_value, str):
+            return content_value.strip()
+        else:
+            return str(content_value).strip()
+    elif isinstance(response, str):
+        return response.strip()
+    else:
+        return str(response).strip()
+
+
+def _summarize(content: str, count: bool = True) -> Tuple[str, bool]:
+    """Returns (summary, ok); ok is False when the fallback preview was used.
+
+    count=False skips the cache statistics, for content looked up at save time.
+    """
     if not content or not content.strip():
-        return "No content provided for summarization."
+        return "No content provided for summarization.", True
+    key = content_hash(content, PROMPT_VERSION)
+    cached = summary_cache.get(key, content, count=count)
+    if cached is not None:
+        return cached, True
     try:
         # Using newer LangChain approach instead of LLMChain
         # The llm can be called directly with the prompt
-        response = llm.invoke(summary_prompt.format(content=content))
-        # Handle different response types
-        if hasattr(response, 'content'):
-            content_value = response.content
-            if isinstance(content_value, list):
-                # If content is a list, join it into a string
-                return ' '.join(str(item) for item in content_value).strip()
-            elif isinstance(content_value, str):
-                return content_value.strip()
-            else:
-                return str(content_value).strip()
-        elif isinstance(response, str):
-            return response.strip()
-        else:
-            return str(response).strip()
+        prompt = summary_prompt.format(content=content)
+        _count_llm_request(prompt, batch=False)
+        summary = _response_text(get_llm().invoke(prompt))
+        summary_cache.set(key, summary)
+        return summary, True
     except Exception as e:
         logger.error(f"Gemini summarization failed: {e}")
         # Return a simple fallback summary instead of failing completely
         content_preview = content[:100] + "..." if len(content) > 100 else content
-        return f"Note preview: {content_preview}"
+        return f"Note preview: {content_preview}", False
 
 
-def save_note(user_id: str, title: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict:
-    """Save a note to Supabase, with placeholder summary included."""
+def summarize_note_content(content: str) -> str:
+    """Use Gemini via LangChain to summarize a note, reusing cached summaries."""
+    return _summarize(content)[0]
+
+
+def _parse_batch_response(text: str, count: int) -> Dict[int, str]:
+    """Maps note numbers (1-based) to notifications from a batch reply; bad items are skipped."""
+    text = text.strip()
+    if text.startswith("```"):
+        # Strip a Markdown code fence around the JSON
+        text = text.strip("`")
+        text = text[text.find("["):]
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end == -1:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        notification = item.get("notification")
+        if 1 <= index <= count and isinstance(notification, str) and notification.strip():
+            results[index] = notification.strip()
+    return results
+
+
+def summarize_notes_batch(contents: List[str], count: bool = True) -> List[Tuple[str, bool]]:
+    """Summarizes several notes with a single Gemini request.
+
+    Cached contents are answered from the summary cache, duplicates are sent
+    once, and any note missing from (or unparseable in) the batch reply falls
+    back to an individual summarize call. count as in _summarize.
+    """
+    results: List[Optional[Tuple[str, bool]]] = [None] * len(contents)
+    pending: Dict[str, List[int]] = {}
+    for i, content in enumerate(contents):
+        if not content or not content.strip():
+            results[i] = _summarize(content, count=count)
+            continue
+        key = content_hash(content, PROMPT_VERSION)
+        cached = summary_cache.get(key, content, count=count)
+        if cached is not None:
+            results[i] = (cached, True)
+        else:
+            pending.setdefault(key, []).append(i)
+
+    if len(pending) > 1:
+        keys = list(pending)
+        notes = "\n".join(f"{n}: {json.dumps(contents[pending[key][0]], ensure_ascii=False)}" for n, key in enumerate(keys, start=1))
+        try:
+            prompt = batch_summary_prompt.format(notes=notes)
+            _count_llm_request(prompt, batch=True, notes=len(keys))
+            parsed = _parse_batch_response(_response_text(get_llm().invoke(prompt)), len(keys))
+        except Exception as e:
+            logger.error(f"Gemini batch summarization failed: {e}")
+            parsed = {}
+        for n, key in enumerate(keys, start=1):
+            if n in parsed:
+                summary_cache.set(key, parsed[n])
+                for i in pending[key]:
+                    results[i] = (parsed[n], True)
+        if len(parsed) < len(keys):
+            logger.warning(f"Batch summary returned {len(parsed)} of {len(keys)} notes, falling back for the rest")
+
+    # Per-item fallback (also covers a single uncached note)
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = _summarize(contents[i], count=False)
+    return results
+
+
+def update_note_summaries_batch(jobs: List[Tuple[int, str]]):
+    """Summary worker batch handler: summarizes jobs together and writes each note."""
+    summaries = summarize_notes_batch([content for _, content in jobs], count=False)
+    try:
+        written = write_summaries([(note_id, content, summary, ok) for (note_id, content), (summary, ok) in zip(jobs, summaries)])
+    except Exception as e:
+        logger.error(f"Failed to update summaries for notes {[note_id for note_id, _ in jobs]}: {e}")
+        return
+    logger.info(f"Updated summaries for {len(written)} of {len(jobs)} notes in one batch")
+
+
+# How long one bulk insert may wait for room in the summary backlog in total
+BULK_SUMMARY_SUBMIT_TIMEOUT = float(os.getenv("BULK_SUMMARY_SUBMIT_TIMEOUT", "2"))
+
+# Background summarization runs on a bounded, per-user fair worker pool.
+# Jobs arriving within SUMMARY_BATCH_WINDOW seconds are summarized together.
+summary_queue = SummaryQueue(
+    handler=update_note_summary_async,
+    batch_handler=update_note_summaries_batch,
+    workers=int(os.getenv("SUMMARY_WORKERS", "4")),
+    max_size=int(os.getenv("SUMMARY_QUEUE_SIZE", "1000")),
+    max_per_user=int(os.getenv("SUMMARY_QUEUE_PER_USER", "200")),
+    batch_size=int(os.getenv("SUMMARY_BATCH_SIZE", "10")),
+    batch_window=float(os.getenv("SUMMARY_BATCH_WINDOW", "0.5")),
+)
+
+
+def _response_error(res):
+    # Safely access error attribute in case res is a string or other type
+    return getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
+
+
+def _first_row(res) -> Optional[Dict]:
+    # Safely access data attribute in case res is a string or other type
+    data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    return data[0] if data and isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
+
+
+def _cached_summary(content: str) -> Tuple[str, Optional[str]]:
+    """Returns the content hash and the cached summary for it, if any."""
+    key = content_hash(content or "", PROMPT_VERSION)
+    return key, summary_cache.get(key, content or "")
+
+
+def _note_insert_payload(user_id: str, title: str, content: str, metadata: Optional[Dict[str, Any]]) -> Tuple[Dict, str]:
+    key, cached = _cached_summary(content)
     # Use placeholder summary to avoid blocking the save operation
-    summary = "Summary will be generated shortly..."
-    
     payload = {
         "user_id": user_id,
         "title": title or "Untitled Note",
         "content": content or "",
-        "summary": summary,
+        "summary": cached or SUMMARY_PENDING,
+        "content_hash": key if cached else None,
         "metadata": metadata or {},
         "created_at": _now_iso(),
         "updated_at": _now_iso(),
     }
+    return payload, key
+
+
+def _note_update_payload(title: str, content: str, metadata: Optional[Dict[str, Any]]) -> Tuple[Dict, str]:
+    key, cached = _cached_summary(content)
+    # The summary is only touched when a cached one is available; otherwise
+    # the caller compares the stored content_hash to see if content changed
+    payload = {
+        "title": title or "Untitled Note",
+        "content": content or "",
+        "metadata": metadata or {},
+        "updated_at": _now_iso(),
+    }
+    if cached:
+        payload["summary"] = cached
+        payload["content_hash"] = key
+    return payload, key
+
+
+def _note_rpc_params(
+    user_id: str,
+    note_id: Optional[int],
+    title: str,
+    content: str,
+    metadata: Optional[Dict[str, Any]],
+    notify: bool,
+    notify_type: Optional[str],
+    notify_time: Optional[str],
+    end_date: Optional[str],
+) -> Dict:
+    """Arguments for upsert_note_with_reminder; a note_id of None inserts."""
+    # Validate that end_date is provided when notify is True
+    if notify and not end_date:
+        raise ValueError("end_date is required when notify is True")
+    key, cached = _cached_summary(content)
+    return {
+        "p_user_id": user_id,
+        "p_note_id": note_id,
+        "p_title": title or "Untitled Note",
+        "p_content": content or "",
+        "p_metadata": metadata or {},
+        "p_content_hash": key,
+        "p_summary": cached,
+        "p_placeholder": SUMMARY_PENDING if note_id is None else SUMMARY_UPDATING,
+        "p_notify": bool(notify),
+        "p_notify_type": (notify_type or "daily").lower(),
+        "p_notify_time": notify_time or None,
+        "p_end_date": end_date if notify else None,
+    }
 
+
+def _rpc_data(res):
+    error = _response_error(res)
+    if error:
+        raise RuntimeError(f"Database error: {error}")
+    # Safely access data attribute in case res is a string or other type
+    return getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+
+
+def _queue_summary(user_id: str, note_id: int, content: str):
+    """Generate the AI summary in the background after a write.
+
+    When the summary backlog is full the note gets the content preview right
+    away instead of keeping the placeholder forever.
+    """
+    if not summary_queue.submit(user_id, note_id, content):
+        write_summaries([(note_id, content, _fallback_summary(content), False)])
+
+
+async def _aqueue_summary(user_id: str, note_id: int, content: str):
+    """Async variant of _queue_summary."""
+    if not summary_queue.submit(user_id, note_id, content):
+        await awrite_summaries([(note_id, content, _fallback_summary(content), False)])
+
+
+def summary_is_current(note: Dict[str, Any]) -> bool:
+    """Whether the note's stored summary was generated from its current content."""
+    return note.get("content_hash") == content_hash(note.get("content") or "", PROMPT_VERSION)
+
+
+def _chunk_text(chunk) -> str:
+    # Like _response_text, but keeps the whitespace between streamed pieces
+    content_value = getattr(chunk, "content", chunk)
+    if isinstance(content_value, list):
+        return "".join(item if isinstance(item, str) else str(item.get("text", "")) if isinstance(item, dict) else "" for item in content_value)
+    return content_value if isinstance(content_value, str) else str(content_value)
+
+
+async def astream_note_summary(user_id: str, note_id: int, content: str) -> AsyncIterator[Tuple[str, str]]:
+    """Generates a note's summary with a streamed LLM call and stores it.
+
+    Yields ("token", text) pieces as the model produces them and finally
+    ("summary", full_summary). If the caller stops early, the note is handed
+    back to the summary queue so it does not keep its placeholder.
+    """
+    stored = False
     try:
-        res = client.table(NOTES_TABLE).insert(payload).execute()
-        # Safely access error and data attributes in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
+        key = content_hash(content, PROMPT_VERSION)
+        # Counted when the note was saved
+        cached = summary_cache.get(key, content, count=False) if content.strip() else "No content provided for summarization."
+        ok = True
+        if cached is not None:
+            summary = cached
+        else:
+            prompt = summary_prompt.format(content=content)
+            _count_llm_request(prompt, batch=False)
+            parts = []
+            try:
+                async for chunk in get_llm().astream(prompt):
+                    text = _chunk_text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield "token", text
+                summary = "".join(parts).strip()
+                summary_cache.set(key, summary)
+            except Exception as e:
+                logger.error(f"Gemini streaming summarization failed for note {note_id}: {e}")
+                content_preview = content[:100] + "..." if len(content) > 100 else content
+                summary, ok = f"Note preview: {content_preview}", False
+
+        # A no-op when the note was edited meanwhile; the edit queued its own job
+        await awrite_summaries([(note_id, content, summary, ok)])
+        stored = True
+        yield "summary", summary
+    finally:
+        if not stored:
+            summary_queue.submit(user_id, note_id, content)
+
+
+def save_note(user_id: str, title: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict:
+    """Save a note to Supabase, with placeholder summary included."""
+    payload, key = _note_insert_payload(user_id, title, content, metadata)
+
+    try:
+        res = get_client().table(NOTES_TABLE).insert(payload).execute()
+        error = _response_error(res)
         if error:
             logger.error("Error inserting note: %s", error)
             # Log the payload for debugging
             logger.error("Payload that caused error: %s", payload)
             raise RuntimeError(f"Database error: {error}")
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        result = data[0] if data and isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
-        
-        # Generate AI summary asynchronously after saving
-        if result and result.get('id'):
-            thread = Thread(target=update_note_summary_async, args=(result['id'], content))
-            thread.start()
-        
+        result = _first_row(res)
+
+        # Generate AI summary asynchronously after saving, unless it was cached
+        if result and result.get('id') and not payload["content_hash"]:
+            _queue_summary(user_id, result['id'], content)
+
+        note_response_cache.invalidate(user_id)
+        queue_embeddings(user_id, [(result or {}).get("id")])
+        note_changes.publish_local(user_id, "insert", result)
         return result if result is not None else {}
     except Exception as e:
         logger.error("Exception during note insertion: %s", str(e))
@@ -172,6 +530,82 @@ def save_note(user_id: str, title: str, content: str, metadata: Optional[Dict[st
         raise RuntimeError(f"Failed to save note: {str(e)}")
 
 
+async def asave_note(user_id: str, title: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict:
+    """Async variant of save_note for the API handlers."""
+    payload, key = _note_insert_payload(user_id, title, content, metadata)
+
+    try:
+        res = await get_async_client().table(NOTES_TABLE).insert(payload).execute()
+        error = _response_error(res)
+        if error:
+            logger.error("Error inserting note: %s", error)
+            logger.error("Payload that caused error: %s", payload)
+            raise RuntimeError(f"Database error: {error}")
+        result = _first_row(res)
+
+        if result and result.get('id') and not payload["content_hash"]:
+            await _aqueue_summary(user_id, result['id'], content)
+
+        note_response_cache.invalidate(user_id)
+        queue_embeddings(user_id, [(result or {}).get("id")])
+        note_changes.publish_local(user_id, "insert", result)
+        return result if result is not None else {}
+    except Exception as e:
+        logger.error("Exception during note insertion: %s", str(e))
+        logger.error("Payload that caused exception: %s", payload)
+        raise RuntimeError(f"Failed to save note: {str(e)}")
+
+
+async def asave_notes_bulk(user_id: str, notes: List[Dict[str, Any]]) -> List[Dict]:
+    """Inserts a batch of notes with one insert call and queues their summaries.
+
+    Each item needs title and content, metadata is optional. Summaries that do
+    not fit in the backlog within BULK_SUMMARY_SUBMIT_TIMEOUT get the content
+    preview instead.
+    """
+    if not notes:
+        return []
+    payloads = [_note_insert_payload(user_id, n.get("title"), n.get("content"), n.get("metadata"))[0] for n in notes]
+    try:
+        res = await get_async_client().table(NOTES_TABLE).insert(payloads).execute()
+        error = _response_error(res)
+        if error:
+            logger.error("Error inserting notes in bulk: %s", error)
+            raise RuntimeError(f"Database error: {error}")
+    except Exception as e:
+        logger.error("Exception during bulk note insertion: %s", str(e))
+        raise RuntimeError(f"Failed to save notes: {str(e)}")
+
+    # Safely access data attribute in case res is a string or other type
+    rows = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+    rows = rows if isinstance(rows, list) else []
+
+    def submit_all() -> List[Dict]:
+        # Waiting for room in the backlog blocks, so this runs off the event loop
+        deadline = time.monotonic() + BULK_SUMMARY_SUBMIT_TIMEOUT
+        fallbacks = []
+        for row in rows:
+            if row.get("content_hash"):
+                continue  # summary came from the cache
+            remaining = deadline - time.monotonic()
+            if not summary_queue.submit(user_id, row["id"], row.get("content") or "", timeout=remaining if remaining > 0 else None):
+                fallbacks.append((row["id"], row.get("content") or "", _fallback_summary(row.get("content") or ""), False))
+        return fallbacks
+
+    fallbacks = await asyncio.to_thread(submit_all)
+    if fallbacks:
+        try:
+            # An update, so a note deleted in the meantime is not re-created
+            await awrite_summaries(fallbacks)
+        except Exception as e:
+            logger.error(f"Failed to write fallback summaries for {len(fallbacks)} notes: {e}")
+    note_response_cache.invalidate(user_id)
+    queue_embeddings(user_id, [row["id"] for row in rows])
+    for row in rows:
+        note_changes.publish_local(user_id, "insert", row)
+    return rows
+
+
 def save_note_with_notification(
     user_id: str,
     title: str,
@@ -182,70 +616,76 @@ def save_note_with_notification(
     metadata: Optional[Dict[str, Any]] = None,
     end_date: Optional[str] = None,  # Add end_date parameter
 ) -> Dict:
-    """Save note with optional notification preference."""
-    note = save_note(user_id, title, content, metadata)
-
-    if notify:
-        # Validate that end_date is provided when notify is True
-        if not end_date:
-            raise ValueError("end_date is required when notify is True")
-            
-        notify_type = (notify_type or "daily").lower()
-        payload = {
-            "user_id": user_id,
-            "note_id": note.get("id"),
-            "notify": True,
-            "notify_type": notify_type,
-            "notify_time": notify_time or None,
-            "end_date": end_date,  # Add end_date to payload (required now)
-            "created_at": _now_iso(),
-            "updated_at": _now_iso(),
-        }
+    """Save note with optional notification preference in a single transaction."""
+    params = _note_rpc_params(user_id, None, title, content, metadata, notify, notify_type, notify_time, end_date)
+    try:
+        result = _rpc_data(get_client().rpc(UPSERT_NOTE_RPC, params).execute()) or {}
+    except Exception as e:
+        logger.error("Exception during note insertion: %s", str(e))
+        raise RuntimeError(f"Failed to save note: {str(e)}")
 
-        res = client.table(NOTIFICATION_TABLE).insert(payload).execute()
-        # Safely access error and data attributes in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
-        if error:
-            logger.error("Error inserting notification: %s", error)
-            raise RuntimeError(error)
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        notification_data = data[0] if data and isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
+    note = result.get("note") or {}
+    if note.get("id") and result.get("summary_stale"):
+        _queue_summary(user_id, note["id"], content)
+    note_response_cache.invalidate(user_id)
+    queue_embeddings(user_id, [note.get("id")])
+    note_changes.publish_local(user_id, "insert", note)
+    return {"note": note, "notification": result.get("notification")}
 
-        return {"note": note, "notification": notification_data}
 
-    return {"note": note, "notification": None}
+async def asave_note_with_notification(
+    user_id: str,
+    title: str,
+    content: str,
+    notify: bool,
+    notify_type: Optional[str] = None,
+    notify_time: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    end_date: Optional[str] = None,
+) -> Dict:
+    """Async variant of save_note_with_notification."""
+    params = _note_rpc_params(user_id, None, title, content, metadata, notify, notify_type, notify_time, end_date)
+    try:
+        result = _rpc_data(await get_async_client().rpc(UPSERT_NOTE_RPC, params).execute()) or {}
+    except Exception as e:
+        logger.error("Exception during note insertion: %s", str(e))
+        raise RuntimeError(f"Failed to save note: {str(e)}")
+
+    note = result.get("note") or {}
+    if note.get("id") and result.get("summary_stale"):
+        await _aqueue_summary(user_id, note["id"], content)
+    note_response_cache.invalidate(user_id)
+    queue_embeddings(user_id, [note.get("id")])
+    note_changes.publish_local(user_id, "insert", note)
+    return {"note": note, "notification": result.get("notification")}
 
 
 def update_note(user_id: str, note_id: int, title: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict:
-    """Update an existing note in Supabase, with placeholder summary included."""
-    # Use placeholder summary to avoid blocking the update operation
-    summary = "Summary will be updated shortly..."
-    
-    payload = {
-        "title": title or "Untitled Note",
-        "content": content or "",
-        "summary": summary,
-        "metadata": metadata or {},
-        "updated_at": _now_iso(),
-    }
+    """Update an existing note in Supabase, re-summarizing only when content changed."""
+    payload, key = _note_update_payload(title, content, metadata)
 
     try:
-        res = client.table(NOTES_TABLE).update(payload).eq("id", note_id).eq("user_id", user_id).execute()
-        # Safely access error and data attributes in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
+        res = get_client().table(NOTES_TABLE).update(payload).eq("id", note_id).eq("user_id", user_id).execute()
+        error = _response_error(res)
         if error:
             logger.error("Error updating note: %s", error)
             # Log the payload for debugging
             logger.error("Payload that caused error: %s", payload)
             raise RuntimeError(f"Database error: {error}")
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        result = data[0] if data and isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
-        
-        # Generate AI summary asynchronously after updating
-        if result:
-            thread = Thread(target=update_note_summary_async, args=(note_id, content))
-            thread.start()
-        
+        result = _first_row(res)
+
+        # Only re-summarize when the content actually changed and no cached
+        # summary exists for it; title/metadata-only edits keep the summary
+        if result and result.get("content_hash") != key:
+            # The placeholder belongs to no content, see write_summaries
+            placeholder = {"summary": SUMMARY_UPDATING, "content_hash": None}
+            get_client().table(NOTES_TABLE).update(placeholder).eq("id", note_id).execute()
+            result.update(placeholder)
+            _queue_summary(user_id, note_id, content)
+
+        note_response_cache.invalidate(user_id)
+        queue_embeddings(user_id, [(result or {}).get("id")])
+        note_changes.publish_local(user_id, "update", result)
         return result if result is not None else {}
     except Exception as e:
         logger.error("Exception during note update: %s", str(e))
@@ -265,75 +705,177 @@ def update_note_with_notification(
     metadata: Optional[Dict[str, Any]] = None,
     end_date: Optional[str] = None,  # Add end_date parameter
 ) -> Dict:
-    """Update note with optional notification preference."""
-    note = update_note(user_id, note_id, title, content, metadata)
-
-    # Update or insert notification setting
-    if notify:
-        # Validate that end_date is provided when notify is True
-        if not end_date:
-            raise ValueError("end_date is required when notify is True")
-            
-        notify_type = (notify_type or "daily").lower()
-        payload = {
-            "user_id": user_id,
-            "note_id": note_id,
-            "notify": True,
-            "notify_type": notify_type,
-            "notify_time": notify_time or None,
-            "end_date": end_date,  # Add end_date to payload (required now)
-            "updated_at": _now_iso(),
-        }
+    """Update note and its notification preference in a single transaction.
 
-        # First try to update existing notification
-        res = client.table(NOTIFICATION_TABLE).update(payload).eq("note_id", note_id).eq("user_id", user_id).execute()
-        # Check if update affected any rows
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        if not data:
-            # If no rows were updated, insert new notification
-            payload["created_at"] = _now_iso()
-            res = client.table(NOTIFICATION_TABLE).insert(payload).execute()
-        
-        # Safely access error attribute in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
-        if error:
-            logger.error("Error updating/inserting notification: %s", error)
-            raise RuntimeError(error)
-            
-        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
-        notification_data = data[0] if data and isinstance(data, list) and len(data) > 0 else data if isinstance(data, dict) else None
+    With notify=False any existing notification setting is removed.
+    """
+    params = _note_rpc_params(user_id, note_id, title, content, metadata, notify, notify_type, notify_time, end_date)
+    try:
+        result = _rpc_data(get_client().rpc(UPSERT_NOTE_RPC, params).execute()) or {}
+    except Exception as e:
+        logger.error("Exception during note update: %s", str(e))
+        raise RuntimeError(f"Failed to update note: {str(e)}")
 
-        return {"note": note, "notification": notification_data}
+    # Only re-summarize when the content actually changed and no cached
+    # summary exists for it; title/metadata-only edits keep the summary
+    note = result.get("note") or {}
+    if not note.get("id"):
+        return {"note": None, "notification": None}  # no such note for this user
+    if result.get("summary_stale"):
+        _queue_summary(user_id, note_id, content)
+    note_response_cache.invalidate(user_id)
+    queue_embeddings(user_id, [note.get("id")])
+    note_changes.publish_local(user_id, "update", note)
+    return {"note": note, "notification": result.get("notification")}
 
-    # If notify is False, delete existing notification if it exists
-    else:
-        res = client.table(NOTIFICATION_TABLE).delete().eq("note_id", note_id).eq("user_id", user_id).execute()
-        # Safely access error attribute in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
-        if error:
-            logger.warning("Warning: Error deleting notification: %s", error)
-        return {"note": note, "notification": None}
+
+async def aupdate_note_with_notification(
+    user_id: str,
+    note_id: int,
+    title: str,
+    content: str,
+    notify: bool,
+    notify_type: Optional[str] = None,
+    notify_time: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    end_date: Optional[str] = None,
+) -> Dict:
+    """Async variant of update_note_with_notification."""
+    params = _note_rpc_params(user_id, note_id, title, content, metadata, notify, notify_type, notify_time, end_date)
+    try:
+        result = _rpc_data(await get_async_client().rpc(UPSERT_NOTE_RPC, params).execute()) or {}
+    except Exception as e:
+        logger.error("Exception during note update: %s", str(e))
+        raise RuntimeError(f"Failed to update note: {str(e)}")
+
+    note = result.get("note") or {}
+    if not note.get("id"):
+        return {"note": None, "notification": None}  # no such note for this user
+    if result.get("summary_stale"):
+        await _aqueue_summary(user_id, note_id, content)
+    note_response_cache.invalidate(user_id)
+    queue_embeddings(user_id, [note.get("id")])
+    note_changes.publish_local(user_id, "update", note)
+    return {"note": note, "notification": result.get("notification")}
 
 
 def delete_note(user_id: str, note_id: int) -> bool:
-    """Delete a note from Supabase."""
+    """Delete a note and its notification setting from Supabase.
+
+    Returns False when the user has no note with that id.
+    """
     try:
-        # First delete any associated notifications
-        res = client.table(NOTIFICATION_TABLE).delete().eq("note_id", note_id).eq("user_id", user_id).execute()
-        # Safely access error attribute in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
-        if error:
-            logger.warning("Warning: Error deleting notification: %s", error)
-        
-        # Then delete the note itself
-        res = client.table(NOTES_TABLE).delete().eq("id", note_id).eq("user_id", user_id).execute()
-        # Safely access error attribute in case res is a string or other type
-        error = getattr(res, 'error', res.get('error') if isinstance(res, dict) else None) if res else None
-        if error:
-            logger.error("Error deleting note: %s", error)
-            raise RuntimeError(f"Database error: {error}")
-        
-        return True
+        deleted = bool(_rpc_data(get_client().rpc(DELETE_NOTE_RPC, {"p_user_id": user_id, "p_note_id": note_id}).execute()))
+        if deleted:
+            note_response_cache.invalidate(user_id)
+            vector_store.delete([note_id])
+            note_changes.publish_local(user_id, "delete", note_id=note_id)
+        return deleted
+    except Exception as e:
+        logger.error("Exception during note deletion: %s", str(e))
+        raise RuntimeError(f"Failed to delete note: {str(e)}")
+
+
+async def adelete_note(user_id: str, note_id: int) -> bool:
+    """Async variant of delete_note for the API handlers."""
+    try:
+        deleted = bool(_rpc_data(await get_async_client().rpc(DELETE_NOTE_RPC, {"p_user_id": user_id, "p_note_id": note_id}).execute()))
+        if deleted:
+            note_response_cache.invalidate(user_id)
+            vector_store.delete([note_id])
+            note_changes.publish_local(user_id, "delete", note_id=note_id)
+        return deleted
     except Exception as e:
         logger.error("Exception during note deletion: %s", str(e))
-        raise RuntimeError(f"Failed to delete note: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to delete note: {str(e)}")
+
+
+def _mutation_params(mutations: List[Dict[str, Any]]) -> List[Dict]:
+    """Elements for apply_note_mutations, with the summary fields of each upsert."""
+    params = []
+    for m in mutations:
+        updated_at = m.get("updated_at")
+        param = {
+            "op": m.get("op", "upsert"),
+            "id": m.get("id"),
+            "client_id": m.get("client_id"),
+            "base_version": m.get("base_version"),
+            "updated_at": updated_at.isoformat() if isinstance(updated_at, datetime) else updated_at,
+        }
+        if param["op"] != "delete":
+            key, cached = _cached_summary(m.get("content"))
+            param.update({
+                "title": m.get("title") or "Untitled Note",
+                "content": m.get("content") or "",
+                "metadata": m.get("metadata") or {},
+                "content_hash": key,
+                "summary": cached,
+                "placeholder": SUMMARY_PENDING if m.get("id") is None else SUMMARY_UPDATING,
+            })
+        params.append(param)
+    return params
+
+
+def _applied_mutations(user_id: str, mutations: List[Dict[str, Any]], results: List[Dict]) -> List[Tuple[int, str]]:
+    """Cache, embedding and change feed upkeep for applied mutations.
+
+    Returns the (note_id, content) pairs that need a new summary.
+    """
+    stale, written, deleted = [], [], []
+    for m, result in zip(mutations, results):
+        if result.get("status") != "applied" or not result.get("id"):
+            continue
+        if m.get("op") == "delete":
+            deleted.append(result["id"])
+            note_changes.publish_local(user_id, "delete", note_id=result["id"])
+            continue
+        note = result.get("note") or {}
+        written.append(result["id"])
+        note_changes.publish_local(user_id, "update" if m.get("id") else "insert", note)
+        if result.get("summary_stale"):
+            stale.append((result["id"], note.get("content") or ""))
+    if written or deleted:
+        note_response_cache.invalidate(user_id)
+    if written:
+        queue_embeddings(user_id, written)
+    if deleted:
+        vector_store.delete(deleted)
+    return stale
+
+
+def apply_note_mutations(user_id: str, mutations: List[Dict[str, Any]]) -> List[Dict]:
+    """Apply a batch of offline client edits in one transaction.
+
+    Each mutation is {"op": "upsert" | "delete", "id", "client_id",
+    "base_version", "updated_at", "title", "content", "metadata"}; conflicts
+    are resolved in apply_note_mutations (db/sync.sql) and reported back per
+    mutation rather than raised.
+    """
+    try:
+        results = _rpc_data(get_client().rpc(APPLY_MUTATIONS_RPC, {
+            "p_user_id": user_id,
+            "p_mutations": _mutation_params(mutations),
+        }).execute()) or []
+    except Exception as e:
+        logger.error("Exception during note sync: %s", str(e))
+        raise RuntimeError(f"Failed to apply note changes: {str(e)}")
+
+    for note_id, content in _applied_mutations(user_id, mutations, results):
+        _queue_summary(user_id, note_id, content)
+    return results
+
+
+async def aapply_note_mutations(user_id: str, mutations: List[Dict[str, Any]]) -> List[Dict]:
+    """Async variant of apply_note_mutations for the API handlers."""
+    try:
+        results = _rpc_data(await get_async_client().rpc(APPLY_MUTATIONS_RPC, {
+            "p_user_id": user_id,
+            "p_mutations": _mutation_params(mutations),
+        }).execute()) or []
+    except Exception as e:
+        logger.error("Exception during note sync: %s", str(e))
+        raise RuntimeError(f"Failed to apply note changes: {str(e)}")
+
+    for note_id, content in _applied_mutations(user_id, mutations, results):
+        await _aqueue_summary(user_id, note_id, content)
+    return results
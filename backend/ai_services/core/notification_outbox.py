@@ -0,0 +1,178 @@
+# backend/ai_services/core/notification_outbox.py
+import logging
+import os
+import threading
+from typing import Any, Dict, List
+
+from .supabase_client import get_client
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_TABLE = "notification_outbox"
+CLAIM_OUTBOX_RPC = "claim_notification_outbox"
+FINISH_OUTBOX_RPC = "finish_notification_outbox"
+OUTBOX_INSERT_CHUNK_SIZE = 1000
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_SENDERS = int(os.getenv("OUTBOX_SENDERS", "2"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+
+
+def _response_data(res):
+    # Safely access data attribute in case res is a string or other type
+    return getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+
+
+def enqueue_notifications(rows: List[Dict[str, Any]]) -> int:
+    """Writes notifications (user_id, note_id, title, body, data) to the outbox.
+
+    Rows carrying scheduled_for are written at most once per note and fire
+    time, so a reminder fired twice (e.g. during a partition handover between
+    workers) is still delivered once.
+    """
+    for i in range(0, len(rows), OUTBOX_INSERT_CHUNK_SIZE):
+        get_client().table(OUTBOX_TABLE).upsert(
+            rows[i:i + OUTBOX_INSERT_CHUNK_SIZE],
+            on_conflict="note_id,scheduled_for",
+            ignore_duplicates=True,
+        ).execute()
+    if rows:
+        outbox_dispatcher.wake()
+    return len(rows)
+
+
+class OutboxDispatcher:
+    """Delivers notification_outbox rows to FCM.
+
+    Each sender thread claims a batch of due rows (SKIP LOCKED, so senders in
+    any number of processes never share a row), fans the messages out to the
+    users' devices and records the outcome in one call. Rows that could not
+    be delivered are retried with exponential backoff and dead-lettered after
+    OUTBOX_MAX_ATTEMPTS attempts.
+    """
+
+    def __init__(self, senders: int = OUTBOX_SENDERS, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.senders = senders
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"claimed": 0, "sent": 0, "retried": 0, "dead": 0, "errors": 0}
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._run, name=f"outbox-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[OUTBOX] Started {self.senders} outbox senders")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        logger.info("[OUTBOX] Outbox senders stopped")
+
+    def wake(self):
+        """Skips the poll interval after new rows were enqueued."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rows = self._claim()
+            except Exception as e:
+                self._count("errors", 1)
+                logger.error(f"[OUTBOX] Failed to claim outbox rows: {e}")
+                rows = []
+            if rows:
+                self._deliver(rows)
+                continue
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        res = get_client().rpc(CLAIM_OUTBOX_RPC, {"p_limit": self.batch_size, "p_lease_seconds": OUTBOX_LEASE_SECONDS}).execute()
+        rows = _response_data(res) or []
+        self._count("claimed", len(rows))
+        return rows
+
+    def _deliver(self, rows: List[Dict[str, Any]]):
+        # Import here to avoid initializing Firebase before it is needed
+        from .push_notifications import lookup_fcm_tokens, deliver_messages, get_messaging
+
+        error = None
+        delivered = [False] * len(rows)
+        try:
+            messaging = get_messaging()
+            if messaging is None:
+                raise RuntimeError("Firebase messaging unavailable")
+            tokens_by_user, lookup_failed = lookup_fcm_tokens([row["user_id"] for row in rows])
+            messages, owners = [], []
+            for i, row in enumerate(rows):
+                if row["user_id"] in lookup_failed:
+                    continue  # unknown devices, retried after the backoff
+                tokens = tokens_by_user.get(row["user_id"], [])
+                if not tokens:
+                    delivered[i] = True  # no devices left, nothing to retry
+                for token in tokens:
+                    messages.append(messaging.Message(
+                        notification=messaging.Notification(title=row["title"], body=row["body"]),
+                        data=row.get("data") or {},
+                        token=token,
+                    ))
+                    owners.append(i)
+            for i, ok in zip(owners, deliver_messages(messages)):
+                delivered[i] = delivered[i] or ok
+            undelivered = delivered.count(False)
+            if lookup_failed:
+                error = f"FCM token lookup failed for {len(lookup_failed)} users"
+            elif undelivered:
+                error = f"FCM delivery failed for {undelivered} of {len(rows)} notifications"
+        except Exception as e:
+            error = str(e)
+            logger.error(f"[OUTBOX] Error delivering {len(rows)} notifications: {e}", exc_info=True)
+
+        sent = [row["id"] for row, ok in zip(rows, delivered) if ok]
+        failed = [row for row, ok in zip(rows, delivered) if not ok]
+        try:
+            get_client().rpc(FINISH_OUTBOX_RPC, {
+                "p_sent": sent,
+                "p_failed": [row["id"] for row in failed],
+                "p_error": error,
+                "p_max_attempts": OUTBOX_MAX_ATTEMPTS,
+                "p_backoff_seconds": OUTBOX_BACKOFF_SECONDS,
+            }).execute()
+        except Exception as e:
+            # The lease runs out and the rows are claimed again
+            self._count("errors", 1)
+            logger.error(f"[OUTBOX] Failed to record outcome of {len(rows)} notifications: {e}")
+            return
+
+        dead = sum(1 for row in failed if row.get("attempts", 0) >= OUTBOX_MAX_ATTEMPTS)
+        self._count("sent", len(sent))
+        self._count("retried", len(failed) - dead)
+        self._count("dead", dead)
+        if dead:
+            logger.warning(f"[OUTBOX] Dead-lettered {dead} notifications after {OUTBOX_MAX_ATTEMPTS} attempts")
+        logger.info(f"[OUTBOX] Delivered {len(sent)} of {len(rows)} notifications")
+
+    def _count(self, key: str, value: int):
+        with self._lock:
+            self._stats[key] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "senders": len(self._threads)}
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,111 @@
+# backend/ai_services/core/pg_listen.py
+import importlib.util
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Direct (non-pooled) database URL for LISTEN; PostgREST cannot deliver
+# notifications and transaction poolers drop them
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+
+
+class InvalidationBackend:
+    """Source of changes made by other processes; the default has none."""
+
+    def start(self, on_invalidate: Callable[[Optional[str]], None]):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PostgresInvalidationBackend(InvalidationBackend):
+    """Listens on a Postgres channel fed by pg_notify triggers.
+
+    Every notification payload is handed to each started consumer. After a
+    lost connection they get None instead, since notifications sent in the
+    meantime are gone. One listener thread and connection serve all
+    consumers; it stops when the last one stops.
+    """
+
+    def __init__(self, dsn: str, channel: str, retry_delay: float = 5.0, name: str = "LISTEN"):
+        self._dsn = dsn
+        self._channel = channel
+        self._name = name
+        self._retry_delay = retry_delay
+        self._callbacks: List[Callable[[Optional[str]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_invalidate: Callable[[Optional[str]], None]):
+        with self._lock:
+            self._callbacks.append(on_invalidate)
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name=f"{self._channel}-listener", daemon=True)
+            self._thread.start()
+
+    def _dispatch(self, payload: Optional[str]):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"[{self._name}] Handler for {self._channel} failed: {e}")
+
+    def _listen(self):
+        import psycopg
+
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(self._dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {self._channel}")
+                    self._dispatch(None)
+                    logger.info(f"[{self._name}] Listening for changes on {self._channel}")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self._dispatch(notify.payload or None)
+            except Exception as e:
+                logger.error(f"[{self._name}] Listener on {self._channel} failed, retrying in {self._retry_delay}s: {e}")
+                self._stop.wait(self._retry_delay)
+
+    def stop(self):
+        with self._lock:
+            if self._callbacks:
+                self._callbacks.pop()
+            if self._callbacks or self._thread is None:
+                return
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        thread.join(timeout=5)
+
+
+_listeners: Dict[str, PostgresInvalidationBackend] = {}
+_listeners_lock = threading.Lock()
+
+
+def make_backend(setting: str, channel: str, name: str, what: str) -> InvalidationBackend:
+    """The backend for a "local" or "postgres" setting.
+
+    Falls back to local, with a warning naming `what`, when psycopg or
+    SUPABASE_DB_URL is missing. Consumers of the same channel share one
+    listener.
+    """
+    if setting != "postgres":
+        return InvalidationBackend()
+    if importlib.util.find_spec("psycopg") is None:
+        logger.warning(f"[{name}] psycopg is not installed, {what} stays local")
+    elif not SUPABASE_DB_URL:
+        logger.warning(f"[{name}] SUPABASE_DB_URL is not set, {what} stays local")
+    else:
+        with _listeners_lock:
+            if channel not in _listeners:
+                _listeners[channel] = PostgresInvalidationBackend(SUPABASE_DB_URL, channel=channel, name=name)
+            return _listeners[channel]
+    return InvalidationBackend()
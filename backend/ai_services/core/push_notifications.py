@@ -1,44 +1,63 @@
 import os
 import json
-from typing import List, Dict, Any
-from supabase import create_client, Client
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
 import logging
+from .supabase_client import get_client
+from .fcm_token_cache import fcm_token_cache
 
 logger = logging.getLogger(__name__)
 
-# Firebase Admin SDK
-FIREBASE_AVAILABLE = False
-firebase_admin = None
-credentials = None
+# Firebase Admin SDK (imported and initialized on first use, see init_firebase)
+FIREBASE_AVAILABLE = importlib.util.find_spec("firebase_admin") is not None
 messaging = None
+firebase_initialized = False
+_firebase_attempted = False
+_firebase_lock = threading.Lock()
 
-try:
-    import firebase_admin
-    from firebase_admin import credentials, messaging
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    print("Firebase Admin SDK not available. Install firebase-admin to enable FCM notifications.")
+if not FIREBASE_AVAILABLE:
+    logger.warning("Firebase Admin SDK not available. Install firebase-admin to enable FCM notifications.")
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL", "")
-supabase_key = os.getenv("SUPABASE_KEY", "")
-supabase: Client = create_client(supabase_url, supabase_key)
+# FCM accepts at most 500 messages per batch request
+FCM_BATCH_SIZE = 500
+# How many of those batches are in flight at once
+FCM_SEND_CONCURRENCY = int(os.getenv("FCM_SEND_CONCURRENCY", "4"))
+# Keep PostgREST in_() filters well below URL length limits
+IN_QUERY_CHUNK_SIZE = 200
+# FCM tokens are ~160 characters, so token filters use smaller chunks
+TOKEN_QUERY_CHUNK_SIZE = 50
+# firebase_admin error types meaning the registration token is gone for good
+DEAD_TOKEN_ERRORS = ("UnregisteredError", "SenderIdMismatchError")
 
-# Initialize Firebase Admin SDK
-firebase_initialized = False
-if FIREBASE_AVAILABLE and firebase_admin is not None:
-    try:
-        if not firebase_admin._apps:
-            # Try to initialize with default credentials (for development)
-            # In production, you would use a service account key file
-            try:
-                if credentials is not None:
+_send_executor: Optional[ThreadPoolExecutor] = None
+_stats_lock = threading.Lock()
+fanout_stats: Dict[str, Any] = {"messages": 0, "delivered": 0, "failed": 0, "batches": 0, "tokens_pruned": 0, "errors": {}}
+
+
+def init_firebase() -> bool:
+    """Initialize the Firebase Admin SDK once (thread-safe); returns whether FCM is usable"""
+    global messaging, firebase_initialized, _firebase_attempted
+    if firebase_initialized or _firebase_attempted or not FIREBASE_AVAILABLE:
+        return firebase_initialized
+    with _firebase_lock:
+        if _firebase_attempted:
+            return firebase_initialized
+        _firebase_attempted = True
+        try:
+            import firebase_admin
+            from firebase_admin import credentials, messaging as fcm_messaging
+            if not firebase_admin._apps:
+                # Try to initialize with default credentials (for development)
+                # In production, you would use a service account key file
+                try:
                     # Option 1: Use service account key file
                     cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
                     if cred_path and os.path.exists(cred_path):
                         cred = credentials.Certificate(cred_path)
                         firebase_admin.initialize_app(cred)
-                        print("Firebase Admin initialized with service account file")
+                        logger.info("Firebase Admin initialized with service account file")
                     # Option 2: Use service account key JSON string
                     elif os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY'):
                         cred_json = os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY')
@@ -46,25 +65,32 @@ if FIREBASE_AVAILABLE and firebase_admin is not None:
                             cred_dict = json.loads(cred_json)
                             cred = credentials.Certificate(cred_dict)
                             firebase_admin.initialize_app(cred)
-                        print("Firebase Admin initialized with service account JSON")
+                        logger.info("Firebase Admin initialized with service account JSON")
                     # Option 3: Use default credentials (for some hosting environments)
                     else:
                         cred = credentials.ApplicationDefault()
                         firebase_admin.initialize_app(cred)
-                        print("Firebase Admin initialized with default credentials")
-            except ValueError:
-                # If default credentials don't work, initialize without credentials for now
-                # You'll need to add a service account key file for production
-                firebase_admin.initialize_app()
-        firebase_initialized = True
-        print("Firebase Admin SDK initialized successfully")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
+                        logger.info("Firebase Admin initialized with default credentials")
+                except ValueError:
+                    # If default credentials don't work, initialize without credentials for now
+                    # You'll need to add a service account key file for production
+                    firebase_admin.initialize_app()
+            messaging = fcm_messaging
+            firebase_initialized = True
+            logger.info("Firebase Admin SDK initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing Firebase Admin SDK: {e}")
+    return firebase_initialized
+
+
+def get_messaging():
+    """Return the firebase_admin.messaging module, or None if FCM is unavailable"""
+    return messaging if init_firebase() else None
 
 def get_user_subscriptions(user_id: str) -> List[Dict[Any, Any]]:
     """Get all push subscriptions for a user"""
     try:
-        response = supabase.table("push_subscriptions").select("*").eq("user_id", user_id).execute()
+        response = get_client().table("push_subscriptions").select("*").eq("user_id", user_id).execute()
         # Handle both possible response formats
         data = None
         if hasattr(response, 'data'):
@@ -82,38 +108,158 @@ def get_user_subscriptions(user_id: str) -> List[Dict[Any, Any]]:
                 result.append(item)
         return result
     except Exception as e:
-        print(f"Error fetching subscriptions: {e}")
+        logger.error(f"Error fetching subscriptions: {e}")
         return []
 
 def get_user_fcm_tokens(user_id):
     """Get all FCM tokens for a specific user"""
     logger.info(f"[TOKEN] Retrieving FCM tokens for user {user_id}")
+    tokens = get_fcm_tokens_for_users([user_id]).get(user_id, [])
+    if tokens:
+        logger.info(f"[TOKEN] Found {len(tokens)} FCM tokens for user {user_id}")
+        logger.debug(f"[TOKEN] Tokens: {[token[:20] + '...' for token in tokens]}")
+    else:
+        logger.info(f"[TOKEN] No FCM tokens found for user {user_id}")
+    return tokens
+
+def chunked(items: List[Any], size: int) -> Iterable[List[Any]]:
+    """Yield successive slices of items with at most size elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def lookup_fcm_tokens(user_ids: List[str]) -> Tuple[Dict[str, List[str]], Set[str]]:
+    """Get FCM tokens for many users, from the token cache or with one in_() query per chunk of user IDs.
+
+    Returns the tokens of users that have devices and the users whose lookup
+    failed; users in neither have no devices.
+    """
+    unique_ids = list(dict.fromkeys(user_ids))
+    tokens_by_user = fcm_token_cache.get_many(unique_ids)
+    missing = [user_id for user_id in unique_ids if user_id not in tokens_by_user]
+    failed: Set[str] = set()
+    # Subscribe/unsubscribe during the read must not be overwritten by it
+    generation = fcm_token_cache.generation()
+    for chunk in chunked(missing, IN_QUERY_CHUNK_SIZE):
+        try:
+            response = get_client().table("push_subscriptions").select("user_id, fcm_token").in_("user_id", chunk).execute()
+            data = getattr(response, 'data', response.get('data') if isinstance(response, dict) else None) if response else None
+            # Users without devices are cached too, so they cost no query next time
+            fetched: Dict[str, List[str]] = {user_id: [] for user_id in chunk}
+            for item in data or []:
+                if item.get('fcm_token'):
+                    fetched.setdefault(item['user_id'], []).append(item['fcm_token'])
+            fcm_token_cache.set_many(fetched, since=generation)
+            tokens_by_user.update(fetched)
+        except Exception as e:
+            logger.error(f"[TOKEN] Error fetching FCM tokens for {len(chunk)} users: {e}", exc_info=True)
+            failed.update(chunk)
+    tokens_by_user = {user_id: tokens for user_id, tokens in tokens_by_user.items() if tokens}
+    logger.info(f"[TOKEN] Found tokens for {len(tokens_by_user)} of {len(unique_ids)} users ({len(missing)} not cached, {len(failed)} failed)")
+    return tokens_by_user, failed
+
+def get_fcm_tokens_for_users(user_ids: List[str]) -> Dict[str, List[str]]:
+    """Get FCM tokens for many users; users whose lookup failed are left out"""
+    return lookup_fcm_tokens(user_ids)[0]
+
+def is_dead_token_error(exc: Optional[Exception]) -> bool:
+    """Whether an FCM send error means the token should be removed."""
+    if exc is None:
+        return False
+    return type(exc).__name__ in DEAD_TOKEN_ERRORS or getattr(exc, "code", None) == "NOT_FOUND"
+
+def remove_fcm_tokens(tokens: List[str]) -> int:
+    """Delete push subscriptions for dead tokens with one in_() delete per chunk"""
+    removed = 0
+    for chunk in chunked(list(dict.fromkeys(tokens)), TOKEN_QUERY_CHUNK_SIZE):
+        try:
+            response = get_client().table("push_subscriptions").delete().in_("fcm_token", chunk).execute()
+            data = getattr(response, 'data', response.get('data') if isinstance(response, dict) else None) if response else None
+            fcm_token_cache.invalidate_many(item.get('user_id') for item in data or [])
+            # Count the rows actually deleted; tokens may already be gone
+            removed += len(data or [])
+        except Exception as e:
+            logger.error(f"[TOKEN] Error removing {len(chunk)} dead FCM tokens: {e}", exc_info=True)
+    if removed:
+        with _stats_lock:
+            fanout_stats["tokens_pruned"] += removed
+        logger.info(f"[TOKEN] Removed {removed} dead FCM tokens")
+    return removed
+
+def _get_send_executor() -> ThreadPoolExecutor:
+    global _send_executor
+    if _send_executor is None:
+        with _stats_lock:
+            if _send_executor is None:
+                _send_executor = ThreadPoolExecutor(max_workers=FCM_SEND_CONCURRENCY, thread_name_prefix="fcm-send")
+    return _send_executor
+
+def _send_batch(batch: List[Any]) -> Tuple[List[bool], List[str]]:
+    """Send one batch with send_each; returns (per-message success, dead tokens)."""
     try:
-        response = supabase.table("push_subscriptions").select("fcm_token").eq("user_id", user_id).execute()
-        # Handle both possible response formats
-        data = None
-        if hasattr(response, 'data'):
-            data = getattr(response, 'data', None)
-        elif isinstance(response, dict):
-            data = response.get('data')
-        
-        if data:
-            tokens = [item['fcm_token'] for item in data if item.get('fcm_token')]
-            logger.info(f"[TOKEN] Found {len(tokens)} FCM tokens for user {user_id}")
-            logger.debug(f"[TOKEN] Tokens: {[token[:20] + '...' for token in tokens]}")
-            return tokens
-        else:
-            logger.info(f"[TOKEN] No FCM tokens found for user {user_id}")
-            return []
+        response = messaging.send_each(batch)
     except Exception as e:
-        logger.error(f"[TOKEN] Error fetching FCM tokens for user {user_id}: {e}", exc_info=True)
+        logger.error(f"[BATCH_SEND] Error sending batch of {len(batch)} messages: {e}", exc_info=True)
+        with _stats_lock:
+            fanout_stats["failed"] += len(batch)
+        return [False] * len(batch), []
+
+    dead = []
+    errors: Dict[str, int] = {}
+    for message, result in zip(batch, response.responses):
+        if result.success:
+            continue
+        name = type(result.exception).__name__
+        errors[name] = errors.get(name, 0) + 1
+        if is_dead_token_error(result.exception) and getattr(message, "token", None):
+            dead.append(message.token)
+    with _stats_lock:
+        fanout_stats["delivered"] += response.success_count
+        fanout_stats["failed"] += response.failure_count
+        for name, count in errors.items():
+            fanout_stats["errors"][name] = fanout_stats["errors"].get(name, 0) + count
+    logger.info(f"[BATCH_SEND] Sent batch of {len(batch)}: {response.success_count} success, {response.failure_count} failures {errors or ''}")
+    return [result.success for result in response.responses], dead
+
+def deliver_messages(messages: List[Any]) -> List[bool]:
+    """Send prepared FCM messages with send_each in batches of FCM_BATCH_SIZE.
+
+    Up to FCM_SEND_CONCURRENCY batches are sent at once. Tokens that FCM
+    reports as unregistered are deleted afterwards in bulk. Returns whether
+    each message was delivered, in order.
+    """
+    if not init_firebase():
+        logger.error("[BATCH_SEND] Firebase not available or not initialized. Cannot send FCM notifications.")
+        return [False] * len(messages)
+    if not messages:
         return []
 
+    batches = list(chunked(messages, FCM_BATCH_SIZE))
+    with _stats_lock:
+        fanout_stats["messages"] += len(messages)
+        fanout_stats["batches"] += len(batches)
+    if len(batches) == 1:
+        results = [_send_batch(batches[0])]
+    else:
+        results = list(_get_send_executor().map(_send_batch, batches))
+
+    dead = [token for _, batch_dead in results for token in batch_dead]
+    if dead:
+        remove_fcm_tokens(dead)
+    return [ok for batch_results, _ in results for ok in batch_results]
+
+def send_messages(messages: List[Any]) -> int:
+    """Send prepared FCM messages; returns the number delivered successfully."""
+    return sum(deliver_messages(messages))
+
+def push_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {**fanout_stats, "errors": dict(fanout_stats["errors"]), "concurrency": FCM_SEND_CONCURRENCY}
+
 def send_push_notification_to_token(token, title, body, data=None):
     """Send a push notification to a specific FCM token"""
     logger.info(f"[TOKEN_SEND] Sending push notification to token: {token[:20]}...")
     
-    if not FIREBASE_AVAILABLE or not firebase_initialized or messaging is None:
+    if not init_firebase():
         logger.error("[TOKEN_SEND] Firebase not available or not initialized. Cannot send FCM notifications.")
         return False
         
@@ -135,48 +281,34 @@ def send_push_notification_to_token(token, title, body, data=None):
     except Exception as e:
         logger.error(f"[TOKEN_SEND] Error sending push notification: {e}", exc_info=True)
         # Handle various FCM exceptions
-        error_str = str(e)
-        if "Unregistered" in error_str or "not registered" in error_str.lower():
-            logger.info(f"[TOKEN_SEND] FCM token {token[:20]}... is unregistered. Removing subscription.")
-            try:
-                supabase.table("push_subscriptions").delete().eq("fcm_token", token).execute()
-            except Exception as delete_error:
-                logger.error(f"[TOKEN_SEND] Error removing expired subscription: {delete_error}")
-        elif "SenderIdMismatch" in error_str:
-            logger.warning(f"[TOKEN_SEND] FCM token {token[:20]}... has a sender ID mismatch.")
-        elif "QuotaExceeded" in error_str:
+        if is_dead_token_error(e):
+            logger.info(f"[TOKEN_SEND] FCM token {token[:20]}... is no longer valid ({type(e).__name__}). Removing subscription.")
+            remove_fcm_tokens([token])
+        elif type(e).__name__ == "QuotaExceededError":
             logger.error("[TOKEN_SEND] FCM quota exceeded.")
         return False
 
 def send_multicast_notification_to_tokens(tokens, title, body, data=None):
-    """Send a push notification to multiple FCM tokens"""
-    if not FIREBASE_AVAILABLE or not firebase_initialized or messaging is None:
-        print("Firebase not available or not initialized. Cannot send FCM notifications.")
-        return None
-        
-    try:
-        message = messaging.MulticastMessage(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            data=data or {},
-            tokens=tokens,
-        )
-        
-        response = messaging.send_each_for_multicast(message)
-        logger.info(f"Successfully sent messages: {response.success_count} success, {response.failure_count} failures")
-        return response
-    except Exception as e:
-        logger.error(f"Error sending multicast notification: {e}")
+    """Send a push notification to multiple FCM tokens.
+
+    Returns the number of devices reached, or None if FCM is unavailable.
+    """
+    if not init_firebase():
+        logger.error("Firebase not available or not initialized. Cannot send FCM notifications.")
         return None
 
+    notification = messaging.Notification(title=title, body=body)
+    messages = [messaging.Message(notification=notification, data=data or {}, token=token) for token in tokens]
+    success_count = send_messages(messages)
+    logger.info(f"Successfully sent messages: {success_count} success, {len(messages) - success_count} failures")
+    return success_count
+
 def send_push_notification(user_id: str, title: str, body: str, url: str = "/") -> bool:
     """Send a push notification to all of a user's devices using Firebase Cloud Messaging"""
     logger.info(f"[PUSH] Attempting to send push notification to user {user_id}")
     logger.info(f"[PUSH] Notification details - Title: {title}, Body: {body}, URL: {url}")
     
-    if not FIREBASE_AVAILABLE or not firebase_initialized or messaging is None:
+    if not init_firebase():
         logger.error("[PUSH] Firebase not available or not initialized. Cannot send FCM notifications.")
         return False
         
@@ -205,12 +337,9 @@ def send_push_notification(user_id: str, title: str, body: str, url: str = "/")
         else:
             # Multiple tokens - send multicast notification
             logger.info(f"[PUSH] Sending multicast notification to {len(tokens)} tokens")
-            response = send_multicast_notification_to_tokens(tokens, title, body, data)
-            if response is not None:
-                success_count = getattr(response, 'success_count', 0) if response else 0
-                logger.info(f"[PUSH] Sent notification to user {user_id} ({len(tokens)} devices) - Success: {success_count}")
-                return hasattr(response, 'success_count') and response.success_count > 0
-            return False
+            success_count = send_multicast_notification_to_tokens(tokens, title, body, data)
+            logger.info(f"[PUSH] Sent notification to user {user_id} ({len(tokens)} devices) - Success: {success_count}")
+            return bool(success_count)
     except Exception as e:
         logger.error(f"[PUSH] Error sending notification to user {user_id}: {e}", exc_info=True)
         return False
@@ -218,11 +347,9 @@ def send_push_notification(user_id: str, title: str, body: str, url: str = "/")
 def send_notification_to_multiple_users(user_ids, title, body, data=None):
     """Send a push notification to multiple users"""
     try:
-        all_tokens = []
-        for user_id in user_ids:
-            tokens = get_user_fcm_tokens(user_id)
-            all_tokens.extend(tokens)
-            
+        tokens_by_user = get_fcm_tokens_for_users(list(user_ids))
+        all_tokens = [token for tokens in tokens_by_user.values() for token in tokens]
+
         if not all_tokens:
             logger.info(f"No tokens found for users {user_ids}, skipping notification")
             return None
@@ -232,9 +359,9 @@ def send_notification_to_multiple_users(user_ids, title, body, data=None):
             logger.info(f"Sent notification to 1 user (1 device)")
             return success
         else:
-            response = send_multicast_notification_to_tokens(all_tokens, title, body, data)
+            success_count = send_multicast_notification_to_tokens(all_tokens, title, body, data)
             logger.info(f"Sent notification to {len(user_ids)} users ({len(all_tokens)} devices)")
-            return response
+            return success_count
     except Exception as e:
         logger.error(f"Error sending notification to multiple users {user_ids}: {e}")
         raise e
\ No newline at end of file
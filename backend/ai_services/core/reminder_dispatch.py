@@ -0,0 +1,121 @@
+# backend/ai_services/core/reminder_dispatch.py
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from .supabase_client import get_client
+from .reminder_engine import reminder_engine
+from .notification_outbox import enqueue_notifications
+
+logger = logging.getLogger(__name__)
+
+NOTES_TABLE = "notes"
+NOTIFICATION_TABLE = "notification_settings"
+IN_QUERY_CHUNK_SIZE = 200
+# Seconds between attempts to write fired reminders to the outbox when it is
+# unreachable. Retries are safe: the outbox keeps one row per note and fire time.
+ENQUEUE_RETRY_DELAYS = (2, 10, 30, 120, 600)
+
+
+def _select_in(table: str, columns: str, column: str, values: List[Any]) -> List[Dict[str, Any]]:
+    """Runs one `column IN (...)` select per chunk of values and concatenates the rows."""
+    rows: List[Dict[str, Any]] = []
+    for i in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+        chunk = values[i:i + IN_QUERY_CHUNK_SIZE]
+        res = get_client().table(table).select(columns).in_(column, chunk).execute()
+        # Safely access data attribute in case res is a string or other type
+        data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+        rows.extend(data or [])
+    return rows
+
+
+def build_reminder_body(note: Dict[str, Any]) -> str:
+    """Notification body: note title plus the LLM summary when available."""
+    summary = note.get('summary', '')
+    if summary:
+        # Truncate summary to 200 characters to keep notification concise
+        truncated_summary = summary[:200] + "..." if len(summary) > 200 else summary
+        return f"{note.get('title', 'Untitled Note')}: {truncated_summary}"
+    return f"Reminder for note: {note.get('title') or note.get('id')}"
+
+
+def dispatch_due_reminders(reminders: List[Dict[str, Any]]) -> int:
+    """Queues one batch of due reminders for delivery.
+
+    Settings and notes for the whole batch are fetched with a bounded number
+    of in_() queries, expired or deleted reminders are unscheduled, and one
+    notification per remaining reminder is written to the outbox, which
+    delivers it independently of the scheduler. Returns the number queued.
+    """
+    if not reminders:
+        return 0
+
+    note_ids = list(dict.fromkeys(r["note_id"] for r in reminders))
+    settings = {
+        row["note_id"]: row
+        for row in _select_in(NOTIFICATION_TABLE, "note_id, notify, end_date", "note_id", note_ids)
+    }
+    now = datetime.now().astimezone()
+    active = []
+    for reminder in reminders:
+        setting = settings.get(reminder["note_id"])
+        if not setting or not setting.get("notify"):
+            reminder_engine.unschedule(reminder["note_id"])
+            continue
+        end_date = setting.get("end_date")
+        if end_date and now > datetime.fromisoformat(end_date.replace('Z', '+00:00')):
+            reminder_engine.unschedule(reminder["note_id"])
+            logger.info(f"[NOTIFY] Removed expired notification for note {reminder['note_id']}")
+            continue
+        active.append(reminder)
+
+    if not active:
+        return 0
+
+    notes = {
+        row["id"]: row
+        for row in _select_in(NOTES_TABLE, "id, title, summary", "id", [r["note_id"] for r in active])
+    }
+
+    rows = []
+    for reminder in active:
+        note = notes.get(reminder["note_id"])
+        if not note:
+            logger.info(f"[NOTIFY] No note found for note_id {reminder['note_id']}")
+            continue
+        rows.append({
+            "user_id": reminder["user_id"],
+            "note_id": note["id"],
+            "title": "Note Reminder",
+            "body": build_reminder_body(note),
+            "scheduled_for": datetime.fromtimestamp(reminder["fire_at"], timezone.utc).isoformat() if reminder.get("fire_at") else None,
+            "data": {
+                "url": f"/editor?id={note['id']}",
+                "click_action": "FLUTTER_NOTIFICATION_CLICK"  # For web compatibility
+            },
+        })
+
+    logger.info(f"[NOTIFY] Queueing {len(rows)} notifications for {len(active)} due reminders")
+    return _enqueue(rows)
+
+
+def _enqueue(rows: List[Dict[str, Any]], attempt: int = 0) -> int:
+    """Writes rows to the outbox, retrying in the background if that fails.
+
+    The engine has already moved the reminders on to their next occurrence,
+    so these rows are the only record of the ones that just fired.
+    """
+    try:
+        return enqueue_notifications(rows)
+    except Exception as e:
+        note_ids = [row["note_id"] for row in rows]
+        if attempt >= len(ENQUEUE_RETRY_DELAYS):
+            logger.error(f"[NOTIFY] Giving up on reminders for notes {note_ids} after {attempt + 1} attempts: {e}")
+            return 0
+        delay = ENQUEUE_RETRY_DELAYS[attempt]
+        logger.error(f"[NOTIFY] Failed to queue reminders for notes {note_ids}, retrying in {delay}s: {e}")
+        timer = threading.Timer(delay, _enqueue, args=(rows, attempt + 1))
+        timer.daemon = True
+        timer.start()
+        return 0
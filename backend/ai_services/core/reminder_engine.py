@@ -0,0 +1,400 @@
+# backend/ai_services/core/reminder_engine.py
+import hashlib
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .supabase_client import get_client
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_TABLE = "notification_settings"
+# PostgREST caps a single response at 1000 rows by default
+LOAD_PAGE_SIZE = 1000
+REMINDER_DISPATCH_WORKERS = int(os.getenv("REMINDER_DISPATCH_WORKERS", "2"))
+
+# Reminders are partitioned by a hash of user_id. With "none" this process
+# schedules every partition (single worker); with "lease" the API workers
+# share the partitions through lease rows (db/scheduler.sql).
+REMINDER_COORDINATION = os.getenv("REMINDER_COORDINATION", "none").lower()
+REMINDER_PARTITIONS = int(os.getenv("REMINDER_PARTITIONS", "64"))
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", "30"))
+# How often leases are renewed and reminders changed by other workers are picked up
+REMINDER_SYNC_INTERVAL = float(os.getenv("REMINDER_SYNC_INTERVAL", "10"))
+# Changes are re-read with this overlap to cover clock skew and slow commits
+SYNC_OVERLAP_SECONDS = 30
+ACQUIRE_PARTITIONS_RPC = "acquire_reminder_partitions"
+RELEASE_PARTITIONS_RPC = "release_reminder_partitions"
+ACTIVE_REMINDERS_RPC = "active_reminders"
+REMINDER_COLUMNS = "user_id, note_id, notify_type, notify_time, end_date"
+
+
+def reminder_partition(user_id: str, partitions: int = REMINDER_PARTITIONS) -> int:
+    """Partition of a user's reminders; matches reminder_partition() in db/scheduler.sql."""
+    return int(hashlib.md5(str(user_id).encode()).hexdigest()[:8], 16) % partitions
+
+
+def _parse_end_date(end_date: Optional[str]) -> Optional[float]:
+    """Parses an ISO end_date into a POSIX timestamp."""
+    if not end_date:
+        return None
+    return datetime.fromisoformat(end_date.replace('Z', '+00:00')).timestamp()
+
+
+def next_fire_time(notify_type: Optional[str], notify_time: Optional[str], after: float) -> float:
+    """Returns the next POSIX timestamp strictly after `after` at which a reminder fires.
+
+    Hourly reminders fire at the top of every hour, daily reminders at
+    notify_time (HH:MM, server local time, 09:00 when unset).
+    """
+    now = datetime.fromtimestamp(after).astimezone()
+    if notify_type == "hourly":
+        candidate = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    else:
+        hh, mm = map(int, notify_time.split(":")) if notify_time else (9, 0)
+        candidate = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        if candidate.timestamp() <= after:
+            candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class ReminderEngine:
+    """Time-ordered reminder scheduler backed by notification_settings.
+
+    All active reminders live in a single min-heap keyed by their next fire
+    time. One thread sleeps until the earliest entry is due, pops every entry
+    that is due (i.e. the whole minute bucket) and hands them to `on_due` as
+    one batch. Updates and removals are applied lazily: stale heap entries are
+    recognized by their version and skipped when popped.
+
+    With lease coordination each worker only schedules the user_id partitions
+    it holds a lease for. A sync thread renews the leases, drops reminders of
+    partitions handed to other workers, loads those of partitions taken over
+    and picks up reminders created or changed through other workers.
+    """
+
+    def __init__(self, db=None, coordination: str = REMINDER_COORDINATION, partitions: int = REMINDER_PARTITIONS):
+        self._db = db
+        self.coordination = coordination
+        self.partitions = partitions
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._owned: Set[int] = set() if coordination == "lease" else set(range(partitions))
+        self._lease_renewed = 0.0
+        self._synced_at: Optional[float] = None
+        self._sync_thread: Optional[threading.Thread] = None
+        self._sync_stop = threading.Event()
+        self._on_due: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+        self._heap: List[tuple] = []
+        self._reminders: Dict[int, Dict[str, Any]] = {}
+        self._versions: Dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = False
+        self._fired = 0
+        self._batches = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self, on_due: Callable[[List[Dict[str, Any]]], None]):
+        """Rebuilds state from the database and starts the timer thread."""
+        if self._running:
+            return
+        self._on_due = on_due
+        try:
+            if self.coordination == "lease":
+                self._renew_leases()
+            self.load_from_db()
+        except Exception as e:
+            # Don't keep the API from booting; with _synced_at still None the
+            # sync loop does the full load once the database is reachable
+            logger.error(f"[REMINDER] Failed to load reminders, starting empty: {e}")
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=REMINDER_DISPATCH_WORKERS, thread_name_prefix="reminder-dispatch")
+        self._thread = threading.Thread(target=self._run, name="reminder-engine", daemon=True)
+        self._thread.start()
+        self._sync_stop.clear()
+        self._sync_thread = threading.Thread(target=self._sync_loop, name="reminder-sync", daemon=True)
+        self._sync_thread.start()
+        logger.info(f"[REMINDER] Engine started with {len(self._reminders)} active reminders in {len(self._owned)}/{self.partitions} partitions")
+
+    def stop(self):
+        self._sync_stop.set()
+        if self._sync_thread:
+            self._sync_thread.join(timeout=5)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        if self.coordination == "lease":
+            # Let the remaining workers take over without waiting for the leases to expire
+            try:
+                (self._db or get_client()).rpc(RELEASE_PARTITIONS_RPC, {"p_owner": self.owner}).execute()
+            except Exception as e:
+                logger.error(f"[REMINDER] Failed to release reminder partitions: {e}")
+        logger.info("[REMINDER] Engine stopped")
+
+    def load_from_db(self):
+        """Loads every active reminder of the owned partitions, page by page."""
+        started = time.time()
+        rows = self._fetch(self._owned_partitions(), None)
+        with self._cond:
+            self._heap.clear()
+            self._reminders.clear()
+            for row in rows:
+                entry = self._make_entry(row, time.time())
+                if entry:
+                    self._heap.append(entry)
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+        self._synced_at = started
+        logger.info(f"[REMINDER] Loaded {len(self._reminders)} reminders from {NOTIFICATION_TABLE}")
+
+    def _fetch(self, partitions: Optional[List[int]], changed_since: Optional[str]) -> List[Dict[str, Any]]:
+        """Active reminders of the given partitions (all when None), optionally
+        only those updated since changed_since."""
+        if partitions is not None and not partitions:
+            return []
+        db = self._db or get_client()
+        now = datetime.now().astimezone().isoformat()
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            if partitions is None:
+                query = db.table(NOTIFICATION_TABLE).select(REMINDER_COLUMNS).eq("notify", True).gt("end_date", now)
+                if changed_since:
+                    query = query.gte("updated_at", changed_since)
+            else:
+                query = db.rpc(ACTIVE_REMINDERS_RPC, {
+                    "p_partitions": partitions,
+                    "p_count": self.partitions,
+                    "p_changed_since": changed_since,
+                }).select(REMINDER_COLUMNS)
+            res = query.order("id").range(start, start + LOAD_PAGE_SIZE - 1).execute()
+            data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+            if not data:
+                break
+            rows.extend(data)
+            if len(data) < LOAD_PAGE_SIZE:
+                break
+            start += LOAD_PAGE_SIZE
+        return rows
+
+    # -----------------------------
+    # Partition ownership
+    # -----------------------------
+    def _owned_partitions(self) -> Optional[List[int]]:
+        """Owned partitions for _fetch; None stands for all of them."""
+        if self.coordination != "lease":
+            return None
+        with self._cond:
+            return sorted(self._owned)
+
+    def _owns(self, user_id: str) -> bool:
+        return self.coordination != "lease" or reminder_partition(user_id, self.partitions) in self._owned
+
+    def _lease_expired(self) -> bool:
+        return self.coordination == "lease" and time.monotonic() - self._lease_renewed >= REMINDER_LEASE_SECONDS
+
+    def _renew_leases(self):
+        """Renews this worker's leases and applies partitions gained or lost."""
+        attempted = time.monotonic()
+        try:
+            res = (self._db or get_client()).rpc(ACQUIRE_PARTITIONS_RPC, {
+                "p_owner": self.owner,
+                "p_partitions": self.partitions,
+                "p_lease_seconds": REMINDER_LEASE_SECONDS,
+            }).execute()
+            data = getattr(res, 'data', res.get('data') if isinstance(res, dict) else None) if res else None
+            owned = {int(p) for p in data or []}
+            # Measured from before the call so the local view never outlives the lease
+            self._lease_renewed = attempted
+        except Exception as e:
+            logger.error(f"[REMINDER] Failed to renew reminder partition leases: {e}")
+            if not self._lease_expired():
+                return
+            # Other workers may hold these partitions by now
+            owned = set()
+
+        with self._cond:
+            lost = self._owned - owned
+            gained = owned - self._owned
+            self._owned = owned
+            if lost:
+                for note_id, reminder in list(self._reminders.items()):
+                    if reminder["_partition"] in lost:
+                        del self._reminders[note_id]
+                        self._versions[note_id] = self._versions.get(note_id, 0) + 1
+        if gained:
+            self._add_rows(self._fetch(sorted(gained), None))
+        if lost or gained:
+            logger.info(f"[REMINDER] Partitions changed: +{len(gained)} -{len(lost)}, now owning {len(owned)}/{self.partitions}")
+
+    # -----------------------------
+    # Sync
+    # -----------------------------
+    def sync(self):
+        """Renews leases and schedules reminders changed since the last sync,
+        including those saved through other workers."""
+        started = time.time()
+        if self.coordination == "lease":
+            self._renew_leases()
+        since = None
+        if self._synced_at is not None:
+            since = datetime.fromtimestamp(self._synced_at - SYNC_OVERLAP_SECONDS, timezone.utc).isoformat()
+        self._add_rows(self._fetch(self._owned_partitions(), since))
+        self._synced_at = started
+
+    def _sync_loop(self):
+        while not self._sync_stop.wait(REMINDER_SYNC_INTERVAL):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"[REMINDER] Reminder sync failed: {e}")
+
+    def _add_rows(self, rows: Iterable[Dict[str, Any]]):
+        with self._cond:
+            for row in rows:
+                if not self._owns(row["user_id"]):
+                    continue  # partition lost while the rows were loading
+                entry = self._make_entry(row, time.time())
+                if entry:
+                    heapq.heappush(self._heap, entry)
+            if len(self._heap) > 2 * len(self._reminders) + LOAD_PAGE_SIZE:
+                self._compact()
+            self._cond.notify_all()
+
+    # -----------------------------
+    # Mutations
+    # -----------------------------
+    def schedule(self, user_id: str, note_id: int, notify_type: Optional[str], notify_time: Optional[str], end_date: Optional[str]):
+        """Adds or replaces the reminder for a note."""
+        row = {
+            "user_id": user_id,
+            "note_id": note_id,
+            "notify_type": (notify_type or "daily").lower(),
+            "notify_time": notify_time,
+            "end_date": end_date,
+        }
+        with self._cond:
+            if not self._owns(user_id):
+                return  # scheduled by the worker owning the user's partition on its next sync
+            entry = self._make_entry(row, time.time())
+            if entry is None:
+                return
+            heapq.heappush(self._heap, entry)
+            if len(self._heap) > 2 * len(self._reminders) + LOAD_PAGE_SIZE:
+                self._compact()
+            if self._heap[0] is entry:
+                self._cond.notify_all()
+        logger.info(f"[REMINDER] Scheduled {row['notify_type']} reminder for note {note_id}")
+
+    def unschedule(self, note_id: int):
+        """Removes the reminder for a note, if any."""
+        with self._cond:
+            if self._reminders.pop(note_id, None) is not None:
+                self._versions[note_id] = self._versions.get(note_id, 0) + 1
+                logger.info(f"[REMINDER] Removed reminder for note {note_id}")
+
+    def _compact(self):
+        """Drops stale heap entries left behind by updates; caller holds the lock."""
+        self._heap = [e for e in self._heap if self._versions.get(e[1]) == e[2] and e[1] in self._reminders]
+        heapq.heapify(self._heap)
+
+    def _make_entry(self, row: Dict[str, Any], after: float) -> Optional[tuple]:
+        """Registers row and returns its heap entry; caller holds the lock."""
+        note_id = row["note_id"]
+        try:
+            end_ts = _parse_end_date(row.get("end_date"))
+            fire_at = next_fire_time(row.get("notify_type"), row.get("notify_time"), after)
+        except (ValueError, TypeError) as e:
+            logger.error(f"[REMINDER] Invalid reminder settings for note {note_id}: {e}")
+            return None
+        version = self._versions.get(note_id, 0) + 1
+        self._versions[note_id] = version
+        if end_ts is not None and fire_at > end_ts:
+            self._reminders.pop(note_id, None)
+            return None
+        self._reminders[note_id] = dict(row, _end_ts=end_ts, _partition=reminder_partition(row.get("user_id"), self.partitions))
+        return (fire_at, note_id, version)
+
+    # -----------------------------
+    # Timer loop
+    # -----------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                if self._lease_expired():
+                    # Hold reminders until the leases are renewed or given up
+                    self._cond.wait(1.0)
+                    continue
+                fire_at = self._heap[0][0]
+                delay = fire_at - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                due = self._pop_due(time.time())
+
+            if due:
+                self._batches += 1
+                self._fired += len(due)
+                logger.info(f"[REMINDER] Firing batch of {len(due)} reminders (lag {self._last_lag * 1000:.0f} ms)")
+                self._executor.submit(self._dispatch, due)
+
+    def _pop_due(self, now: float) -> List[Dict[str, Any]]:
+        """Pops all due entries, re-arms recurring ones; caller holds the lock."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, note_id, version = heapq.heappop(self._heap)
+            if self._versions.get(note_id) != version or note_id not in self._reminders:
+                continue  # stale entry
+            self._last_lag = now - fire_at
+            self._max_lag = max(self._max_lag, self._last_lag)
+            reminder = self._reminders[note_id]
+            due.append(dict({k: v for k, v in reminder.items() if not k.startswith("_")}, fire_at=fire_at))
+            entry = self._make_entry(reminder, fire_at)
+            if entry:
+                heapq.heappush(self._heap, entry)
+        return due
+
+    def _dispatch(self, due: List[Dict[str, Any]]):
+        try:
+            self._on_due(due)
+        except Exception as e:
+            logger.error(f"[REMINDER] Error dispatching reminder batch: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": len(self._reminders),
+                "heap_size": len(self._heap),
+                "next_fire_in": round(self._heap[0][0] - time.time(), 3) if self._heap else None,
+                "fired": self._fired,
+                "batches": self._batches,
+                "last_lag_ms": round(self._last_lag * 1000, 1),
+                "max_lag_ms": round(self._max_lag * 1000, 1),
+                "coordination": self.coordination,
+                "partitions_owned": len(self._owned),
+                "partitions": self.partitions,
+            }
+
+
+reminder_engine = ReminderEngine()
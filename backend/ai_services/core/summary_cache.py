@@ -0,0 +1,101 @@
+# backend/ai_services/core/summary_cache.py
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_content(content: str) -> str:
+    """Collapses whitespace so formatting-only edits map to the same summary."""
+    return re.sub(r"\s+", " ", content or "").strip()
+
+
+def content_hash(content: str, prompt_version: str) -> str:
+    """Cache key for a summary: hash of the prompt version and normalized content."""
+    return hashlib.sha256(f"{prompt_version}\0{normalize_content(content)}".encode()).hexdigest()
+
+
+class SummaryCache:
+    """Two-tier summary cache: an in-process LRU in front of an optional SQLite file.
+
+    Entries are immutable (same hash, same summary), so the SQLite tier never
+    needs invalidation; bumping the prompt version simply changes every key.
+    """
+
+    def __init__(self, maxsize: int = 10000, db_path: Optional[str] = None, prompt_tokens: int = 0):
+        self._memory = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._prompt_tokens = prompt_tokens
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "tokens_saved_est": 0}
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                logger.info(f"[SUMMARY_CACHE] Using on-disk cache at {db_path}")
+            except sqlite3.Error as e:
+                logger.error(f"[SUMMARY_CACHE] Could not open {db_path}, using memory only: {e}")
+                self._db = None
+
+    def get(self, key: str, content: str = "", count: bool = True) -> Optional[str]:
+        """The cached summary, or None.
+
+        count=False leaves the hit/miss counters alone, for a second lookup
+        of content whose first lookup was already counted.
+        """
+        summary = self._memory.get(key)
+        if summary is not None:
+            if count:
+                self._count_hit("memory_hits", content, summary)
+            return summary
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._memory.set(key, row[0])
+                if count:
+                    self._count_hit("disk_hits", content, row[0])
+                return row[0]
+        if count:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, summary: str):
+        self._memory.set(key, summary)
+        self._stats["stores"] += 1
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO summaries (key, summary, created_at) VALUES (?, ?, ?)",
+                        (key, summary, time.time()),
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"[SUMMARY_CACHE] Failed to persist summary: {e}")
+
+    def _count_hit(self, kind: str, content: str, summary: str):
+        # Rough token estimate (~4 characters per token) of the skipped LLM call
+        self._stats[kind] += 1
+        self._stats["tokens_saved_est"] += self._prompt_tokens + (len(content) + len(summary)) // 4
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._memory),
+            "disk": self._db is not None,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,242 @@
+# backend/ai_services/core/summary_queue.py
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryQueue:
+    """Bounded worker pool for background note summarization.
+
+    Jobs are queued per user and workers take them round-robin across users,
+    so one user's bulk import cannot starve everybody else. The backlog is
+    capped globally and per user; `submit` returns False when a job is
+    rejected so the caller can fall back. Re-submitting a note that is still
+    pending only replaces its content instead of queueing a second LLM call.
+
+    With a batch_handler, a worker that picks up a job keeps collecting up to
+    batch_size jobs for batch_window seconds and processes them in one call.
+    `name` names the worker threads and `log_tag` prefixes the log lines, for
+    queues that run other jobs than summaries.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[int, str], Any],
+        workers: int = 4,
+        max_size: int = 1000,
+        max_per_user: int = 200,
+        batch_handler: Optional[Callable[[List[Tuple[int, str]]], Any]] = None,
+        batch_size: int = 1,
+        batch_window: float = 0.0,
+        name: str = "summary",
+        log_tag: str = "SUMMARY",
+    ):
+        self.name = name
+        self.log_tag = log_tag
+        self._handler = handler
+        self._batch_handler = batch_handler
+        self.batch_size = batch_size if batch_handler else 1
+        self.batch_window = batch_window
+        self.workers = workers
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self._queues: Dict[str, Deque[int]] = {}
+        self._users: Deque[str] = deque()
+        self._pending: Dict[int, tuple] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._accepting = True
+        self._running = False
+        self._in_flight = 0
+        self._running_ids: Dict[int, int] = {}
+        self._stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "cancelled": 0, "processed": 0, "failed": 0, "batches": 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._max_wait = 0.0
+
+    def start(self):
+        """Starts the worker threads (idempotent)."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[{self.log_tag}] Started {self.workers} {self.name} workers")
+
+    def submit(self, user_id: str, note_id: int, content: str, timeout: Optional[float] = None) -> bool:
+        """Queues a note for summarization.
+
+        With a timeout the caller waits up to that long for room in the
+        backlog; otherwise a full backlog rejects the job immediately.
+        """
+        if not self._running and self._accepting:
+            self.start()
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._cond:
+            if not self._accepting:
+                self._stats["rejected"] += 1
+                return False
+            if note_id in self._pending:
+                queued_user, _, enqueued_at = self._pending[note_id]
+                self._pending[note_id] = (queued_user, content, enqueued_at)
+                self._stats["coalesced"] += 1
+                return True
+            while len(self._pending) >= self.max_size or len(self._queues.get(user_id, ())) >= self.max_per_user:
+                remaining = deadline - time.monotonic() if deadline else 0
+                if remaining <= 0:
+                    self._stats["rejected"] += 1
+                    logger.warning(f"[{self.log_tag}] Backlog full, rejected {self.name} job for note {note_id}")
+                    return False
+                self._cond.wait(remaining)
+
+            queue = self._queues.get(user_id)
+            if queue is None:
+                queue = self._queues[user_id] = deque()
+                self._users.append(user_id)
+            queue.append(note_id)
+            self._pending[note_id] = (user_id, content, time.monotonic())
+            self._stats["submitted"] += 1
+            self._cond.notify_all()
+            return True
+
+    def cancel(self, note_id: int) -> bool:
+        """Removes a job that has not been picked up yet; False if there is none."""
+        with self._cond:
+            job = self._pending.pop(note_id, None)
+            if job is None:
+                return False
+            user_id = job[0]
+            queue = self._queues[user_id]
+            queue.remove(note_id)
+            if not queue:
+                del self._queues[user_id]
+                self._users.remove(user_id)
+            self._stats["cancelled"] += 1
+            self._cond.notify_all()
+            return True
+
+    def is_running(self, note_id: int) -> bool:
+        """Whether a worker is processing a job for the note right now."""
+        with self._cond:
+            return note_id in self._running_ids
+
+    def _next_job(self) -> Optional[tuple]:
+        """Pops the next job round-robin across users; caller holds the lock."""
+        while self._users:
+            user_id = self._users.popleft()
+            queue = self._queues[user_id]
+            note_id = queue.popleft()
+            if queue:
+                self._users.append(user_id)
+            else:
+                del self._queues[user_id]
+            _, content, enqueued_at = self._pending.pop(note_id)
+            return note_id, content, enqueued_at
+        return None
+
+    def _collect_batch(self, first: tuple) -> List[tuple]:
+        """Gathers more jobs for up to batch_window seconds; caller holds the lock."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            job = self._next_job()
+            if job is not None:
+                batch.append(job)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._running:
+                break
+            self._cond.wait(remaining)
+        return batch
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if not self._running:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                batch = self._collect_batch(job) if self.batch_size > 1 else [job]
+                self._in_flight += len(batch)
+                for note_id, _, _ in batch:
+                    self._running_ids[note_id] = self._running_ids.get(note_id, 0) + 1
+                # Wake producers waiting for room in the backlog
+                self._cond.notify_all()
+
+            started = time.monotonic()
+            ok = True
+            try:
+                if len(batch) > 1:
+                    self._batch_handler([(note_id, content) for note_id, content, _ in batch])
+                else:
+                    note_id, content, _ = batch[0]
+                    self._handler(note_id, content)
+            except Exception as e:
+                ok = False
+                logger.error(f"[{self.log_tag}] {self.name.capitalize()} job for notes {[job[0] for job in batch]} failed: {e}")
+            finished = time.monotonic()
+
+            with self._cond:
+                self._in_flight -= len(batch)
+                for note_id, _, _ in batch:
+                    if self._running_ids[note_id] > 1:
+                        self._running_ids[note_id] -= 1
+                    else:
+                        del self._running_ids[note_id]
+                self._stats["processed" if ok else "failed"] += len(batch)
+                self._stats["batches"] += 1
+                for _, _, enqueued_at in batch:
+                    wait = started - enqueued_at
+                    self._wait_total += wait
+                    self._max_wait = max(self._max_wait, wait)
+                self._run_total += (finished - started) * len(batch)
+                self._cond.notify_all()
+
+    def stop(self, drain: bool = True, timeout: float = 30.0):
+        """Stops accepting jobs and shuts the workers down.
+
+        With drain=True the remaining backlog is processed first, for at most
+        `timeout` seconds; whatever is left after that is dropped.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._accepting = False
+            if drain:
+                while (self._pending or self._in_flight) and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+            dropped = len(self._pending)
+            self._queues.clear()
+            self._users.clear()
+            self._pending.clear()
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        if dropped:
+            logger.warning(f"[{self.log_tag}] Dropped {dropped} pending {self.name} jobs on shutdown")
+        logger.info(f"[{self.log_tag}] {self.name.capitalize()} workers stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            done = self._stats["processed"] + self._stats["failed"]
+            return {
+                **self._stats,
+                "depth": len(self._pending),
+                "users_waiting": len(self._queues),
+                "in_flight": self._in_flight,
+                "workers": self.workers,
+                "avg_wait_ms": round(self._wait_total / done * 1000, 1) if done else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+                "avg_run_ms": round(self._run_total / done * 1000, 1) if done else 0.0,
+            }
@@ -1,6 +1,7 @@
 # ai_services/supabase_client.py
-from supabase import create_client
 import os
+import threading
+from typing import Any, Dict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,5 +16,154 @@ if not SUPABASE_URL:
 if not SUPABASE_KEY:
     raise ValueError("SUPABASE_KEY environment variable is not set")
 
-# Create Supabase client with service role key for backend operations
-client = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+# -----------------------------------
+# CLIENT REGISTRY
+# -----------------------------------
+# Every module gets its Supabase clients from here. Each process holds one
+# sync and one async client, each backed by a single pooled keep-alive httpx
+# transport shared by PostgREST, Auth and RPC calls. Clients are created on
+# first use so that importing the API stays cheap.
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", str(SUPABASE_MAX_CONNECTIONS)))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "10"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_client = None
+_async_client = None
+_http_client = None
+_async_http_client = None
+_pool_stats: Dict[str, Dict[str, int]] = {
+    "sync": {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0},
+    "async": {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0},
+}
+
+
+def _track(kind: str, delta: int, error: bool = False):
+    with _stats_lock:
+        stats = _pool_stats[kind]
+        stats["in_flight"] += delta
+        if delta > 0:
+            stats["requests"] += 1
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        if error:
+            stats["errors"] += 1
+
+
+def _transport_options() -> Dict[str, Any]:
+    import httpx
+    return {
+        "limits": httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+        "http2": SUPABASE_HTTP2,
+    }
+
+
+def _timeout():
+    import httpx
+    return httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT, pool=SUPABASE_POOL_TIMEOUT)
+
+
+def _build_http_client():
+    import httpx
+
+    class CountingTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            _track("sync", 1)
+            try:
+                return super().handle_request(request)
+            except Exception:
+                _track("sync", 0, error=True)
+                raise
+            finally:
+                _track("sync", -1)
+
+    return httpx.Client(transport=CountingTransport(**_transport_options()), timeout=_timeout())
+
+
+def _build_async_http_client():
+    import httpx
+
+    class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            _track("async", 1)
+            try:
+                return await super().handle_async_request(request)
+            except Exception:
+                _track("async", 0, error=True)
+                raise
+            finally:
+                _track("async", -1)
+
+    return httpx.AsyncClient(transport=AsyncCountingTransport(**_transport_options()), timeout=_timeout())
+
+
+def get_client():
+    """Blocking Supabase client (service role) for background threads and scripts."""
+    global _client, _http_client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from supabase import create_client, ClientOptions
+                _http_client = _build_http_client()
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY, ClientOptions(httpx_client=_http_client))
+    return _client
+
+
+def get_async_client():
+    """Async Supabase client used by the FastAPI handlers."""
+    global _async_client, _async_http_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                from supabase import AsyncClient, AsyncClientOptions
+                _async_http_client = _build_async_http_client()
+                _async_client = AsyncClient(SUPABASE_URL, SUPABASE_KEY, AsyncClientOptions(httpx_client=_async_http_client))
+    return _async_client
+
+
+def _connection_counts(http_client) -> Dict[str, int]:
+    """Open/idle connection counts read from the httpcore pool (best effort)."""
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = 0
+    for connection in connections:
+        try:
+            idle += 1 if connection.is_idle() else 0
+        except Exception:
+            pass
+    return {"open_connections": len(connections), "idle_connections": idle}
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool configuration and utilization of the shared HTTP transports."""
+    stats: Dict[str, Any] = {
+        "max_connections": SUPABASE_MAX_CONNECTIONS,
+        "max_keepalive": SUPABASE_MAX_KEEPALIVE,
+        "http2": SUPABASE_HTTP2,
+    }
+    for kind, http_client in (("sync", _http_client), ("async", _async_http_client)):
+        with _stats_lock:
+            entry = dict(_pool_stats[kind], created=http_client is not None)
+        if http_client is not None:
+            entry.update(_connection_counts(http_client))
+            entry["utilization"] = round(entry["in_flight"] / SUPABASE_MAX_CONNECTIONS, 4)
+        stats[kind] = entry
+    return stats
+
+
+async def close_clients():
+    """Closes the pooled connections held by the registry's clients."""
+    global _client, _async_client, _http_client, _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+    if _http_client is not None:
+        _http_client.close()
+    _client = _async_client = _http_client = _async_http_client = None
@@ -0,0 +1,75 @@
+-- NOTE CHANGE FEED
+-- Announces note writes on the note_changes channel; API workers listen on it
+-- (NOTE_CHANGES_BACKEND=postgres) and push the events to GET /notes/changes,
+-- and drop their cached GET /notes responses (NOTE_CACHE_BACKEND=postgres).
+-- Requires notes.sql and notifications.sql.
+--
+-- Events are compact: {"user_id", "op", "id"} plus
+--   insert/update: "title", "updated_at"
+--   summary:       "summary" (only the summary changed, e.g. the background writer)
+--   reminder:      nothing more (the note's notification_settings row changed)
+-- Payloads near the 8000 byte NOTIFY limit drop title and summary; clients
+-- then fetch the note by id.
+create or replace function notify_note_change()
+returns trigger as $$
+declare
+  v_payload jsonb;
+begin
+  if tg_op = 'DELETE' then
+    v_payload := jsonb_build_object('user_id', old.user_id, 'op', 'delete', 'id', old.id);
+  elsif tg_op = 'UPDATE'
+    and new.title is not distinct from old.title
+    and new.content is not distinct from old.content
+    and new.metadata is not distinct from old.metadata then
+    if new.summary is not distinct from old.summary then
+      return null;  -- nothing a client shows has changed
+    end if;
+    v_payload := jsonb_build_object('user_id', new.user_id, 'op', 'summary', 'id', new.id, 'summary', new.summary);
+  else
+    v_payload := jsonb_build_object(
+      'user_id', new.user_id,
+      'op', lower(tg_op),
+      'id', new.id,
+      'title', new.title,
+      'updated_at', new.updated_at
+    );
+  end if;
+
+  if octet_length(v_payload::text) > 7500 then
+    v_payload := v_payload - 'title' - 'summary';
+  end if;
+  perform pg_notify('note_changes', v_payload::text);
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notes_notify_change on notes;
+create trigger notes_notify_change
+  after insert or update or delete on notes
+  for each row execute function notify_note_change();
+
+-- Reminder settings are part of the note responses, so their changes are
+-- announced too
+create or replace function notify_note_reminder_change()
+returns trigger as $$
+declare
+  v_row notification_settings%rowtype;
+begin
+  v_row := case when tg_op = 'DELETE' then old else new end;
+  if tg_op = 'UPDATE' and new is not distinct from old then
+    return null;
+  end if;
+  if tg_op = 'DELETE' and not exists (select 1 from notes where id = old.note_id) then
+    return null;  -- removed with its note, which has its own delete event
+  end if;
+  perform pg_notify('note_changes', jsonb_build_object(
+    'user_id', v_row.user_id, 'op', 'reminder', 'id', v_row.note_id
+  )::text);
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notification_settings_notify_change on notification_settings;
+create trigger notification_settings_notify_change
+  after insert or update or delete on notification_settings
+  for each row execute function notify_note_reminder_change();
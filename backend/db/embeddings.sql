@@ -0,0 +1,56 @@
+-- NOTE EMBEDDINGS
+-- Embeddings of note title + content, written by the background embedding
+-- workers (EMBEDDING_STORE=pgvector). Requires notes.sql and pgvector >= 0.8.
+-- The vector size must match EMBEDDING_DIM (the API logs an error at
+-- startup when it does not); change it in both function signatures too.
+create extension if not exists vector;
+
+create table if not exists note_embeddings (
+  note_id bigint primary key references notes(id) on delete cascade,
+  user_id uuid not null references users(id) on delete cascade,
+  content_hash text not null,  -- hash of the embedded text and embedding version
+  embedding vector(768) not null,
+  updated_at timestamptz default now()
+);
+
+create index if not exists note_embeddings_user_id_idx
+  on note_embeddings (user_id);
+
+create index if not exists note_embeddings_embedding_idx
+  on note_embeddings using hnsw (embedding vector_cosine_ops);
+
+-- Nearest notes of one user to p_embedding. The HNSW scan keeps going until
+-- enough of the user's rows were found (iterative scan), so the user filter
+-- does not starve the result.
+create or replace function match_note_embeddings(
+  p_user_id uuid,
+  p_embedding vector(768),
+  p_limit int default 10,
+  p_exclude bigint default null
+)
+returns table (note_id bigint, similarity real) as $$
+  select e.note_id, (1 - (e.embedding <=> p_embedding))::real
+  from note_embeddings e
+  where e.user_id = p_user_id
+    and (p_exclude is null or e.note_id <> p_exclude)
+  order by e.embedding <=> p_embedding
+  limit p_limit;
+$$ language sql stable
+  set search_path = public
+  set hnsw.iterative_scan = strict_order;
+
+-- Nearest notes to a stored note of the same user
+create or replace function similar_note_embeddings(p_user_id uuid, p_note_id bigint, p_limit int default 10)
+returns table (note_id bigint, similarity real) as $$
+  select m.note_id, m.similarity
+  from note_embeddings e
+  cross join lateral match_note_embeddings(p_user_id, e.embedding, p_limit, p_note_id) m
+  where e.note_id = p_note_id and e.user_id = p_user_id;
+$$ language sql stable set search_path = public;
+
+-- Size of the stored vectors, for the startup check against EMBEDDING_DIM
+create or replace function note_embedding_dim()
+returns int as $$
+  select atttypmod from pg_attribute
+  where attrelid = 'note_embeddings'::regclass and attname = 'embedding';
+$$ language sql stable set search_path = public;
@@ -0,0 +1,116 @@
+-- NOTE WRITE FUNCTIONS
+-- Called through PostgREST RPC so a note and its reminder are written in one
+-- round trip and one transaction. Requires notes.sql and notifications.sql.
+
+-- Inserts (p_note_id null) or updates a note and applies its reminder setting.
+-- p_summary is a cached summary for p_content_hash, if the caller has one;
+-- otherwise the summary is set to p_placeholder whenever the content changed
+-- and summary_stale tells the caller to generate a new one. content_hash is
+-- cleared along with the placeholder: it names the content the stored summary
+-- belongs to, and a placeholder belongs to none (so reverting an edit before
+-- its summary arrives is still seen as a change).
+create or replace function upsert_note_with_reminder(
+  p_user_id uuid,
+  p_note_id bigint,
+  p_title text,
+  p_content text,
+  p_metadata jsonb,
+  p_content_hash text,
+  p_summary text,
+  p_placeholder text,
+  p_notify boolean default false,
+  p_notify_type text default 'daily',
+  p_notify_time text default null,
+  p_end_date timestamptz default null
+)
+returns jsonb as $$
+declare
+  v_note notes%rowtype;
+  v_setting notification_settings%rowtype;
+  v_stale boolean;
+begin
+  if p_notify and p_end_date is null then
+    raise exception 'end_date is required when notify is True';
+  end if;
+
+  if p_note_id is null then
+    insert into notes (user_id, title, content, summary, content_hash, metadata)
+    values (
+      p_user_id, p_title, p_content,
+      coalesce(p_summary, p_placeholder),
+      case when p_summary is not null then p_content_hash end,
+      coalesce(p_metadata, '{}'::jsonb)
+    )
+    returning * into v_note;
+    v_stale := p_summary is null;
+  else
+    -- content_hash on the right-hand side is the stored (pre-update) value
+    update notes set
+      title = p_title,
+      content = p_content,
+      metadata = coalesce(p_metadata, '{}'::jsonb),
+      summary = case
+        when p_summary is not null then p_summary
+        when content_hash is distinct from p_content_hash then p_placeholder
+        else summary
+      end,
+      content_hash = case
+        when p_summary is not null then p_content_hash
+        when content_hash is distinct from p_content_hash then null
+        else content_hash
+      end,
+      updated_at = now()
+    where id = p_note_id and user_id = p_user_id
+    returning * into v_note;
+    if not found then
+      return jsonb_build_object('note', null, 'notification', null, 'summary_stale', false);
+    end if;
+    v_stale := p_summary is null and v_note.content_hash is distinct from p_content_hash;
+  end if;
+
+  if p_notify then
+    insert into notification_settings (user_id, note_id, notify, notify_type, notify_time, end_date)
+    values (p_user_id, v_note.id, true, lower(coalesce(p_notify_type, 'daily')), p_notify_time, p_end_date)
+    on conflict (note_id) do update set
+      notify = true,
+      notify_type = excluded.notify_type,
+      notify_time = excluded.notify_time,
+      end_date = excluded.end_date,
+      updated_at = now()
+    returning * into v_setting;
+  elsif p_note_id is not null then
+    delete from notification_settings where note_id = v_note.id and user_id = p_user_id;
+  end if;
+
+  return jsonb_build_object(
+    'note', to_jsonb(v_note),
+    'notification', case when p_notify then to_jsonb(v_setting) end,
+    'summary_stale', v_stale
+  );
+end;
+$$ language plpgsql set search_path = public;
+
+-- Stores generated summaries. Each element of p_summaries is {"id",
+-- "content", "summary", "content_hash"} (content_hash null for a preview
+-- fallback) and is written only while the note still holds the content it
+-- was generated from, so a job finishing after a newer edit is a no-op.
+-- Returns the notes that were updated.
+create or replace function write_note_summaries(p_summaries jsonb)
+returns table (id bigint, user_id uuid, summary text) as $$
+  update notes n set
+    summary = s.summary,
+    content_hash = s.content_hash
+  from jsonb_to_recordset(p_summaries) as s(id bigint, content text, summary text, content_hash text)
+  where n.id = s.id and n.content is not distinct from s.content
+  returning n.id, n.user_id, n.summary;
+$$ language sql set search_path = public;
+
+-- Deletes a note and its reminder; returns whether the note existed.
+create or replace function delete_note_with_reminder(p_user_id uuid, p_note_id bigint)
+returns boolean as $$
+begin
+  delete from notification_settings where note_id = p_note_id and user_id = p_user_id;
+  delete from notes where id = p_note_id and user_id = p_user_id;
+  return found;
+end;
+$$ language plpgsql set search_path = public;
@@ -5,7 +5,15 @@ create table if not exists notes (
   title text,
   content text,
   summary text,
+  content_hash text,  -- hash of the content (and prompt version) the summary was generated from
   metadata jsonb,
   created_at timestamptz default now(),
   updated_at timestamptz default now()
-);
\ No newline at end of file
+);
+
+-- Existing deployments
+alter table notes add column if not exists content_hash text;
+
+-- Note listing filters by user and pages on (updated_at, id)
+create index if not exists notes_user_id_updated_at_idx
+  on notes (user_id, updated_at desc, id desc);
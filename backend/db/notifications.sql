@@ -11,6 +11,16 @@ create table if not exists notification_settings (
   updated_at timestamptz default now()
 );
 
+-- One reminder per note: reminder lookups, the notes -> notification_settings
+-- embed and the upsert in note_functions.sql all key on note_id.
+-- Existing deployments: keep only the newest duplicate before adding the index.
+delete from notification_settings a
+  using notification_settings b
+  where a.note_id = b.note_id and a.id < b.id;
+drop index if exists notification_settings_note_id_idx;
+create unique index if not exists notification_settings_note_id_key
+  on notification_settings (note_id);
+
 -- PUSH SUBSCRIPTIONS TABLE (Updated for FCM)
 create table if not exists push_subscriptions (
   id bigint generated by default as identity primary key,
@@ -18,4 +28,29 @@ create table if not exists push_subscriptions (
   fcm_token text unique,  -- FCM token for Firebase Cloud Messaging
   created_at timestamptz default now(),
   updated_at timestamptz default now()
-);
\ No newline at end of file
+);
+
+-- FCM token lookups by user
+create index if not exists push_subscriptions_user_id_idx
+  on push_subscriptions (user_id);
+
+-- Announce token changes so API workers can drop cached tokens
+-- (FCM_TOKEN_CACHE_BACKEND=postgres listens on this channel)
+create or replace function notify_fcm_token_change()
+returns trigger as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') and old.user_id is not null then
+    perform pg_notify('fcm_token_changes', old.user_id::text);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') and new.user_id is not null
+     and (tg_op = 'INSERT' or new.user_id is distinct from old.user_id) then
+    perform pg_notify('fcm_token_changes', new.user_id::text);
+  end if;
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists push_subscriptions_notify on push_subscriptions;
+create trigger push_subscriptions_notify
+after insert or update or delete on push_subscriptions
+for each row execute procedure notify_fcm_token_change();
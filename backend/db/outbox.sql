@@ -0,0 +1,80 @@
+-- NOTIFICATION OUTBOX
+-- Reminders are written here when they fire and delivered by the outbox
+-- dispatcher, so scheduling never waits on FCM. Requires notes.sql.
+create table if not exists notification_outbox (
+  id bigint generated by default as identity primary key,
+  user_id uuid references users(id) on delete cascade,
+  note_id bigint references notes(id) on delete cascade,
+  title text not null,
+  body text not null,
+  data jsonb default '{}'::jsonb,
+  status text not null default 'pending' check (status in ('pending', 'sending', 'sent', 'dead')),
+  attempts int not null default 0,
+  last_error text,
+  next_attempt_at timestamptz not null default now(),
+  locked_until timestamptz,  -- lease of the sender that claimed the row
+  scheduled_for timestamptz,  -- fire time of the reminder that queued the row
+  created_at timestamptz default now(),
+  updated_at timestamptz default now(),
+  sent_at timestamptz
+);
+
+-- Existing deployments
+alter table notification_outbox add column if not exists scheduled_for timestamptz;
+
+-- One row per reminder occurrence, however many workers fired it
+create unique index if not exists notification_outbox_note_id_scheduled_for_key
+  on notification_outbox (note_id, scheduled_for);
+
+create index if not exists notification_outbox_due_idx
+  on notification_outbox (next_attempt_at)
+  where status in ('pending', 'sending');
+
+-- Claims up to p_limit due rows for one sender. SKIP LOCKED lets any number
+-- of senders claim concurrently without blocking on or double-claiming rows;
+-- rows whose lease expired (the sender died) are claimed again.
+create or replace function claim_notification_outbox(p_limit int, p_lease_seconds int default 60)
+returns setof notification_outbox as $$
+  update notification_outbox o set
+    status = 'sending',
+    attempts = o.attempts + 1,
+    locked_until = now() + make_interval(secs => p_lease_seconds),
+    updated_at = now()
+  where o.id in (
+    select id from notification_outbox
+    where (status = 'pending' and next_attempt_at <= now())
+       or (status = 'sending' and locked_until < now())
+    order by next_attempt_at
+    limit p_limit
+    for update skip locked
+  )
+  returning o.*;
+$$ language sql set search_path = public;
+
+-- Records the outcome of a claimed batch. Failed rows are retried with
+-- exponential backoff (capped at an hour) and dead-lettered once they have
+-- been attempted p_max_attempts times.
+create or replace function finish_notification_outbox(
+  p_sent bigint[],
+  p_failed bigint[],
+  p_error text default null,
+  p_max_attempts int default 5,
+  p_backoff_seconds int default 30
+)
+returns void as $$
+  update notification_outbox set
+    status = 'sent',
+    sent_at = now(),
+    locked_until = null,
+    last_error = null,
+    updated_at = now()
+  where id = any(p_sent);
+
+  update notification_outbox set
+    status = case when attempts >= p_max_attempts then 'dead' else 'pending' end,
+    next_attempt_at = now() + make_interval(secs => least(p_backoff_seconds * power(2, attempts - 1), 3600)),
+    locked_until = null,
+    last_error = p_error,
+    updated_at = now()
+  where id = any(p_failed);
+$$ language sql set search_path = public;
@@ -0,0 +1,88 @@
+-- REMINDER SCHEDULER COORDINATION
+-- With REMINDER_COORDINATION=lease every API worker runs the reminder engine
+-- for a share of the reminder partitions only. Reminders are partitioned by a
+-- hash of user_id; a partition belongs to the worker holding its lease row.
+-- Requires notifications.sql. All workers must use the same partition count.
+
+create table if not exists reminder_partitions (
+  partition int primary key,
+  owner text,
+  expires_at timestamptz
+);
+
+-- Heartbeats of live workers, used to compute each worker's fair share
+create table if not exists scheduler_workers (
+  owner text primary key,
+  seen_at timestamptz not null default now()
+);
+
+-- Must match reminder_partition() in ai_services/core/reminder_engine.py
+create or replace function reminder_partition(p_user_id uuid, p_count int)
+returns int as $$
+  select (('x' || substr(md5(p_user_id::text), 1, 8))::bit(32)::bigint % p_count)::int;
+$$ language sql immutable;
+
+-- Active reminders of the given partitions, optionally only those changed
+-- since a point in time (incremental sync)
+create or replace function active_reminders(p_partitions int[], p_count int, p_changed_since timestamptz default null)
+returns setof notification_settings as $$
+  select * from notification_settings
+  where notify
+    and end_date > now()
+    and (p_changed_since is null or updated_at >= p_changed_since)
+    and reminder_partition(user_id, p_count) = any(p_partitions);
+$$ language sql stable set search_path = public;
+
+-- Heartbeat for p_owner: renews its leases, hands back partitions above its
+-- fair share (when workers joined) or takes free and expired ones up to it
+-- (when workers left or died). Returns the partitions p_owner now holds.
+create or replace function acquire_reminder_partitions(p_owner text, p_partitions int, p_lease_seconds int)
+returns int[] as $$
+declare
+  v_lease interval := make_interval(secs => p_lease_seconds);
+  v_workers int;
+  v_share int;
+  v_mine int;
+begin
+  insert into scheduler_workers (owner, seen_at) values (p_owner, now())
+  on conflict (owner) do update set seen_at = now();
+  delete from scheduler_workers where seen_at < now() - v_lease;
+  select count(*) into v_workers from scheduler_workers;
+  v_share := ceil(p_partitions::numeric / greatest(v_workers, 1));
+
+  insert into reminder_partitions (partition)
+  select g from generate_series(0, p_partitions - 1) g
+  on conflict (partition) do nothing;
+
+  update reminder_partitions set expires_at = now() + v_lease where owner = p_owner;
+  select count(*) into v_mine from reminder_partitions where owner = p_owner;
+
+  if v_mine > v_share then
+    update reminder_partitions set owner = null, expires_at = null
+    where partition in (
+      select partition from reminder_partitions
+      where owner = p_owner
+      order by partition desc
+      limit v_mine - v_share
+    );
+  elsif v_mine < v_share then
+    update reminder_partitions set owner = p_owner, expires_at = now() + v_lease
+    where partition in (
+      select partition from reminder_partitions
+      where partition < p_partitions and (owner is null or expires_at < now())
+      order by partition
+      limit v_share - v_mine
+      for update skip locked
+    );
+  end if;
+
+  return array(select partition from reminder_partitions where owner = p_owner order by partition);
+end;
+$$ language plpgsql set search_path = public;
+
+-- Gives up every partition of p_owner (clean shutdown)
+create or replace function release_reminder_partitions(p_owner text)
+returns void as $$
+  update reminder_partitions set owner = null, expires_at = null where owner = p_owner;
+  delete from scheduler_workers where owner = p_owner;
+$$ language sql set search_path = public;
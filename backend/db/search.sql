@@ -0,0 +1,61 @@
+-- NOTE SEARCH
+-- Full-text search over title, summary and content, with trigram matching on
+-- titles for typo tolerance. Requires notes.sql.
+create extension if not exists pg_trgm;
+create extension if not exists btree_gin;
+
+-- Weighted document of a note. The GIN index below is built on this
+-- expression rather than a stored column, so writes that return the note row
+-- do not carry the tsvector back to the API.
+create or replace function note_search_vector(p_title text, p_summary text, p_content text)
+returns tsvector as $$
+  select setweight(to_tsvector('english', coalesce(p_title, '')), 'A')
+      || setweight(to_tsvector('english', coalesce(p_summary, '')), 'B')
+      || setweight(to_tsvector('english', coalesce(p_content, '')), 'C');
+$$ language sql immutable;
+
+-- user_id leads both indexes (btree_gin), so a search only visits the
+-- searching user's entries
+create index if not exists notes_search_idx
+  on notes using gin (user_id, note_search_vector(title, summary, content));
+
+create index if not exists notes_title_trgm_idx
+  on notes using gin (user_id, title gin_trgm_ops);
+
+-- Snippets are HTML (matches wrapped in <mark>), so the note text is escaped
+-- before the tags are added and any markup in a note reaches clients inert.
+create or replace function html_escape(p_text text)
+returns text as $$
+  select replace(replace(replace(coalesce(p_text, ''), '&', '&amp;'), '<', '&lt;'), '>', '&gt;');
+$$ language sql immutable;
+
+-- Ranked search of one user's notes. Notes match on the full-text query
+-- (websearch syntax: "quoted phrases", or, -exclusions) or on title
+-- similarity; snippets are only built for the returned page.
+create or replace function search_notes(p_user_id uuid, p_query text, p_limit int default 20, p_offset int default 0)
+returns table (id bigint, title text, summary text, updated_at timestamptz, rank real, snippet text) as $$
+  with q as (
+    select websearch_to_tsquery('english', p_query) as tsq
+  ),
+  hits as (
+    select
+      n.id, n.title, n.summary, n.content, n.updated_at,
+      note_search_vector(n.title, n.summary, n.content) @@ q.tsq as matched,
+      (ts_rank_cd(note_search_vector(n.title, n.summary, n.content), q.tsq)
+        + similarity(coalesce(n.title, ''), p_query))::real as rank
+    from notes n, q
+    where n.user_id = p_user_id
+      and (note_search_vector(n.title, n.summary, n.content) @@ q.tsq or n.title % p_query)
+    order by rank desc, n.id desc
+    limit p_limit offset p_offset
+  )
+  select
+    h.id, h.title, h.summary, h.updated_at, h.rank,
+    case when h.matched
+      then ts_headline('english', html_escape(h.content), q.tsq,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MinWords=8, MaxWords=24')
+      else html_escape(left(coalesce(h.content, ''), 160))
+    end as snippet
+  from hits h, q
+  order by h.rank desc, h.id desc;
+$$ language sql stable set search_path = public;
@@ -0,0 +1,274 @@
+-- NOTE SYNC
+-- Delta sync for offline clients (GET/POST /notes/sync). Requires notes.sql,
+-- notifications.sql and note_functions.sql.
+--
+-- Every note carries
+--   version     bumped whenever the client-editable fields (title, content,
+--               metadata) change; clients send it back as base_version
+--   change_xid  the transaction that last wrote the row, including summary
+--               and reminder writes; the pull cursor is built on it
+-- and deletes leave a tombstone, so a client holding a cursor learns about
+-- them. Cursors are transaction ids rather than timestamps: a transaction
+-- that commits after a pull has an id at or above the xmin of that pull's
+-- snapshot, so rows are never skipped because an older write committed late.
+alter table notes add column if not exists version bigint not null default 1;
+alter table notes add column if not exists change_xid xid8 not null default pg_current_xact_id();
+
+create index if not exists notes_user_id_change_xid_idx
+  on notes (user_id, change_xid, id);
+
+create or replace function bump_note_version()
+returns trigger as $$
+begin
+  new.change_xid := pg_current_xact_id();
+  if new.title is distinct from old.title
+    or new.content is distinct from old.content
+    or new.metadata is distinct from old.metadata then
+    new.version := old.version + 1;
+  else
+    new.version := old.version;
+  end if;
+  return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notes_bump_version on notes;
+create trigger notes_bump_version
+  before update on notes
+  for each row execute function bump_note_version();
+
+-- TOMBSTONES
+-- No foreign key to users: tombstones are also written while a user's notes
+-- are removed by the cascade from users. Note ids are never reused.
+create table if not exists note_tombstones (
+  note_id bigint primary key,
+  user_id uuid not null,
+  deleted_at timestamptz default now(),
+  change_xid xid8 not null default pg_current_xact_id()
+);
+
+create index if not exists note_tombstones_user_id_change_xid_idx
+  on note_tombstones (user_id, change_xid, note_id);
+
+create or replace function record_note_tombstone()
+returns trigger as $$
+begin
+  insert into note_tombstones (note_id, user_id)
+  values (old.id, old.user_id)
+  on conflict (note_id) do update set
+    deleted_at = now(),
+    change_xid = pg_current_xact_id();
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notes_record_tombstone on notes;
+create trigger notes_record_tombstone
+  after delete on notes
+  for each row execute function record_note_tombstone();
+
+-- Oldest cursor still served incrementally; older ones get a full resync
+-- because the tombstones they would need have been purged.
+create table if not exists note_sync_horizon (
+  id boolean primary key default true check (id),
+  min_xid xid8 not null
+);
+
+-- Client-chosen ids of notes created through sync, so a retried batch does
+-- not create the same note twice
+create table if not exists note_client_ids (
+  user_id uuid not null,
+  client_id text not null,
+  note_id bigint not null references notes(id) on delete cascade,
+  created_at timestamptz default now(),
+  primary key (user_id, client_id)
+);
+
+-- One page of the user's changes after a cursor, ordered by (change_xid, id).
+-- p_since null pulls every live note (no tombstones); p_after_xid/p_after_id
+-- continue a page run. Returns {"xmin", "reset", "rows": [{"xid", "id",
+-- "deleted", "note"}]}; xmin is the floor for the next cursor once the run is
+-- complete, and reset means p_since predates the horizon and a full pull was
+-- served instead.
+create or replace function sync_notes(
+  p_user_id uuid,
+  p_since text default null,
+  p_after_xid text default null,
+  p_after_id bigint default null,
+  p_limit int default 500
+)
+returns jsonb as $$
+declare
+  v_since xid8 := p_since::xid8;
+  v_reset boolean := false;
+begin
+  if v_since is not null and p_after_xid is null
+    and v_since <= (select min_xid from note_sync_horizon) then
+    v_since := null;
+    v_reset := true;
+  end if;
+
+  return jsonb_build_object(
+    'xmin', pg_snapshot_xmin(pg_current_snapshot())::text,
+    'reset', v_reset,
+    'rows', coalesce((
+      select jsonb_agg(jsonb_build_object('xid', c.change_xid::text, 'id', c.id, 'deleted', c.deleted, 'note', c.note)
+                       order by c.change_xid, c.id)
+      from (
+        select n.change_xid, n.id, false as deleted,
+               to_jsonb(n) - 'change_xid' - 'content_hash' || jsonb_build_object(
+                 'notify', coalesce(s.notify, false),
+                 'notify_type', s.notify_type,
+                 'notify_time', s.notify_time,
+                 'end_date', s.end_date
+               ) as note
+        from notes n
+        left join notification_settings s on s.note_id = n.id
+        where n.user_id = p_user_id
+          and (v_since is null or n.change_xid >= v_since)
+          and (p_after_xid is null or (n.change_xid, n.id) > (p_after_xid::xid8, p_after_id))
+        union all
+        select t.change_xid, t.note_id, true, null
+        from note_tombstones t
+        where t.user_id = p_user_id
+          and v_since is not null
+          and t.change_xid >= v_since
+          and (p_after_xid is null or (t.change_xid, t.note_id) > (p_after_xid::xid8, p_after_id))
+        order by 1, 2
+        limit p_limit
+      ) c
+    ), '[]'::jsonb)
+  );
+end;
+$$ language plpgsql stable set search_path = public;
+
+-- Applies a batch of client mutations in one transaction. Each element is
+--   {"op": "upsert" | "delete", "id", "client_id", "base_version",
+--    "updated_at", "title", "content", "metadata",
+--    "content_hash", "summary", "placeholder"}
+-- with content_hash/summary/placeholder filled in by the API as for
+-- upsert_note_with_reminder. An upsert without id creates a note. Writes to
+-- an existing note apply when base_version is the current version; otherwise
+-- the client's updated_at (its edit time) must be newer than the stored one,
+-- and without either the write is a conflict. Unconditional writes (neither
+-- field sent) always apply. Reminders are left as they are on update.
+-- Returns one {"client_id", "id", "status", "note", "summary_stale"} per
+-- mutation; status is applied, conflict (note is the current row), deleted
+-- (the note has a tombstone) or not_found.
+create or replace function apply_note_mutations(p_user_id uuid, p_mutations jsonb)
+returns jsonb as $$
+declare
+  m jsonb;
+  v_note notes%rowtype;
+  v_id bigint;
+  v_status text;
+  v_stale boolean;
+  v_results jsonb := '[]'::jsonb;
+begin
+  for m in select value from jsonb_array_elements(p_mutations) loop
+    v_id := (m->>'id')::bigint;
+    v_stale := false;
+
+    if v_id is null then
+      if m->>'op' = 'delete' then
+        v_status := 'not_found';
+        v_note := null;
+      else
+        select n.* into v_note
+        from note_client_ids c join notes n on n.id = c.note_id
+        where c.user_id = p_user_id and c.client_id = m->>'client_id';
+        if not found then
+          insert into notes (user_id, title, content, summary, content_hash, metadata)
+          values (
+            p_user_id, m->>'title', m->>'content',
+            coalesce(m->>'summary', m->>'placeholder'),
+            case when m->>'summary' is not null then m->>'content_hash' end,
+            coalesce(m->'metadata', '{}'::jsonb)
+          )
+          returning * into v_note;
+          v_stale := m->>'summary' is null;
+          if m->>'client_id' is not null then
+            insert into note_client_ids (user_id, client_id, note_id)
+            values (p_user_id, m->>'client_id', v_note.id);
+          end if;
+        end if;
+        v_status := 'applied';
+      end if;
+    else
+      select * into v_note from notes where id = v_id and user_id = p_user_id for update;
+      if not found then
+        v_note := null;
+        if exists (select 1 from note_tombstones where note_id = v_id and user_id = p_user_id) then
+          -- deleting an already deleted note has nothing left to do
+          v_status := case when m->>'op' = 'delete' then 'applied' else 'deleted' end;
+        else
+          v_status := 'not_found';
+        end if;
+      elsif case
+          when (m->>'base_version')::bigint = v_note.version then false
+          when m->>'updated_at' is not null then (m->>'updated_at')::timestamptz <= v_note.updated_at
+          else m->>'base_version' is not null
+        end then
+        v_status := 'conflict';
+      elsif m->>'op' = 'delete' then
+        delete from notification_settings where note_id = v_id and user_id = p_user_id;
+        delete from notes where id = v_id and user_id = p_user_id;
+        v_note := null;
+        v_status := 'applied';
+      else
+        -- content_hash on the right-hand side is the stored (pre-update) value
+        update notes set
+          title = m->>'title',
+          content = m->>'content',
+          metadata = coalesce(m->'metadata', '{}'::jsonb),
+          summary = case
+            when m->>'summary' is not null then m->>'summary'
+            when content_hash is distinct from m->>'content_hash' then m->>'placeholder'
+            else summary
+          end,
+          -- the placeholder belongs to no content, as in upsert_note_with_reminder
+          content_hash = case
+            when m->>'summary' is not null then m->>'content_hash'
+            when content_hash is distinct from m->>'content_hash' then null
+            else content_hash
+          end,
+          updated_at = now()
+        where id = v_id
+        returning * into v_note;
+        v_stale := m->>'summary' is null and v_note.content_hash is distinct from m->>'content_hash';
+        v_status := 'applied';
+      end if;
+    end if;
+
+    v_results := v_results || jsonb_build_object(
+      'client_id', m->'client_id',
+      'id', coalesce(v_note.id, v_id),
+      'status', v_status,
+      'note', case when v_note.id is not null then to_jsonb(v_note) - 'change_xid' end,
+      'summary_stale', v_stale
+    );
+  end loop;
+  return v_results;
+end;
+$$ language plpgsql set search_path = public;
+
+-- Drops tombstones (and client id mappings) older than p_keep and moves the
+-- horizon past them; run periodically, e.g. from pg_cron.
+create or replace function purge_note_tombstones(p_keep interval default '90 days')
+returns integer as $$
+declare
+  v_horizon xid8;
+  v_count integer;
+begin
+  select max(change_xid) into v_horizon from note_tombstones where deleted_at < now() - p_keep;
+  if v_horizon is null then
+    return 0;
+  end if;
+  delete from note_tombstones where change_xid <= v_horizon;
+  get diagnostics v_count = row_count;
+  delete from note_client_ids where created_at < now() - p_keep;
+  insert into note_sync_horizon (id, min_xid) values (true, v_horizon)
+  on conflict (id) do update set min_xid = greatest(note_sync_horizon.min_xid, excluded.min_xid);
+  return v_count;
+end;
+$$ language plpgsql set search_path = public;
@@ -0,0 +1,28 @@
+"""Micro-benchmarks for the backend's hot paths.
+
+They run against in-process fakes, so they stay quick enough for the regular
+suite and only assert relative gains with a wide margin. Run them on their
+own with `python -m pytest tests/benchmarks -s` to see the timings.
+"""
+import time
+
+import pytest
+
+
+@pytest.fixture
+def bench(capsys):
+    """Best wall time of `rounds` calls of fn(), printed under `label`."""
+
+    def run(label, fn, rounds=3):
+        best = min(_timed(fn) for _ in range(rounds))
+        with capsys.disabled():
+            print(f"\n[BENCH] {label}: {best * 1000:.1f} ms")
+        return best
+
+    return run
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
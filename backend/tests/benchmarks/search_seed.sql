@@ -0,0 +1,58 @@
+-- Seeds a scratch database for the note search benchmark
+-- (test_bench_search.py): bench.notes notes (default 1,000,000) spread over
+-- bench.users users (default 100). Titles, summaries and content are drawn
+-- from a 100-word vocabulary, so every query term matches a predictable share
+-- of each user's notes.
+--
+-- The benchmark runs this inside a transaction and rolls it back. To keep the
+-- data for manual EXPLAIN ANALYZE runs instead:
+--   psql "$BENCH_DATABASE_URL" -c "set bench.notes = 1000000" -f tests/benchmarks/search_seed.sql
+-- Requires db/users.sql, db/notes.sql and db/search.sql.
+
+drop table if exists bench_words;
+create temporary table bench_words as
+select row_number() over () as n, word
+from unnest(string_to_array(
+  'meeting project budget review deadline invoice client design sprint release '
+  'roadmap launch feedback hiring interview offer salary travel flight hotel '
+  'conference keynote slides draft report quarterly revenue forecast expense receipt '
+  'grocery recipe dinner lunch breakfast coffee garden plant water fertilizer '
+  'doctor appointment dentist pharmacy insurance renewal passport visa embassy ticket '
+  'birthday anniversary gift party invitation wedding guest music playlist concert '
+  'book chapter author library notes lecture exam homework essay thesis '
+  'server database migration backup index query latency cache deploy rollback '
+  'kubernetes docker container cluster monitoring alert incident postmortem outage pager '
+  'workout running marathon swimming yoga stretch protein calories sleep meditation',
+  ' ')) as word;
+
+insert into users (email, name)
+select format('bench-%s@example.invalid', u), format('Bench user %s', u)
+from generate_series(1, coalesce(nullif(current_setting('bench.users', true), ''), '100')::int) as u
+on conflict (email) do nothing;
+
+with bench_users as (
+  select id, row_number() over (order by email) as n
+  from users
+  where email like 'bench-%@example.invalid'
+),
+words as (
+  select array_agg(word order by n) as w, count(*)::int as c from bench_words
+)
+insert into notes (user_id, title, content, summary, updated_at)
+select
+  bu.id,
+  initcap((select string_agg(w[1 + (hashint8(g * 128 + 64 + k) & 2147483647) % c], ' ') from generate_series(1, 3) as k)),
+  (select string_agg(w[1 + (hashint8(g * 128 + k) & 2147483647) % c], ' ') from generate_series(1, 60) as k),
+  'Summary: ' || (select string_agg(w[1 + (hashint8(g * 128 + 96 + k) & 2147483647) % c], ' and ') from generate_series(1, 2) as k),
+  now() - make_interval(secs => g)
+from generate_series(1, coalesce(nullif(current_setting('bench.notes', true), ''), '1000000')::int) as g
+cross join words
+join bench_users bu on bu.n = 1 + g % (select count(*) from bench_users);
+
+-- One known title per user for the typo-tolerance queries
+insert into notes (user_id, title, content, summary)
+select id, 'Quarterly budget review', 'Go through the quarterly budget with finance.', null
+from users
+where email like 'bench-%@example.invalid';
+
+analyze notes;
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import note as note_routes
+
+# Round trip of the stub PostgREST, and requests in flight at once
+LATENCY = 0.2
+CONCURRENCY = 200
+
+
+class StubQuery:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        await asyncio.sleep(LATENCY)
+        return type("Response", (), {"data": [{"id": 1, "title": "t", "content": "c"}]})()
+
+
+class StubClient:
+    def table(self, name):
+        return StubQuery()
+
+
+def blocking_app():
+    """GET /notes/{id} the way it was served before: a sync handler on the threadpool."""
+    app = FastAPI()
+
+    @app.get("/notes/{note_id}")
+    def get_note(note_id: int):
+        time.sleep(LATENCY)
+        return {"data": {"id": note_id, "title": "t", "content": "c"}}
+
+    return app
+
+
+def async_app():
+    app = FastAPI()
+    app.include_router(note_routes.router, prefix="/notes")
+    app.dependency_overrides[get_user_id_from_token] = lambda: "u1"
+    return app
+
+
+def fetch_concurrently(app):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Distinct ids so every request misses the response cache
+            responses = await asyncio.gather(*(client.get(f"/notes/{i}") for i in range(CONCURRENCY)))
+        assert all(r.status_code == 200 for r in responses)
+
+    asyncio.run(run())
+
+
+def test_async_routes_are_not_bound_by_the_threadpool(bench, monkeypatch):
+    monkeypatch.setattr(note_routes, "get_async_client", lambda: StubClient())
+    note_routes.note_response_cache.invalidate_all()
+
+    # The threadpool runs 40 sync handlers at a time, so 200 requests take 5 round trips
+    blocking = bench(f"{CONCURRENCY} concurrent GET /notes/{{id}}, sync handler", lambda: fetch_concurrently(blocking_app()), rounds=1)
+
+    def fetch():
+        note_routes.note_response_cache.invalidate_all()
+        fetch_concurrently(async_app())
+
+    non_blocking = bench(f"{CONCURRENCY} concurrent GET /notes/{{id}}, async handler", fetch, rounds=1)
+    assert non_blocking < blocking * 0.6
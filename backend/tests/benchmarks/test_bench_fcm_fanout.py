@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from ai_services.core import push_notifications as push
+
+# Time FCM takes to answer one send_each call
+BATCH_LATENCY = 0.03
+MESSAGES = 10_000
+
+
+class UnregisteredError(Exception):
+    pass
+
+
+class FakeMessaging:
+    """send_each that answers after a fixed delay; tokens starting with "dead" are unregistered."""
+
+    def send_each(self, batch):
+        assert len(batch) <= push.FCM_BATCH_SIZE
+        time.sleep(BATCH_LATENCY)
+        responses = [
+            SimpleNamespace(success=False, exception=UnregisteredError()) if m.token.startswith("dead")
+            else SimpleNamespace(success=True, exception=None)
+            for m in batch
+        ]
+        failures = sum(not r.success for r in responses)
+        return SimpleNamespace(responses=responses, success_count=len(batch) - failures, failure_count=failures)
+
+
+@pytest.fixture
+def pruned(monkeypatch):
+    removed = []
+    monkeypatch.setattr(push, "init_firebase", lambda: True)
+    monkeypatch.setattr(push, "messaging", FakeMessaging())
+    monkeypatch.setattr(push, "remove_fcm_tokens", removed.extend)
+    return removed
+
+
+def messages():
+    return [SimpleNamespace(token=f"dead-{i}" if i % 100 == 0 else f"token-{i}") for i in range(MESSAGES)]
+
+
+def test_batches_are_sent_concurrently(pruned, monkeypatch, bench):
+    def send_with(workers):
+        def run():
+            pruned.clear()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                monkeypatch.setattr(push, "_send_executor", executor)
+                assert push.send_messages(messages()) == MESSAGES - MESSAGES // 100
+        return run
+
+    batches = MESSAGES // push.FCM_BATCH_SIZE
+    sequential = bench(f"{MESSAGES} messages in {batches} batches, one at a time", send_with(1), rounds=1)
+    concurrent = bench(f"{MESSAGES} messages in {batches} batches, {push.FCM_SEND_CONCURRENCY} at a time", send_with(push.FCM_SEND_CONCURRENCY), rounds=1)
+    assert len(pruned) == MESSAGES // 100
+    assert concurrent < sequential * 0.6
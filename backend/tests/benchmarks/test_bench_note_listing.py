@@ -0,0 +1,91 @@
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import note as note_routes
+
+NOTES = 10_000
+
+
+def make_notes(count):
+    return [{
+        "id": i,
+        "user_id": "u1",
+        "title": f"Note {i}",
+        "content": f"Paragraph {i}. " * 150,  # about 2 KB
+        "summary": f"Summary of note {i}",
+        "metadata": {"tags": ["work", "ideas"]},
+        "version": 1,
+        "created_at": "2030-01-01T00:00:00+00:00",
+        "updated_at": f"2030-01-01T00:00:{i % 60:02d}+00:00",
+        "notification_settings": [{"notify": True, "notify_type": "daily", "notify_time": "09:00", "end_date": None}],
+    } for i in range(count, 0, -1)]
+
+
+class FakeQuery:
+    """PostgREST select: projects the requested columns and applies the limit."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.columns = None
+        self.count = None
+
+    def select(self, columns):
+        self.columns = columns
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        embed = re.search(r"notification_settings(?:!inner)?\((.*)\)", self.columns)
+        columns = [c.strip() for c in self.columns[:embed.start() if embed else None].split(",") if c.strip()]
+        rows = self.rows[:self.count] if self.count else self.rows
+        data = []
+        for row in rows:
+            note = dict(row) if "*" in columns else {c: row[c] for c in columns}
+            note.pop("notification_settings", None)
+            if embed:
+                fields = [f.strip() for f in embed.group(1).split(",")]
+                note["notification_settings"] = [{f: s[f] for f in fields} for s in row["notification_settings"]]
+            data.append(note)
+        return type("Response", (), {"data": data})()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    notes = make_notes(NOTES)
+    monkeypatch.setattr(note_routes, "get_async_client", lambda: type("Client", (), {"table": lambda self, name: FakeQuery(notes)})())
+    app = FastAPI()
+    app.include_router(note_routes.router, prefix="/notes")
+    app.dependency_overrides[get_user_id_from_token] = lambda: "u1"
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_projected_pages_are_a_fraction_of_the_full_listing(client, bench):
+    sizes = {}
+
+    def fetch(name, params):
+        def run():
+            note_routes.note_response_cache.invalidate_all()
+            res = client.get("/notes", params=params)
+            assert res.status_code == 200, res.text
+            sizes[name] = len(res.content)
+        return run
+
+    full = bench(f"GET /notes, all {NOTES} notes", fetch("full", {}))
+    projected = bench(f"GET /notes?fields=title,summary, all {NOTES} notes", fetch("projected", {"fields": "title,summary"}))
+    page = bench("GET /notes?limit=50&fields=title,summary,notify", fetch("page", {"limit": 50, "fields": "title,summary,notify"}))
+    print(f"[BENCH] response bytes: {sizes}")
+
+    assert sizes["projected"] < sizes["full"] / 5
+    assert sizes["page"] < sizes["full"] / 500
+    assert projected < full and page < projected
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from ai_services.core import note_saver
+
+# Round trip to PostgREST
+LATENCY = 0.01
+WRITES = 10
+
+
+class FakeCall:
+    def __init__(self, db, data):
+        self.db = db
+        self.data = data
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        self.db.round_trips += 1
+        await asyncio.sleep(LATENCY)
+        return type("Response", (), {"data": self.data})()
+
+
+class FakeDB:
+    """Counts round trips; the note RPCs answer like db/note_functions.sql."""
+
+    def __init__(self):
+        self.round_trips = 0
+
+    def rpc(self, name, params):
+        if name == note_saver.DELETE_NOTE_RPC:
+            return FakeCall(self, True)
+        note = {"id": params["p_note_id"] or 1, "title": params["p_title"], "content": params["p_content"]}
+        setting = {"note_id": note["id"], "notify": True} if params["p_notify"] else None
+        return FakeCall(self, {"note": note, "notification": setting, "summary_stale": False})
+
+    def table(self, name):
+        return FakeCall(self, [{"id": 1}])
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(note_saver, "get_async_client", lambda: fake)
+    monkeypatch.setattr(note_saver, "queue_embeddings", lambda user_id, ids: None)
+    monkeypatch.setattr(note_saver.vector_store, "delete", lambda ids: None)
+    monkeypatch.setattr(note_saver.note_changes, "publish_local", lambda *args, **kwargs: None)
+    return fake
+
+
+REMINDER = {"notify": True, "notify_type": "daily", "notify_time": "09:00", "end_date": "2030-01-01"}
+
+
+async def rpc_writes():
+    """Save, update and delete a note with a reminder through the note RPCs."""
+    await note_saver.asave_note_with_notification("u1", "t", "c", **REMINDER)
+    await note_saver.aupdate_note_with_notification("u1", 1, "t", "c2", **REMINDER)
+    await note_saver.adelete_note("u1", 1)
+
+
+async def table_writes(db):
+    """The same writes as the sequential PostgREST calls they replaced."""
+    notes, settings = db.table("notes"), db.table("notification_settings")
+    # Save: insert the note, then its setting
+    await notes.insert({}).execute()
+    await settings.insert({}).execute()
+    # Update: update the note, look up its setting, then update it
+    await notes.update({}).execute()
+    await settings.select("id").execute()
+    await settings.update({}).execute()
+    # Delete: the setting, then the note
+    await settings.delete().execute()
+    await notes.delete().execute()
+
+
+def test_note_writes_take_one_round_trip_each(db, bench):
+    asyncio.run(rpc_writes())
+    assert db.round_trips == 3
+
+    before = bench(f"{WRITES}x save + update + delete, sequential table calls", lambda: asyncio.run(_repeat(lambda: table_writes(db))), rounds=1)
+    after = bench(f"{WRITES}x save + update + delete, note RPCs", lambda: asyncio.run(_repeat(rpc_writes)), rounds=1)
+    assert after < before * 0.6
+
+
+async def _repeat(writes):
+    for _ in range(WRITES):
+        await writes()
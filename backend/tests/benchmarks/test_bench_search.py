@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+# Needs a scratch Postgres with db/users.sql, db/notes.sql and db/search.sql
+# applied, e.g. a local `supabase start`. The seeded notes are rolled back.
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+BENCH_SEARCH_NOTES = int(os.getenv("BENCH_SEARCH_NOTES", "1000000"))
+# Slowest acceptable search, best of five
+BENCH_SEARCH_BUDGET_MS = float(os.getenv("BENCH_SEARCH_BUDGET_MS", "250"))
+
+pytestmark = pytest.mark.skipif(not BENCH_DATABASE_URL, reason="BENCH_DATABASE_URL is not set")
+
+SEED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_seed.sql")
+
+QUERIES = {
+    "common word": "meeting",
+    "two words": "budget deadline",
+    "phrase": '"quarterly revenue"',
+    "exclusion": "kubernetes -docker",
+    "title typo": "Quarterly budgett reveiw",
+}
+
+
+@pytest.fixture(scope="module")
+def search():
+    """Runs search_notes for one of the seeded users; returns the rows."""
+    psycopg = pytest.importorskip("psycopg")
+    with psycopg.connect(BENCH_DATABASE_URL) as conn:
+        try:
+            conn.execute("select set_config('bench.notes', %s, true)", (str(BENCH_SEARCH_NOTES),))
+            with open(SEED) as f:
+                conn.execute(f.read())
+            user_id = conn.execute("select id from users where email = 'bench-1@example.invalid'").fetchone()[0]
+
+            def run(query, limit=20, offset=0):
+                return conn.execute("select * from search_notes(%s, %s, %s, %s)", (user_id, query, limit, offset)).fetchall()
+
+            yield run
+        finally:
+            conn.rollback()
+
+
+@pytest.mark.parametrize("query", QUERIES.values(), ids=QUERIES.keys())
+def test_search_latency(search, bench, query):
+    rows = search(query)
+    assert rows, f"no matches for {query!r}"
+    best = bench(f"search_notes({query!r}) over {BENCH_SEARCH_NOTES} notes, {len(rows)} results", lambda: search(query), rounds=5)
+    assert best * 1000 < BENCH_SEARCH_BUDGET_MS
+
+
+def test_deep_page_latency(search, bench):
+    best = bench("search_notes('meeting') at offset 980", lambda: search("meeting", offset=980), rounds=5)
+    assert best * 1000 < BENCH_SEARCH_BUDGET_MS
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imported on first use instead of at startup
+DEFERRED = ("langchain_google_genai", "langchain_core", "firebase_admin", "supabase")
+
+
+def import_main(prelude=""):
+    """Runs `import ai_services.api.main` in a fresh interpreter.
+
+    Returns its cumulative -X importtime in seconds and the deferred
+    packages that ended up loaded.
+    """
+    code = f"{prelude}import ai_services.api.main, sys; print(','.join(sorted({{m.split('.')[0] for m in sys.modules}} & {set(DEFERRED)!r})))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    # "import time: self [us] | cumulative | package", nested imports indented
+    rows = [line.split("|") for line in result.stderr.splitlines() if line.startswith("import time:")]
+    cumulative = sum(int(row[1]) for row in rows[1:] if not row[2].startswith("  "))
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return cumulative / 1e6, loaded
+
+
+def test_startup_defers_llm_firebase_and_supabase(bench):
+    timings = {}
+
+    def lazy():
+        timings["lazy"], timings["loaded"] = import_main()
+
+    def eager():
+        # What importing the app used to pull in before the first request
+        timings["eager"], _ = import_main("import langchain_google_genai, langchain_core.prompts, firebase_admin.messaging, supabase; ")
+
+    bench("python -X importtime -c 'import ai_services.api.main' (wall)", lazy, rounds=1)
+    bench("same, with Gemini, Firebase and Supabase imported up front (wall)", eager, rounds=1)
+    print(f"[BENCH] cumulative import time: {timings['lazy']:.2f} s deferred, {timings['eager']:.2f} s eager")
+    assert timings["loaded"] == []
+    assert timings["lazy"] < timings["eager"]
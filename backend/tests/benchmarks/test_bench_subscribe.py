@@ -0,0 +1,142 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import notifications as notification_routes
+
+# Round trip to PostgREST
+LATENCY = 0.05
+REQUESTS = 500
+TOKENS = 100
+USERS = 5
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+class FakeQuery:
+    def __init__(self, table, op, rows=None, on_conflict=None):
+        self.table = table
+        self.op = op
+        self.rows = rows
+        self.on_conflict = on_conflict
+        self.filter = None
+
+    def eq(self, column, value):
+        self.filter = value
+        return self
+
+    async def execute(self):
+        self.table.round_trips += 1
+        await asyncio.sleep(LATENCY * random.random())
+        data = []
+        if self.op == "select":
+            data = [dict(self.table.rows[self.filter])] if self.filter in self.table.rows else []
+        elif self.op == "update":
+            self.table.rows[self.filter].update(self.rows)
+        else:
+            for row in self.rows:
+                # push_subscriptions has a unique constraint on fcm_token
+                if row["fcm_token"] in self.table.rows and self.on_conflict != "fcm_token":
+                    raise DuplicateKeyError("duplicate key value violates unique constraint")
+                self.table.rows[row["fcm_token"]] = dict(row)
+        return type("Response", (), {"data": data})()
+
+
+class FakeSubscriptions:
+    """push_subscriptions keyed by fcm_token."""
+
+    def __init__(self):
+        self.rows = {}
+        self.round_trips = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return FakeQuery(self, "select")
+
+    def update(self, values):
+        return FakeQuery(self, "update", values)
+
+    def insert(self, rows):
+        return FakeQuery(self, "insert", rows if isinstance(rows, list) else [rows])
+
+    def upsert(self, rows, on_conflict=None):
+        return FakeQuery(self, "upsert", rows, on_conflict)
+
+
+def user_from_header(request: Request):
+    return request.headers["x-user"]
+
+
+def select_then_write_app(db):
+    """POST /subscribe the way it used to work: look the token up, then update or insert."""
+    app = FastAPI()
+
+    @app.post("/subscribe")
+    async def subscribe(subscription: notification_routes.SubscriptionModel, user_id: str = Depends(user_from_header)):
+        try:
+            existing = await db.table("push_subscriptions").select("*").eq("fcm_token", subscription.fcm_token).execute()
+            if existing.data:
+                await db.table("push_subscriptions").update({"user_id": user_id}).eq("fcm_token", subscription.fcm_token).execute()
+            else:
+                await db.table("push_subscriptions").insert({"user_id": user_id, "fcm_token": subscription.fcm_token}).execute()
+        except DuplicateKeyError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return {"message": "Subscription saved successfully"}
+
+    return app
+
+
+def upsert_app():
+    app = FastAPI()
+    app.include_router(notification_routes.router, prefix="/notifications")
+    app.dependency_overrides[get_user_id_from_token] = user_from_header
+    return app
+
+
+def subscribe_concurrently(app, path):
+    """REQUESTS subscribes at once from USERS accounts sharing TOKENS device tokens."""
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post(path, json={"fcm_token": f"device-token-{i % TOKENS:04d}"}, headers={"x-user": f"u{i % USERS}"})
+                for i in range(REQUESTS)
+            ))
+
+    random.seed(7)
+    return [r.status_code for r in asyncio.run(run())]
+
+
+def test_concurrent_subscribes_never_collide(monkeypatch, bench):
+    results = {}
+
+    def before():
+        db = FakeSubscriptions()
+        results["before"] = (subscribe_concurrently(select_then_write_app(db), "/subscribe"), db)
+
+    def after():
+        db = FakeSubscriptions()
+        monkeypatch.setattr(notification_routes, "get_async_client", lambda: db)
+        results["after"] = (subscribe_concurrently(upsert_app(), "/notifications/subscribe"), db)
+
+    bench(f"{REQUESTS} concurrent subscribes, select then insert/update", before, rounds=1)
+    bench(f"{REQUESTS} concurrent subscribes, single upsert", after, rounds=1)
+
+    statuses, db = results["before"]
+    print(f"[BENCH] select then write: {statuses.count(500)} duplicate-key failures, {db.round_trips} round trips")
+    assert statuses.count(500) > 0
+
+    statuses, db = results["after"]
+    print(f"[BENCH] single upsert: {statuses.count(500)} failures, {db.round_trips} round trips")
+    assert statuses == [200] * REQUESTS
+    assert db.round_trips == REQUESTS
+    assert len(db.rows) == TOKENS
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The modules read their configuration at import time: point them at a dummy
+# Supabase project and the deterministic local embedder, never the Gemini API
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+os.environ["EMBEDDING_STORE"] = "pgvector"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
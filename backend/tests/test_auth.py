@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from ai_services.api import auth
+
+SECRET = "test-jwt-secret-of-at-least-32-bytes"
+
+
+def make_token(sub="auth-1", exp_in=3600, secret=SECRET, **claims):
+    payload = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + exp_in, "email": "ada@example.com", **claims}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", SECRET)
+    auth.token_cache.clear()
+    auth.user_id_cache.clear()
+    yield
+    auth.token_cache.clear()
+    auth.user_id_cache.clear()
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """Counts local verifications of tokens that miss the token cache."""
+    calls = []
+    verify = auth._verify_token_locally
+
+    def counting(token):
+        calls.append(token)
+        return verify(token)
+
+    monkeypatch.setattr(auth, "_verify_token_locally", counting)
+    return calls
+
+
+def get_user(token):
+    return asyncio.run(auth.get_user_from_token(authorization=f"Bearer {token}"))
+
+
+def test_verified_token_is_served_from_cache(verifications):
+    token = make_token()
+    first = get_user(token)
+    assert first["id"] == "auth-1" and first["email"] == "ada@example.com"
+    assert get_user(token) == first
+    assert verifications == [token]
+
+    other = make_token(sub="auth-2")
+    assert get_user(other)["id"] == "auth-2"
+    assert verifications == [token, other]
+
+
+def test_token_cached_no_longer_than_its_exp(verifications):
+    token = make_token(exp_in=2)
+    get_user(token)
+    time.sleep(2.1)
+    with pytest.raises(HTTPException) as exc:
+        get_user(token)
+    assert exc.value.status_code == 401
+    assert verifications == [token, token]
+
+
+@pytest.mark.parametrize("token", [
+    make_token(secret="someone-elses-secret-of-32-bytes!"),
+    make_token(exp_in=-10),
+    make_token(aud="anon"),
+], ids=["bad-signature", "expired", "wrong-audience"])
+def test_invalid_tokens_are_rejected_and_not_cached(token):
+    with pytest.raises(HTTPException) as exc:
+        get_user(token)
+    assert exc.value.status_code == 401
+    assert len(auth.token_cache) == 0
+
+
+def test_missing_bearer_header():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(auth.get_user_from_token(authorization="Basic abc"))
+    assert exc.value.status_code == 401
+
+
+def test_falls_back_to_supabase_without_secret(monkeypatch):
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", None)
+    calls = []
+
+    class Auth:
+        async def get_user(self, token):
+            calls.append(token)
+            return {"user": {"id": "auth-9"}}
+
+    monkeypatch.setattr(auth, "get_async_client", lambda: type("Client", (), {"auth": Auth()})())
+    token = make_token(sub="auth-9")
+    assert get_user(token) == {"id": "auth-9"}
+    assert get_user(token) == {"id": "auth-9"}
+    assert calls == [token]
+
+
+@pytest.fixture
+def users_table(monkeypatch):
+    """Stands in for the users table; lookups and inserts yield to the loop."""
+    table = {}
+    calls = {"selects": 0, "inserts": 0}
+
+    async def lookup(auth_user_id):
+        calls["selects"] += 1
+        await asyncio.sleep(0.01)
+        return table.get(auth_user_id)
+
+    async def create(auth_user_id, email):
+        calls["inserts"] += 1
+        await asyncio.sleep(0.01)
+        table[auth_user_id] = f"user-{len(table) + 1}"
+        return table[auth_user_id]
+
+    monkeypatch.setattr(auth, "_lookup_user_id", lookup)
+    monkeypatch.setattr(auth, "_create_user_profile", create)
+    return table, calls
+
+
+def resolve_many(users):
+    async def run():
+        return await asyncio.gather(*(auth.resolve_user_id(user) for user in users), return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_concurrent_first_requests_share_one_lookup(users_table):
+    table, calls = users_table
+    table["auth-1"] = "user-1"
+    assert resolve_many([{"id": "auth-1"}] * 20) == ["user-1"] * 20
+    assert calls["selects"] == 1
+    # Memoized afterwards
+    assert resolve_many([{"id": "auth-1"}]) == ["user-1"]
+    assert calls["selects"] == 1
+
+
+def test_new_oauth_user_gets_exactly_one_profile(users_table):
+    table, calls = users_table
+    results = resolve_many([{"id": "auth-new", "email": "new@example.com"}] * 20)
+    assert results == ["user-1"] * 20
+    assert calls == {"selects": 1, "inserts": 1}
+    assert table == {"auth-new": "user-1"}
+
+
+def test_user_without_profile_or_email_is_remembered(users_table):
+    _, calls = users_table
+    results = resolve_many([{"id": "auth-x"}] * 5)
+    assert all(isinstance(r, HTTPException) and r.status_code == 400 for r in results)
+    resolve_many([{"id": "auth-x"}])
+    assert calls == {"selects": 1, "inserts": 0}
+
+
+def test_cancelled_request_does_not_cancel_the_shared_lookup(users_table):
+    table, calls = users_table
+    table["auth-1"] = "user-1"
+
+    async def run():
+        first = asyncio.ensure_future(auth.resolve_user_id({"id": "auth-1"}))
+        second = asyncio.ensure_future(auth.resolve_user_id({"id": "auth-1"}))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "user-1"
+    assert calls["selects"] == 1
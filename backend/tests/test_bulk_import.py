@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import note as note_routes
+
+
+class StreamedRequest:
+    """Just enough of a Request for _ndjson_lines: a body in given chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def lines(chunks):
+    async def collect():
+        return [line async for line in note_routes._ndjson_lines(StreamedRequest(chunks))]
+    return asyncio.run(collect())
+
+
+@pytest.fixture
+def small_lines(monkeypatch):
+    monkeypatch.setattr(note_routes, "BULK_MAX_LINE_BYTES", 8)
+
+
+def test_lines_split_across_chunks():
+    assert lines([b'{"a"', b':1}\n{"b":2', b'}\n', b'\n{"c":3}']) == [b'{"a":1}', b'{"b":2}', b"", b'{"c":3}']
+    assert lines([b"one\ntwo\n"]) == [b"one", b"two"]
+    assert lines([]) == []
+
+
+def test_oversize_lines_are_reported_once_and_skipped(small_lines):
+    assert lines([b"12345678\n123456789\nok\n"]) == [b"12345678", None, b"ok"]
+    # Spread over chunks, the rest of the line is dropped as it arrives
+    assert lines([b"ok\n1234", b"56789", b"0123", b"45\nnext\n"]) == [b"ok", None, b"next"]
+    assert lines([b"ok\n1234567890"]) == [b"ok", None]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(note_routes.router, prefix="/notes")
+    app.dependency_overrides[get_user_id_from_token] = lambda: "u1"
+
+    saved = []
+
+    async def save_bulk(user_id, notes):
+        saved.append([n["title"] for n in notes])
+        return notes
+
+    monkeypatch.setattr(note_routes, "asave_notes_bulk", save_bulk)
+    monkeypatch.setattr(note_routes, "BULK_CHUNK_SIZE", 2)
+    with TestClient(app) as test_client:
+        test_client.saved = saved
+        yield test_client
+
+
+def test_bulk_import_inserts_in_chunks_and_reports_bad_lines(client, monkeypatch):
+    monkeypatch.setattr(note_routes, "BULK_MAX_LINE_BYTES", 200)
+    body = "\n".join([
+        json.dumps({"title": "a", "content": "x"}),
+        "not json",
+        json.dumps({"title": "b", "content": "x"}),
+        "",
+        json.dumps({"title": "c"}),  # no content
+        json.dumps({"title": "d", "content": "x" * 500}),
+        json.dumps({"title": "e", "content": "x"}),
+    ]).encode()
+    res = client.post("/notes/bulk", content=body)
+    assert res.status_code == 200
+    result = res.json()
+    assert result["inserted"] == 3
+    assert client.saved == [["a", "b"], ["e"]]
+    assert [error["line"] for error in result["errors"]] == [2, 5, 6]
+    assert "exceeds 200 bytes" in result["errors"][2]["error"]
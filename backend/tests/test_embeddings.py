@@ -0,0 +1,198 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import note as note_routes
+from ai_services.core import embeddings
+from ai_services.core.embeddings import HashingEmbedder, LocalVectorStore, PgVectorStore
+
+
+class MemoryStore:
+    """Keeps upserted rows in a dict; stands in for the vector store."""
+
+    def __init__(self):
+        self.rows = {}
+        self.upserts = []
+
+    def hashes(self, note_ids):
+        return {note_id: self.rows[note_id][1] for note_id in note_ids if note_id in self.rows}
+
+    def upsert(self, rows):
+        self.upserts.append([row[0] for row in rows])
+        for note_id, user_id, key, vector in rows:
+            self.rows[note_id] = (user_id, key, vector)
+
+
+@pytest.fixture
+def notes(monkeypatch):
+    """The notes table as seen by embed_notes, keyed by id."""
+    table = {
+        1: {"id": 1, "user_id": "u1", "title": "Groceries", "content": "milk eggs bread"},
+        2: {"id": 2, "user_id": "u1", "title": "Trip", "content": "book train tickets"},
+    }
+    monkeypatch.setattr(embeddings, "_select_notes", lambda ids: [dict(table[i]) for i in ids if i in table])
+    monkeypatch.setattr(embeddings, "embedder", HashingEmbedder(dim=32))
+    monkeypatch.setattr(embeddings, "vector_store", MemoryStore())
+    return table
+
+
+def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    first, second = embedder.embed_documents(["buy milk", "buy milk"])
+    assert first == second == embedder.embed_query("buy milk")
+    assert first != embedder.embed_query("call the plumber")
+    assert sum(v * v for v in first) == pytest.approx(1.0)
+
+
+def test_embed_notes_only_reembeds_changed_text(notes):
+    assert embeddings.embed_notes([1, 2]) == 2
+    assert embeddings.embed_notes([1, 2]) == 0
+
+    notes[1]["title"] = "Groceries for Sunday"
+    assert embeddings.embed_notes([1, 2]) == 1
+    notes[2]["content"] = "book train tickets and hotel"
+    assert embeddings.embed_notes([1, 2]) == 1
+
+    assert embeddings.vector_store.upserts == [[1, 2], [1], [2]]
+
+
+def test_embed_notes_skips_empty_and_missing_notes(notes):
+    notes[3] = {"id": 3, "user_id": "u1", "title": "", "content": ""}
+    assert embeddings.embed_notes([3, 404]) == 0
+    assert embeddings.vector_store.rows == {}
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return type("Response", (), {"data": self.rows})()
+
+
+def test_pgvector_similar_is_none_for_unembedded_note(monkeypatch):
+    calls = []
+
+    class Client:
+        def table(self, name):
+            return FakeQuery([])
+
+        def rpc(self, name, params):
+            calls.append(name)
+            return FakeQuery([])
+
+    monkeypatch.setattr(embeddings, "get_client", lambda: Client())
+    assert PgVectorStore().similar("u1", 7, 5) is None
+    assert calls == []  # no neighbour search without an embedding
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    pytest.importorskip("hnswlib")
+    embedder = HashingEmbedder(dim=32)
+    store = LocalVectorStore(path=str(tmp_path / "notes.hnsw"), dim=32)
+    texts = {
+        1: ("u1", "milk eggs bread"),
+        2: ("u1", "milk and cheese"),
+        3: ("u2", "milk eggs bread"),
+        4: ("u2", "train tickets"),
+    }
+    vectors = embedder.embed_documents([text for _, text in texts.values()])
+    store.upsert([(note_id, user_id, f"h{note_id}", vector) for (note_id, (user_id, _)), vector in zip(texts.items(), vectors)])
+    return store, embedder
+
+
+def test_local_store_search_is_per_user(local_store):
+    store, embedder = local_store
+    query = embedder.embed_query("milk eggs bread")
+    assert {note_id for note_id, _ in store.search("u1", query, 10)} == {1, 2}
+    assert {note_id for note_id, _ in store.search("u2", query, 10)} == {3, 4}
+    assert store.search("u3", query, 10) == []
+    assert store.search("u1", query, 1)[0][0] == 1
+
+
+def test_local_store_similar(local_store):
+    store, _ = local_store
+    assert [note_id for note_id, _ in store.similar("u1", 1, 10)] == [2]
+    # Not embedded yet, or another user's note
+    assert store.similar("u1", 99, 10) is None
+    assert store.similar("u1", 3, 10) is None
+
+
+def test_local_store_delete_and_reload(local_store, tmp_path):
+    store, embedder = local_store
+    store.delete([2])
+    assert store.similar("u1", 2, 10) is None
+    assert store.similar("u1", 1, 10) == []
+    store.save()
+
+    reloaded = LocalVectorStore(path=str(tmp_path / "notes.hnsw"), dim=32)
+    assert reloaded.hashes([1, 2, 3]) == {1: "h1", 3: "h3"}
+    assert {n for n, _ in reloaded.search("u2", embedder.embed_query("train"), 10)} == {3, 4}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(note_routes.router, prefix="/notes")
+    app.dependency_overrides[get_user_id_from_token] = lambda: "u1"
+
+    stored = {1: {"id": 1, "title": "Groceries"}, 2: {"id": 2, "title": "Market"}}
+
+    async def notes_by_id(user_id, note_ids):
+        return {note_id: dict(stored[note_id]) for note_id in note_ids if note_id in stored}
+
+    queued = []
+    monkeypatch.setattr(note_routes, "_notes_by_id", notes_by_id)
+    monkeypatch.setattr(note_routes, "queue_embeddings", lambda user_id, ids: queued.append((user_id, list(ids))))
+    with TestClient(app) as test_client:
+        test_client.queued = queued
+        yield test_client
+
+
+class StaticStore:
+    def __init__(self, neighbours):
+        self.neighbours = neighbours
+
+    def similar(self, user_id, note_id, limit):
+        return self.neighbours.get(note_id)
+
+
+def test_similar_route_pending_until_embedded(client, monkeypatch):
+    monkeypatch.setattr(note_routes, "vector_store", StaticStore({}))
+    res = client.get("/notes/similar/1")
+    assert res.status_code == 200
+    assert res.json() == {"data": [], "pending": True}
+    assert client.queued == [("u1", [1])]
+
+
+def test_similar_route_returns_neighbours(client, monkeypatch):
+    monkeypatch.setattr(note_routes, "vector_store", StaticStore({1: [(2, 0.9), (3, 0.5)]}))
+    res = client.get("/notes/similar/1")
+    # Note 3 is gone (deleted after it was embedded) and is left out
+    assert res.json() == {"data": [{"id": 2, "title": "Market", "similarity": 0.9}], "pending": False}
+    assert client.queued == []
+
+
+def test_similar_route_unknown_note(client, monkeypatch):
+    monkeypatch.setattr(note_routes, "vector_store", StaticStore({}))
+    assert client.get("/notes/similar/404").status_code == 404
+    assert client.queued == []
+
+
+def test_check_embedding_dim(local_store, monkeypatch):
+    store, _ = local_store
+    monkeypatch.setattr(embeddings, "vector_store", store)
+    monkeypatch.setattr(embeddings, "EMBEDDING_DIM", 32)
+    assert embeddings.check_embedding_dim()
+    monkeypatch.setattr(embeddings, "EMBEDDING_DIM", 768)
+    assert not embeddings.check_embedding_dim()
+
+
+def test_embedding_queue_names_its_workers():
+    assert embeddings.embedding_queue.name == "embedding"
+    assert embeddings.embedding_queue.log_tag == "EMBED"
@@ -0,0 +1,192 @@
+from datetime import datetime
+
+import pytest
+
+from ai_services.core import reminder_engine as engine_module
+from ai_services.core.reminder_engine import ReminderEngine, next_fire_time
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2030, 1, day, hour, minute).astimezone().timestamp()
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def range(self, start, end):
+        return FakeQuery(self.rows[start:end + 1])
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return type("Response", (), {"data": self.rows})()
+
+
+class FakeDB:
+    """notification_settings rows plus the lease functions of db/scheduler.sql."""
+
+    def __init__(self, rows, owned=()):
+        self.rows = rows
+        self.owned = list(owned)
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+    def rpc(self, name, params):
+        if name == engine_module.ACQUIRE_PARTITIONS_RPC:
+            return FakeQuery(self.owned)
+        if name == engine_module.ACTIVE_REMINDERS_RPC:
+            partitions = set(params["p_partitions"])
+            return FakeQuery([
+                row for row in self.rows
+                if engine_module.reminder_partition(row["user_id"], params["p_count"]) in partitions
+            ])
+        return FakeQuery([])
+
+
+def reminder(note_id, user_id="u1", notify_type="daily", notify_time="09:00", end_date=None):
+    return {"user_id": user_id, "note_id": note_id, "notify_type": notify_type, "notify_time": notify_time, "end_date": end_date}
+
+
+# -----------------------------
+# Heap
+# -----------------------------
+def test_next_fire_time():
+    assert next_fire_time("hourly", None, at(9, 30)) == at(10)
+    assert next_fire_time("hourly", None, at(10)) == at(11)
+    assert next_fire_time("daily", "09:15", at(8)) == at(9, 15)
+    assert next_fire_time("daily", "09:15", at(9, 15)) == at(9, 15, day=2)
+    assert next_fire_time("daily", None, at(10)) == at(9, day=2)
+
+
+def test_due_reminders_pop_in_one_batch_and_rearm(monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: at(8))
+    engine = ReminderEngine(coordination="none")
+    engine.schedule("u1", 1, "daily", "09:00", None)
+    engine.schedule("u2", 2, "daily", "09:00", None)
+    engine.schedule("u1", 3, "daily", "10:00", None)
+
+    due = engine._pop_due(at(9, 0))
+    assert sorted(r["note_id"] for r in due) == [1, 2]
+    assert {r["fire_at"] for r in due} == {at(9)}
+    assert engine._pop_due(at(9, 30)) == []
+    assert [r["note_id"] for r in engine._pop_due(at(10))] == [3]
+    # Each fired reminder was re-armed for the next day
+    assert sorted(r["note_id"] for r in engine._pop_due(at(10, day=2))) == [1, 2, 3]
+
+
+def test_updates_and_removals_skip_stale_entries(monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: at(8))
+    engine = ReminderEngine(coordination="none")
+    engine.schedule("u1", 1, "daily", "09:00", None)
+    engine.schedule("u1", 1, "daily", "11:00", None)  # replaces the 09:00 entry
+    engine.schedule("u1", 2, "daily", "09:00", None)
+    engine.unschedule(2)
+
+    assert engine._pop_due(at(10)) == []
+    assert [(r["note_id"], r["fire_at"]) for r in engine._pop_due(at(11))] == [(1, at(11))]
+    assert engine.stats()["active"] == 1
+
+
+def test_reminders_stop_at_their_end_date(monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: at(8))
+    engine = ReminderEngine(coordination="none")
+    end = datetime.fromtimestamp(at(12)).astimezone().isoformat()
+    engine.schedule("u1", 1, "daily", "09:00", end)
+    engine.schedule("u1", 2, "daily", "07:00", end)  # next 07:00 is past the end
+
+    assert [r["note_id"] for r in engine._pop_due(at(9))] == [1]
+    assert engine._pop_due(at(9, day=3)) == []
+    assert engine.stats()["active"] == 0
+
+
+def test_load_from_db_builds_the_heap(monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: at(8))
+    rows = [reminder(i, user_id=f"u{i % 5}") for i in range(1, 2501)]  # several pages
+    engine = ReminderEngine(db=FakeDB(rows), coordination="none")
+    engine.load_from_db()
+    assert engine.stats()["active"] == 2500
+    assert len(engine._pop_due(at(9))) == 2500
+
+
+def test_start_survives_an_unreachable_database():
+    class DownDB:
+        def table(self, name):
+            raise ConnectionError("database unreachable")
+
+    engine = ReminderEngine(db=DownDB(), coordination="none")
+    engine.start(lambda due: None)
+    try:
+        assert engine.stats()["active"] == 0
+        assert engine._synced_at is None  # the sync loop does the full load later
+    finally:
+        engine.stop()
+
+
+# -----------------------------
+# Partitioning
+# -----------------------------
+def test_reminder_partition_is_stable_and_spread():
+    partitions = [engine_module.reminder_partition(f"user-{i}", 64) for i in range(6400)]
+    assert partitions == [engine_module.reminder_partition(f"user-{i}", 64) for i in range(6400)]
+    counts = [partitions.count(p) for p in range(64)]
+    assert min(counts) > 50 and max(counts) < 150
+
+
+def users_by_partition(partitions, count=64):
+    """One user id per wanted partition."""
+    found = {}
+    i = 0
+    while len(found) < len(partitions):
+        user_id = f"user-{i}"
+        partition = engine_module.reminder_partition(user_id, count)
+        if partition in partitions and partition not in found:
+            found[partition] = user_id
+        i += 1
+    return found
+
+
+@pytest.fixture
+def leased(monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: at(8))
+    users = users_by_partition({0, 1, 2, 3})
+    rows = [reminder(p + 1, user_id=user_id) for p, user_id in users.items()]
+    db = FakeDB(rows, owned=[0, 1])
+    engine = ReminderEngine(db=db, coordination="lease", partitions=64)
+    engine._renew_leases()
+    engine.load_from_db()
+    return engine, db, users
+
+
+def test_lease_worker_schedules_only_owned_partitions(leased):
+    engine, _, users = leased
+    assert sorted(r["note_id"] for r in engine._pop_due(at(9))) == [1, 2]
+    engine.schedule(users[2], 10, "daily", "09:00", None)  # owned by another worker
+    engine.schedule(users[0], 11, "daily", "09:00", None)
+    assert [r["note_id"] for r in engine._pop_due(at(9))] == [11]
+
+
+def test_partition_handover_moves_reminders(leased):
+    engine, db, _ = leased
+    db.owned = [1, 2]
+    engine._renew_leases()
+    assert sorted(r["note_id"] for r in engine._pop_due(at(9))) == [2, 3]
+    assert engine.stats()["partitions_owned"] == 2
+
+
+def test_reminders_are_held_once_the_lease_expires(leased, monkeypatch):
+    engine, db, _ = leased
+
+    def unreachable(name, params):
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(db, "rpc", unreachable)
+    engine._renew_leases()  # lease still valid: keep the partitions
+    assert engine.stats()["partitions_owned"] == 2
+    monkeypatch.setattr(engine_module, "REMINDER_LEASE_SECONDS", 0)
+    assert engine._lease_expired()
+    engine._renew_leases()  # others may own them now
+    assert engine.stats()["partitions_owned"] == 0
+    assert engine._pop_due(at(9)) == []
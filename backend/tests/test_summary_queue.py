@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+from ai_services.core.summary_queue import SummaryQueue
+
+
+class Recorder:
+    """Handler that records jobs; the first one blocks until released."""
+
+    def __init__(self):
+        self.jobs = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, note_id, content):
+        self.jobs.append((note_id, content))
+        self.started.set()
+        assert self.release.wait(5)
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def make_queue(handler, **kwargs):
+    return SummaryQueue(handler=handler, workers=1, **kwargs)
+
+
+def test_users_are_served_round_robin(recorder):
+    queue = make_queue(recorder)
+    queue.submit("u1", 1, "a")
+    assert recorder.started.wait(5)  # the worker holds note 1
+    for note_id in (2, 3, 4, 5):
+        queue.submit("u1", note_id, "a")
+    for note_id in (6, 7):
+        queue.submit("u2", note_id, "b")
+    recorder.release.set()
+    queue.stop(drain=True, timeout=5)
+    assert [note_id for note_id, _ in recorder.jobs] == [1, 2, 6, 3, 7, 4, 5]
+
+
+def test_resubmitting_a_pending_note_replaces_its_content(recorder):
+    queue = make_queue(recorder)
+    queue.submit("u1", 1, "first")
+    assert recorder.started.wait(5)
+    queue.submit("u1", 2, "old")
+    queue.submit("u1", 2, "new")
+    recorder.release.set()
+    queue.stop(drain=True, timeout=5)
+    assert recorder.jobs == [(1, "first"), (2, "new")]
+    assert queue.stats()["coalesced"] == 1
+    assert queue.stats()["processed"] == 2
+
+
+def test_backlog_is_capped_per_user_and_globally(recorder):
+    queue = make_queue(recorder, max_size=3, max_per_user=2)
+    queue.submit("u1", 1, "a")
+    assert recorder.started.wait(5)
+    assert queue.submit("u1", 2, "a")
+    assert queue.submit("u1", 3, "a")
+    assert not queue.submit("u1", 4, "a")  # u1 has 2 waiting
+    assert queue.submit("u2", 5, "b")
+    assert not queue.submit("u3", 6, "c")  # 3 waiting in total
+    assert queue.stats()["rejected"] == 2
+    recorder.release.set()
+    queue.stop(drain=True, timeout=5)
+    assert [note_id for note_id, _ in recorder.jobs] == [1, 2, 5, 3]
+
+
+def test_submit_waits_for_room_with_a_timeout(recorder):
+    queue = make_queue(recorder, max_size=1)
+    queue.submit("u1", 1, "a")
+    assert recorder.started.wait(5)
+    queue.submit("u1", 2, "a")
+    threading.Timer(0.1, recorder.release.set).start()
+    assert queue.submit("u2", 3, "b", timeout=5)
+    queue.stop(drain=True, timeout=5)
+    assert [note_id for note_id, _ in recorder.jobs] == [1, 2, 3]
+
+
+def test_stop_drains_the_backlog(recorder):
+    recorder.release.set()
+    queue = make_queue(recorder)
+    for note_id in range(1, 21):
+        queue.submit(f"u{note_id % 3}", note_id, "a")
+    queue.stop(drain=True, timeout=5)
+    assert sorted(note_id for note_id, _ in recorder.jobs) == list(range(1, 21))
+    assert queue.stats()["depth"] == 0
+    assert not queue.submit("u1", 99, "a")  # no longer accepting
+
+
+def test_stop_without_drain_drops_the_backlog(recorder):
+    queue = make_queue(recorder)
+    queue.submit("u1", 1, "a")
+    assert recorder.started.wait(5)
+    queue.submit("u1", 2, "a")
+    queue.submit("u2", 3, "a")
+    stopper = threading.Thread(target=queue.stop, kwargs={"drain": False, "timeout": 5})
+    stopper.start()
+    recorder.release.set()
+    stopper.join(5)
+    assert recorder.jobs == [(1, "a")]
+
+
+def test_cancel_removes_a_pending_job(recorder):
+    queue = make_queue(recorder)
+    queue.submit("u1", 1, "a")
+    assert recorder.started.wait(5)
+    queue.submit("u1", 2, "a")
+    assert queue.is_running(1)
+    assert queue.cancel(2)
+    assert not queue.cancel(2)
+    recorder.release.set()
+    queue.stop(drain=True, timeout=5)
+    assert recorder.jobs == [(1, "a")]
+
+
+def test_jobs_are_batched_within_the_window():
+    batches = []
+    queue = SummaryQueue(
+        handler=lambda note_id, content: batches.append([note_id]),
+        batch_handler=lambda jobs: batches.append([note_id for note_id, _ in jobs]),
+        workers=1,
+        batch_size=3,
+        batch_window=0.5,
+    )
+    for note_id in range(1, 6):
+        queue.submit("u1", note_id, "a")
+    queue.stop(drain=True, timeout=5)
+    assert sorted(sum(batches, [])) == [1, 2, 3, 4, 5]
+    assert max(len(batch) for batch in batches) == 3
+
+
+def test_failed_jobs_are_counted_and_do_not_stop_the_worker():
+    def handler(note_id, content):
+        if note_id == 1:
+            raise RuntimeError("LLM down")
+
+    queue = SummaryQueue(handler=handler, workers=1)
+    queue.submit("u1", 1, "a")
+    queue.submit("u1", 2, "a")
+    queue.stop(drain=True, timeout=5)
+    stats = queue.stats()
+    assert (stats["failed"], stats["processed"]) == (1, 1)
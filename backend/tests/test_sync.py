@@ -0,0 +1,207 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ai_services.api.auth import get_user_id_from_token
+from ai_services.api.routes import note as note_routes
+from ai_services.core import note_saver
+
+
+class FakeSyncDB:
+    """sync_notes over an in-memory change log of (xid, id, deleted) rows."""
+
+    def __init__(self):
+        self.rows = []
+        self.xmin = 1
+        self.reset = False
+        self.calls = []
+
+    def change(self, xid, note_id, deleted=False):
+        self.rows.append({"xid": str(xid), "id": note_id, "deleted": deleted, "note": None if deleted else {"id": note_id, "xid": xid}})
+
+    def rpc(self, name, params):
+        assert name == note_routes.SYNC_NOTES_RPC
+        self.calls.append(params)
+        since = None if self.reset else params["p_since"]
+        after = (int(params["p_after_xid"]), params["p_after_id"]) if params["p_after_xid"] else None
+        rows = sorted(self.rows, key=lambda r: (int(r["xid"]), r["id"]))
+        rows = [
+            r for r in rows
+            if (since is not None or not r["deleted"])
+            and (since is None or int(r["xid"]) >= int(since))
+            and (after is None or (int(r["xid"]), r["id"]) > after)
+        ]
+        data = {"xmin": str(self.xmin), "reset": self.reset and params["p_since"] is not None, "rows": rows[:params["p_limit"]]}
+
+        class Call:
+            async def execute(self):
+                return type("Response", (), {"data": data})()
+
+        return Call()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSyncDB()
+    monkeypatch.setattr(note_routes, "get_async_client", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(note_routes.router, prefix="/notes")
+    app.dependency_overrides[get_user_id_from_token] = lambda: "u1"
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def pull(client, cursor=None, limit=2):
+    params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+    res = client.get("/notes/sync", params=params)
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+# -----------------------------
+# Pull
+# -----------------------------
+def test_pull_pages_through_a_run_and_resumes_from_its_floor(client, db):
+    for xid, note_id in [(3, 1), (4, 2), (4, 3), (6, 4), (7, 5)]:
+        db.change(xid, note_id)
+    db.xmin = 8
+
+    first = pull(client)
+    assert [n["id"] for n in first["changes"]] == [1, 2] and first["has_more"]
+    db.xmin = 20  # later pages of the run see a newer snapshot
+    second = pull(client, first["cursor"])
+    third = pull(client, second["cursor"])
+    assert [n["id"] for n in second["changes"] + third["changes"]] == [3, 4, 5]
+    assert not third["has_more"]
+
+    # The next run starts at the first page's xmin, so a write that was still
+    # in flight during the run (xid at or above that xmin) is picked up
+    db.change(8, 6)
+    db.change(9, 1)
+    db.change(9, 2, deleted=True)
+    fourth = pull(client, third["cursor"], limit=10)
+    assert db.calls[-1]["p_since"] == "8"
+    assert [n["id"] for n in fourth["changes"]] == [6, 1]
+    assert fourth["deleted"] == [2]
+
+
+def test_first_pull_leaves_out_tombstones(client, db):
+    db.change(3, 1)
+    db.change(4, 2, deleted=True)
+    result = pull(client, limit=10)
+    assert [n["id"] for n in result["changes"]] == [1] and result["deleted"] == []
+
+
+def test_outdated_cursor_gets_a_full_pull(client, db):
+    db.change(3, 1)
+    db.xmin = 5
+    cursor = pull(client)["cursor"]
+    db.reset = True
+    db.change(6, 2)
+    result = pull(client, cursor, limit=10)
+    assert result["reset"]
+    assert [n["id"] for n in result["changes"]] == [1, 2]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    note_routes._encode_sync_cursor("1; drop table notes"),
+    note_routes._encode_sync_cursor("5", "6", ["x", 1]),
+])
+def test_invalid_cursor(client, db, cursor):
+    assert client.get("/notes/sync", params={"cursor": cursor}).status_code == 400
+    assert db.calls == []
+
+
+# -----------------------------
+# Push
+# -----------------------------
+@pytest.fixture
+def applied(monkeypatch):
+    """Replies to pushed mutations with canned results; records unscheduled reminders."""
+    state = {"results": [], "mutations": None, "unscheduled": []}
+
+    async def apply(user_id, mutations):
+        state["mutations"] = mutations
+        return state["results"]
+
+    monkeypatch.setattr(note_routes, "aapply_note_mutations", apply)
+    monkeypatch.setattr(note_routes.reminder_engine, "unschedule", state["unscheduled"].append)
+    return state
+
+
+def test_push_counts_outcomes_and_unschedules_deleted_notes(client, applied):
+    applied["results"] = [
+        {"client_id": "c1", "id": 10, "status": "applied"},
+        {"id": 11, "status": "conflict", "note": {"id": 11, "version": 4}},
+        {"id": 12, "status": "applied"},
+        {"id": 13, "status": "deleted"},
+    ]
+    res = client.post("/notes/sync", json={"mutations": [
+        {"client_id": "c1", "content": "new"},
+        {"id": 11, "base_version": 2, "content": "edit"},
+        {"op": "delete", "id": 12},
+        {"id": 13, "content": "edit of a deleted note"},
+    ]})
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["applied"], body["conflicts"]) == (2, 1)
+    assert body["results"][1]["note"] == {"id": 11, "version": 4}
+    assert applied["unscheduled"] == [12]
+
+
+def test_push_validates_mutations(client, applied, monkeypatch):
+    assert client.post("/notes/sync", json={"mutations": [{"id": 1}]}).status_code == 422
+    assert client.post("/notes/sync", json={"mutations": [{"op": "move", "id": 1}]}).status_code == 422
+    monkeypatch.setattr(note_routes, "MAX_SYNC_MUTATIONS", 2)
+    too_many = {"mutations": [{"op": "delete", "id": i} for i in range(3)]}
+    assert client.post("/notes/sync", json=too_many).status_code == 413
+    assert applied["mutations"] is None
+
+
+def test_mutation_params_carry_summary_fields(monkeypatch):
+    monkeypatch.setattr(note_saver, "_cached_summary", lambda content: (f"hash:{content}", "cached" if content == "known" else None))
+    edited = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    create, update, delete = note_saver._mutation_params([
+        {"op": "upsert", "client_id": "c1", "title": "", "content": "known"},
+        {"op": "upsert", "id": 5, "base_version": 3, "updated_at": edited, "title": "t", "content": "other"},
+        {"op": "delete", "id": 6, "content": "ignored"},
+    ])
+    assert (create["title"], create["summary"], create["placeholder"]) == ("Untitled Note", "cached", note_saver.SUMMARY_PENDING)
+    assert (update["summary"], update["placeholder"]) == (None, note_saver.SUMMARY_UPDATING)
+    assert update["content_hash"] == "hash:other"
+    assert update["updated_at"] == "2030-01-01T00:00:00+00:00"
+    assert delete == {"op": "delete", "id": 6, "client_id": None, "base_version": None, "updated_at": None}
+
+
+def test_only_applied_mutations_touch_caches_and_summaries(monkeypatch):
+    embedded, removed = [], []
+    monkeypatch.setattr(note_saver, "queue_embeddings", lambda user_id, ids: embedded.extend(ids))
+    monkeypatch.setattr(note_saver.vector_store, "delete", removed.extend)
+    invalidations = note_saver.note_response_cache.invalidations
+
+    stale = note_saver._applied_mutations("u1", [
+        {"op": "upsert", "id": 1},
+        {"op": "upsert", "id": 2},
+        {"op": "upsert"},
+        {"op": "delete", "id": 4},
+    ], [
+        {"id": 1, "status": "conflict", "note": {"id": 1, "content": "server"}},
+        {"id": 2, "status": "applied", "note": {"id": 2, "content": "same"}, "summary_stale": False},
+        {"id": 3, "status": "applied", "note": {"id": 3, "content": "fresh"}, "summary_stale": True},
+        {"id": 4, "status": "applied"},
+    ])
+    assert stale == [(3, "fresh")]
+    assert embedded == [2, 3]
+    assert removed == [4]
+    assert note_saver.note_response_cache.invalidations == invalidations + 1
+
+    assert note_saver._applied_mutations("u1", [{"op": "upsert", "id": 1}], [{"id": 1, "status": "conflict"}]) == []
+    assert note_saver.note_response_cache.invalidations == invalidations + 1